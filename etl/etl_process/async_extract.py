@@ -0,0 +1,321 @@
+import asyncio
+import logging
+import uuid
+from functools import partial
+from typing import AsyncIterator, Awaitable, Callable, Iterable, Optional, Union
+
+import psycopg
+from psycopg.rows import dict_row
+from state.lease import ensure_lease
+
+from .async_loader import AsyncElasticsearchLoader
+from .backoff import backoff
+from .checkpoints import EntityCheckpoint, RowKey, row_key
+from .extract_data import (FILM_WORK, FILMS_AGGREGATED_QUERY, FILMS_INFO_QUERY, GENRES_QUERY, LINK_KEYS, MOVIES_SOURCES,
+                           PERSON, PERSONS_AGGREGATED_QUERY, PERSONS_INFO_QUERY, TOMBSTONE, TOMBSTONES_QUERY,
+                           changed_films_query, deletion_changes, existing_query, split_tombstones)
+from .pipeline import Checkpoint
+from .settings import EtlSettings
+from .transform_data import DataTransform
+
+# Маркер конца потока данных между извлечением и загрузкой.
+_STOP = object()
+
+
+async def run_pipeline(name: str, chunks: AsyncIterator, transform, flush, load: Callable[..., Awaitable],
+                       queue_size: int = 4) -> None:
+    """
+    Асинхронный конвейер extract+transform → load в одном цикле событий.
+
+    Извлечение и преобразование порции идут, пока предыдущая порция загружается
+    в Elasticsearch; очередь ограничена queue_size (backpressure). Маркеры Checkpoint
+    проходят в том же порядке, их commit вызывается после загрузки всех документов до
+    маркера. Ошибка любой из задач отменяет другую и пробрасывается наружу.
+    """
+    queue = asyncio.Queue(maxsize=queue_size)
+    logger = logging.getLogger('main')
+
+    async def produce() -> None:
+        async for chunk in chunks:
+            if isinstance(chunk, Checkpoint):
+                documents = flush() if flush is not None else None
+                if documents:
+                    await queue.put(documents)
+                await queue.put(chunk)
+                continue
+
+            documents = transform(chunk)
+            if documents:
+                await queue.put(documents)
+
+        documents = flush() if flush is not None else None
+        if documents:
+            await queue.put(documents)
+        await queue.put(_STOP)
+
+    async def consume() -> None:
+        loaded = 0
+        while (item := await queue.get()) is not _STOP:
+            if isinstance(item, Checkpoint):
+                item.commit()
+                continue
+
+            await load(item)
+            loaded += len(item)
+
+        logger.info(f'[{name}] {loaded} documents loaded')
+
+    try:
+        async with asyncio.TaskGroup() as group:
+            group.create_task(produce(), name=f'{name}-extract')
+            group.create_task(consume(), name=f'{name}-load')
+    except ExceptionGroup as err:
+        logger.error(f'[{name}] pipeline failed')
+        raise err.exceptions[0]
+
+
+class AsyncPostgresExtractor:
+    """
+    Асинхронная инкрементальная загрузка фильмов, персон и жанров (ETL_RUNTIME=async).
+
+    Логика та же, что у PostgresExtractor.sync_movies, sync_persons, sync_genres и sync_deletions: keyset-пагинация
+    по (modified, id) и контрольные точки в общем состоянии. Каждому пайплайну нужен
+    свой экземпляр: запросы одного соединения psycopg выполняются по очереди.
+    """
+    def __init__(self, es_loader: AsyncElasticsearchLoader, data_transformer: DataTransform, state, dsn: dict):
+        self.load_data = es_loader
+        self.data_transformer = data_transformer
+        self.state = state
+        self.dsn = dsn
+        self.conn: Optional[psycopg.AsyncConnection] = None
+        self.logger = logging.getLogger('postgres')
+
+        etl_settings = EtlSettings()
+        self.batch_size = etl_settings.batch_size
+        self.queue_size = etl_settings.pipeline_queue_size
+        self.aggregate_in_db = etl_settings.aggregate_in_db
+        self.extract_mode = etl_settings.extract_mode
+
+    @backoff(exception_types=(psycopg.OperationalError,))
+    async def make_db_connection(self) -> psycopg.AsyncConnection:
+        self.logger.info('Подключение к Postgres...')
+        connection = await psycopg.AsyncConnection.connect(**self.dsn, row_factory=dict_row)
+        self.logger.info('Соединение с Postgres установлено')
+        return connection
+
+    async def set_connection(self) -> None:
+        self.conn = await self.make_db_connection()
+
+    async def close(self) -> None:
+        if self.conn is not None:
+            await self.conn.close()
+
+    @property
+    def films_info_query(self) -> str:
+        return FILMS_AGGREGATED_QUERY if self.aggregate_in_db else FILMS_INFO_QUERY
+
+    @property
+    def persons_info_query(self) -> str:
+        return PERSONS_AGGREGATED_QUERY if self.aggregate_in_db else PERSONS_INFO_QUERY
+
+    def movies_checkpoint(self, default_watermark: Optional[str] = None) -> EntityCheckpoint:
+        return EntityCheckpoint(self.state, 'movies', default_watermark)
+
+    def persons_checkpoint(self, default_watermark: Optional[str] = None) -> EntityCheckpoint:
+        return EntityCheckpoint(self.state, 'persons', default_watermark)
+
+    async def sync_movies(self, default_watermark: Optional[str] = None) -> None:
+        """Инкрементальная загрузка фильмов с контрольными точками, см. PostgresExtractor.sync_movies."""
+        checkpoint = self.movies_checkpoint(default_watermark)
+
+        if checkpoint.cycle is None:
+            checkpoint.open_cycle(await self.get_upper_bounds(MOVIES_SOURCES))
+        else:
+            self.logger.info(f'Resuming films sync after {checkpoint.cycle["loaded"]}')
+
+        watermarks = {table_name: checkpoint.watermark(table_name) for table_name in MOVIES_SOURCES}
+        loaded = checkpoint.cycle['loaded']
+        batches = self.iter_changed_films_id(
+            watermarks, checkpoint.cycle['upto'], uuid.UUID(loaded) if loaded is not None else uuid.UUID(int=0)
+        )
+        await self.load_movies(self.iter_info_batches(self.films_info_query, 'fw.id', batches,
+                                                      checkpoint.mark_loaded))
+
+        checkpoint.close_cycle()
+        await self.conn.rollback()
+
+    async def sync_persons(self, default_watermark: Optional[str] = None) -> None:
+        """Инкрементальная загрузка персон с контрольными точками, см. PostgresExtractor.sync_persons."""
+        checkpoint = self.persons_checkpoint(default_watermark)
+
+        if checkpoint.cycle is not None:
+            checkpoint.drop_cycle()
+
+        async def batches() -> AsyncIterator[Union[list[dict], Checkpoint]]:
+            async for rows in self.iter_modified_rows(PERSON, checkpoint.watermark(PERSON)):
+                async for chunk in self.iter_info(self.persons_info_query, 'p.id', [row['id'] for row in rows]):
+                    yield chunk
+                yield Checkpoint(partial(checkpoint.advance, PERSON, row_key(rows[-1])))
+
+        await self.load_persons(batches())
+        await self.conn.rollback()
+
+    async def sync_genres(self) -> None:
+        """Индекс жанров целиком, с числом фильмов, см. PostgresExtractor.sync_genres."""
+        cursor = await self.conn.execute(GENRES_QUERY)
+        rows = await cursor.fetchall()
+        await self.conn.rollback()
+
+        documents = self.data_transformer.transform_genres(rows)
+        if documents:
+            await self.load_data.index_genres(documents)
+        await self.load_data.delete_missing(self.load_data.genres_index_name, [str(row['id']) for row in rows])
+
+    async def sync_deletions(self) -> None:
+        """Перенос удалений по надгробиям etl_tombstone, см. PostgresExtractor.sync_deletions."""
+        while True:
+            cursor = await self.conn.execute(TOMBSTONES_QUERY, (self.batch_size,))
+            rows = await cursor.fetchall()
+
+            if not rows:
+                await self.conn.rollback()
+                break
+
+            self.logger.info(f'Fetched {len(rows)} rows from "{TOMBSTONE}"')
+            deleted = split_tombstones(rows)
+            deleted = {table_name: await self.filter_deleted(table_name, keys) for table_name, keys in deleted.items()}
+
+            if deleted[FILM_WORK]:
+                await self.load_data.delete_documents(self.load_data.index_name, sorted(map(str, deleted[FILM_WORK])))
+            if deleted[PERSON]:
+                await self.load_data.delete_documents(
+                    self.load_data.persons_index_name, sorted(map(str, deleted[PERSON]))
+                )
+
+            movie_links, person_films = deletion_changes(deleted)
+            if movie_links:
+                await self.load_data.remove_movie_links(movie_links)
+            if person_films:
+                await self.load_data.remove_person_films(person_films)
+
+            ensure_lease()
+            await self.conn.execute(
+                f'DELETE FROM content.{TOMBSTONE} WHERE id = ANY(%s);', ([row['id'] for row in rows],)
+            )
+            await self.conn.commit()
+
+            if len(rows) < self.batch_size:
+                break
+
+    async def filter_deleted(self, table_name, keys: list) -> set:
+        """Оставить ключи строк, которых в таблице действительно нет."""
+        if not keys:
+            return set()
+
+        params = (list(keys),) if table_name not in LINK_KEYS else tuple(map(list, zip(*keys)))
+        cursor = await self.conn.execute(existing_query(table_name), params)
+        existing = {tuple(row.values()) if table_name in LINK_KEYS else row['id'] for row in await cursor.fetchall()}
+
+        return set(keys) - existing
+
+    async def load_movies(self, chunks: AsyncIterator) -> None:
+        if self.aggregate_in_db:
+            await run_pipeline('movies', chunks, self.data_transformer.transform_aggregated_movies, None,
+                               self.load_data.index_documents, self.queue_size)
+            return
+
+        accumulator = self.data_transformer.movies_accumulator()
+        await run_pipeline('movies', chunks, accumulator.feed, accumulator.flush,
+                           self.load_data.index_documents, self.queue_size)
+
+    async def load_persons(self, chunks: AsyncIterator) -> None:
+        if self.aggregate_in_db:
+            await run_pipeline('persons', chunks, self.data_transformer.transform_aggregated_persons, None,
+                               self.load_data.index_persons, self.queue_size)
+            return
+
+        accumulator = self.data_transformer.persons_accumulator()
+        await run_pipeline('persons', chunks, accumulator.feed, accumulator.flush,
+                           self.load_data.index_persons, self.queue_size)
+
+    async def get_upper_bounds(self, tables: Iterable[str]) -> dict[str, Optional[RowKey]]:
+        return {table_name: await self.get_upper_bound(table_name) for table_name in tables}
+
+    async def get_upper_bound(self, table_name) -> Optional[RowKey]:
+        """Последний по (modified, id) ключ таблицы или None, если таблица пуста."""
+        query = f"""
+                SELECT id, modified
+                FROM content.{table_name}
+                WHERE modified IS NOT NULL
+                ORDER BY modified DESC, id DESC
+                LIMIT 1;
+                """
+        cursor = await self.conn.execute(query)
+        row = await cursor.fetchone()
+        return row_key(row) if row else None
+
+    async def iter_changed_films_id(self, watermarks: dict, upto: dict, after: uuid.UUID) -> AsyncIterator[list]:
+        """Отдаёт id изменённых фильмов порциями через серверный курсор, см. changed_films_query."""
+        query, params = changed_films_query(watermarks, upto, MOVIES_SOURCES, after)
+        total = 0
+
+        if query is not None:
+            async with self.conn.cursor(name='changed_films_ids') as cursor:
+                await cursor.execute(query, params)
+
+                while chunk := await cursor.fetchmany(self.batch_size):
+                    total += len(chunk)
+                    yield [row['id'] for row in chunk]
+
+        self.logger.info(f'Changed films: {total} distinct' if total else 'There are no modifications.')
+
+    async def iter_modified_rows(self, table_name, after: tuple,
+                                 upto: Optional[tuple] = None) -> AsyncIterator[list[dict]]:
+        """Отдаёт (id, modified) записей с ключом (modified, id) в интервале (after, upto] порциями."""
+        upper_condition = 'AND (modified, id) <= (%s, %s)' if upto is not None else ''
+        query = f"""
+                SELECT id, modified
+                FROM content.{table_name}
+                WHERE (modified, id) > (%s, %s) {upper_condition}
+                ORDER BY modified, id
+                LIMIT %s;
+                """
+        last_modified, last_id = after
+        upper_params = tuple(upto) if upto is not None else ()
+
+        while True:
+            cursor = await self.conn.execute(query, (last_modified, last_id, *upper_params, self.batch_size))
+            changed_rows = await cursor.fetchall()
+
+            if not changed_rows:
+                break
+
+            self.logger.info(f'Fetched {len(changed_rows)} modified rows from "{table_name}"')
+            yield changed_rows
+
+            if len(changed_rows) < self.batch_size:
+                break
+
+            last_modified, last_id = changed_rows[-1]['modified'], changed_rows[-1]['id']
+
+    async def iter_info(self, query: str, id_column: str, ids: list) -> AsyncIterator[list[dict]]:
+        """
+        Строки документов с id из ids порциями по batch_size: в режиме stream через серверный
+        курсор, в режиме batch результат целиком передаётся клиенту.
+        """
+        name = 'documents_info' if self.extract_mode == 'stream' else ''
+        async with self.conn.cursor(name=name) as cursor:
+            await cursor.execute(query.format(condition=f'{id_column} = ANY(%s)'), (ids,))
+
+            while chunk := await cursor.fetchmany(self.batch_size):
+                yield chunk
+
+    async def iter_info_batches(
+            self, query: str, id_column: str, ids_batches: AsyncIterator[list], on_batch_loaded=None
+    ) -> AsyncIterator[Union[list[dict], Checkpoint]]:
+        async for ids in ids_batches:
+            async for chunk in self.iter_info(query, id_column, ids):
+                yield chunk
+
+            if on_batch_loaded is not None:
+                yield Checkpoint(partial(on_batch_loaded, ids[-1]))
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import random
+from typing import Iterable, Optional
+
+import elastic_transport
+import elasticsearch
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_scan
+
+from .backoff import backoff
+from .bulk import RETRY_STATUSES, BulkLoadError, is_success
+from .documents import bulk_header, delete_header, encode_document
+from .es_loader import (GENRES_INDEX, INDEX_SCHEMAS, MOVIES_INDEX, PERSONS_INDEX, REMOVE_MOVIE_LINKS_SCRIPT,
+                        REMOVE_PERSON_FILMS_SCRIPT)
+from .invalidation import create_async_publisher
+from .settings import ElasticsearchSettings
+
+
+class AsyncElasticsearchLoader:
+    """
+    Асинхронная загрузка документов в Elasticsearch (ETL_RUNTIME=async).
+
+    Документы (модели или словари) сериализуются в строки bulk NDJSON и отправляются
+    через AsyncElasticsearch; пока один bulk-запрос ждёт ответа, остальные пайплайны
+    продолжают работу в том же цикле событий. Индексы и алиасы создаёт
+    ElasticsearchLoader при старте ETL. С ETL_PUBLISH_INVALIDATIONS id изменённых
+    документов публикуются для инвалидации кешей API.
+    """
+    def __init__(self, hash_store=None, max_retries: int = 5):
+        self.hash_store = hash_store
+        self.max_retries = max_retries
+        self.host = None
+        self.port = None
+        self.connection: Optional[AsyncElasticsearch] = None
+        self.publisher = create_async_publisher()
+        self.index_name = MOVIES_INDEX
+        self.persons_index_name = PERSONS_INDEX
+        self.genres_index_name = GENRES_INDEX
+        self.write_targets = {alias: alias for alias in INDEX_SCHEMAS}
+        self.logger = logging.getLogger('es')
+
+        self.init_env()
+
+    def init_env(self):
+        settings = ElasticsearchSettings()
+
+        self.host = settings.elastic_host
+        self.port = settings.elastic_port
+
+    @backoff(exception_types=(elastic_transport.ConnectionError,))
+    async def make_es_connection(self) -> Optional[AsyncElasticsearch]:
+        self.logger.info('Подключение к Elasticsearch...')
+        connection = AsyncElasticsearch(f'http://{self.host}:{self.port}')
+
+        if not await connection.ping():
+            await connection.close()
+            return None
+
+        self.logger.info('Соединение с Elasticsearch установлено')
+        return connection
+
+    async def set_connection(self) -> None:
+        self.connection = await self.make_es_connection()
+
+    async def close(self) -> None:
+        if self.connection is not None:
+            await self.connection.close()
+        if self.publisher is not None:
+            await self.publisher.close()
+
+    async def matching_ids(self, alias: str, query: dict) -> list[str]:
+        """id документов, подходящих под запрос, без их содержимого."""
+        hits = async_scan(self.connection, index=self.write_targets[alias], query={'query': query, '_source': False})
+        return [hit['_id'] async for hit in hits]
+
+    async def publish_changes(self, alias: str, ids: Optional[list[str]]) -> None:
+        if ids and self.publisher is not None:
+            await self.publisher.publish(alias, ids)
+
+    async def index_documents(self, index_documents: Iterable):
+        return await self.bulk_index_bodies(self.index_name, [encode_document(doc) for doc in index_documents])
+
+    async def index_persons(self, index_documents: Iterable):
+        return await self.bulk_index_bodies(
+            self.persons_index_name, [encode_document(doc) for doc in index_documents]
+        )
+
+    async def index_genres(self, index_documents: Iterable):
+        return await self.bulk_index_bodies(
+            self.genres_index_name, [encode_document(doc) for doc in index_documents]
+        )
+
+    async def delete_documents(self, alias: str, ids: list[str]):
+        """Удалить документы bulk-операциями delete, см. ElasticsearchLoader.delete_documents."""
+        target = self.write_targets[alias]
+        self.logger.info(f'Deleting {len(ids)} documents from {target}...')
+        result = await self.send_bulk([(delete_header(target, document_id),) for document_id in ids])
+
+        if self.hash_store is not None:
+            self.hash_store.forget(alias, ids)
+        await self.publish_changes(alias, ids)
+        return result
+
+    async def remove_movie_links(self, links: dict[str, dict]) -> int:
+        """Убрать удалённые связи из фильмов, см. ElasticsearchLoader.remove_movie_links."""
+        script = {'source': REMOVE_MOVIE_LINKS_SCRIPT, 'params': {'links': links}}
+        updated = await self.update_by_query(self.index_name, {'ids': {'values': list(links)}}, script)
+        if self.hash_store is not None:
+            self.hash_store.forget(self.index_name, links)
+        return updated
+
+    async def remove_person_films(self, links: dict[str, dict]) -> int:
+        """Убрать роли в удалённых связях из фильмов персон, см. ElasticsearchLoader.remove_person_films."""
+        script = {'source': REMOVE_PERSON_FILMS_SCRIPT, 'params': {'links': links}}
+        updated = await self.update_by_query(self.persons_index_name, {'ids': {'values': list(links)}}, script)
+        if self.hash_store is not None:
+            self.hash_store.forget(self.persons_index_name, links)
+        return updated
+
+    async def update_by_query(self, alias: str, query: dict, script: dict) -> int:
+        """Обновить документы скриптом; конфликт версий прерывает запрос с ошибкой."""
+        target = self.write_targets[alias]
+        ids = await self.matching_ids(alias, query) if self.publisher is not None else None
+        response = await self.connection.update_by_query(
+            index=target, query=query, script=script, slices='auto', wait_for_completion=True
+        )
+
+        self.logger.info(f'{target}: {response["updated"]} documents patched in place')
+        await self.publish_changes(alias, ids)
+        return response['updated']
+
+    async def delete_missing(self, alias: str, ids: list[str]) -> int:
+        """Удалить из индекса документы, id которых нет в ids, см. ElasticsearchLoader.delete_missing."""
+        query = {'bool': {'must_not': {'ids': {'values': ids}}}}
+
+        try:
+            missing = await self.matching_ids(alias, query) if self.publisher is not None else None
+            response = await self.connection.delete_by_query(
+                index=self.write_targets[alias], query=query, refresh=True
+            )
+        except elasticsearch.ApiError as err:
+            self.logger.exception(err)
+            return 0
+
+        if response['deleted']:
+            self.logger.info(f'{alias}: {response["deleted"]} missing documents deleted')
+            await self.publish_changes(alias, missing)
+        return response['deleted']
+
+    async def bulk_index_bodies(self, alias: str, bodies: list[tuple[str, bytes]]):
+        """Загрузка уже сериализованных документов: пары (id, тело документа в JSON)."""
+        target = self.write_targets[alias]
+        pending_hashes = None
+
+        if self.hash_store is not None:
+            bodies, pending_hashes = self.hash_store.filter_changed_encoded(alias, bodies, target == alias)
+
+            if not bodies:
+                return 0, []
+
+        items = [(bulk_header(target, document_id), body) for document_id, body in bodies]
+        self.logger.info(f'Indexing {len(items)} documents into {target}...')
+        success, errors = await self.send_bulk(items)
+
+        if pending_hashes is not None:
+            self.hash_store.commit(alias, pending_hashes)
+
+        if success:
+            await self.publish_changes(alias, [document_id for document_id, _ in bodies])
+
+        return success, errors
+
+    async def send_bulk(self, items: list[tuple[bytes, bytes]]):
+        """
+        Bulk-запрос из готовых строк NDJSON, вернуть (успешно, ошибки).
+        Документы, отклонённые с 429 и временными 5xx, отправляются повторно, как и весь
+        запрос при таких ответах и сетевых ошибках; число повторов - max_retries. Dead-letter
+        файла здесь нет, поэтому, если хоть один документ так и не загружен, выбрасывается
+        BulkLoadError и контрольная точка не сдвигается.
+        """
+        success, errors = 0, []
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                sleep_time = min(60, 2 ** (attempt - 1))
+                self.logger.warning(f'Retrying {len(items)} documents in ~{sleep_time}s (attempt {attempt})')
+                await asyncio.sleep(random.uniform(sleep_time / 2, sleep_time))
+
+            try:
+                response = await self.connection.bulk(operations=[line for item in items for line in item])
+            except elasticsearch.ApiError as err:
+                if err.status_code in RETRY_STATUSES:
+                    self.logger.warning(f'Bulk request rejected with {err.status_code}')
+                    continue
+                self.logger.exception(err)
+                raise BulkLoadError(f'Bulk request failed: {err}') from err
+            except elastic_transport.TransportError as err:
+                self.logger.warning(f'Bulk request failed: {err!r}')
+                continue
+
+            retry = []
+            for item, result in zip(items, response['items']):
+                op_type, info = result.popitem()
+                status = info.get('status', 500)
+
+                if is_success(op_type, status):
+                    success += 1
+                elif status in RETRY_STATUSES:
+                    retry.append(item)
+                else:
+                    errors.append({op_type: info})
+
+            if not retry:
+                break
+            items = retry
+        else:
+            errors.extend({'index': {'error': 'retries exhausted', 'document': item[0].decode()}} for item in items)
+
+        if errors:
+            self.logger.error(f'{len(errors)} documents failed: {errors[0]}')
+            raise BulkLoadError(f'{len(errors)} documents were not loaded')
+        return success, errors
+
+    def finish_cycle(self):
+        """Сохранить хеши документов и вывести статистику за цикл."""
+        if self.hash_store is None:
+            return
+
+        for alias, stats in self.hash_store.pop_stats().items():
+            self.logger.info(f'{alias}: {stats["sent"]} documents sent, {stats["skipped"]} unchanged skipped')
+
+        self.hash_store.save()
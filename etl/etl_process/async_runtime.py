@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+from state.lease import LeaseLostError, ShardLeases
+
+from .async_extract import AsyncPostgresExtractor
+from .async_loader import AsyncElasticsearchLoader
+from .bulk import BulkLoadError
+from .es_loader import GENRES_INDEX, MOVIES_INDEX, PERSONS_INDEX
+from .extract_data import DELETIONS
+from .settings import EtlSettings
+from .storage import hold_shard
+from .transform_data import DataTransform
+
+logger = logging.getLogger('main')
+
+
+async def run_job(leases: Optional[ShardLeases], shard: str, job: Callable[[], Awaitable[None]],
+                  extractor: AsyncPostgresExtractor) -> None:
+    """
+    Выполнить задачу цикла, если шард не удерживает другой экземпляр ETL. Незагруженная
+    порция (BulkLoadError) не останавливает остальные пайплайны: контрольная точка
+    не сдвинулась, и порция повторится в следующем цикле. После потери аренды
+    (LeaseLostError) задача останавливается, шард продолжает новый владелец.
+    """
+    with hold_shard(leases, shard) as owned:
+        if not owned:
+            return
+
+        try:
+            await job()
+        except BulkLoadError:
+            logger.exception(f'{shard}: documents were not loaded')
+            await extractor.conn.rollback()
+        except LeaseLostError:
+            logger.exception(f'{shard}: job is stopped')
+            await extractor.conn.rollback()
+
+
+async def run_forever(dsn: dict, state, leases: Optional[ShardLeases], hash_store=None) -> None:
+    """
+    Инкрементальная синхронизация в одном цикле событий (ETL_RUNTIME=async).
+
+    Пайплайны сущностей независимы: у каждого своё соединение с Postgres, а запросы
+    к Postgres и Elasticsearch разных пайплайнов перекрываются без потоков.
+    Следующий цикл начинается через ETL_POLL_INTERVAL после завершения всех пайплайнов.
+    """
+    etl_settings = EtlSettings()
+    es_loader = AsyncElasticsearchLoader(hash_store)
+    extractors = {
+        alias: AsyncPostgresExtractor(es_loader, DataTransform(), state, dsn)
+        for alias in (MOVIES_INDEX, PERSONS_INDEX, GENRES_INDEX, DELETIONS)
+    }
+
+    await es_loader.set_connection()
+    await asyncio.gather(*(extractor.set_connection() for extractor in extractors.values()))
+
+    # Дата из прежнего формата состояния - начальная граница для контрольных точек.
+    legacy_watermark = state.get_state('state_key')
+
+    try:
+        while True:
+            jobs = {
+                MOVIES_INDEX: lambda: extractors[MOVIES_INDEX].sync_movies(legacy_watermark),
+                PERSONS_INDEX: lambda: extractors[PERSONS_INDEX].sync_persons(legacy_watermark),
+                GENRES_INDEX: extractors[GENRES_INDEX].sync_genres,
+                DELETIONS: extractors[DELETIONS].sync_deletions,
+            }
+            await asyncio.gather(*(run_job(leases, shard, job, extractors[shard]) for shard, job in jobs.items()))
+            es_loader.finish_cycle()
+
+            await asyncio.sleep(etl_settings.poll_interval)
+    finally:
+        for extractor in extractors.values():
+            await extractor.close()
+        await es_loader.close()
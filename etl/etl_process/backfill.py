@@ -0,0 +1,164 @@
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Optional
+
+from config.logging_config import init_logging
+from state.state import State
+
+from .checkpoints import MAX_UUID
+from .es_loader import MOVIES_INDEX, PERSONS_INDEX, ElasticsearchLoader
+from .extract_data import FILM_WORK, PERSON, PostgresExtractor
+from .storage import create_leases, create_storage, hold_shard
+from .transform_data import DataTransform
+
+# Таблица, по id которой делится на диапазоны каждый индекс.
+SOURCE_TABLES = {
+    MOVIES_INDEX: FILM_WORK,
+    PERSONS_INDEX: PERSON,
+}
+
+
+@dataclass(frozen=True)
+class BackfillRange:
+    """Диапазон id (after, upto] одного индекса и место хранения его контрольной точки."""
+    alias: str
+    target: str
+    number: int
+    after: uuid.UUID
+    upto: uuid.UUID
+    namespace: str
+    state_path: str
+
+    def create_storage(self):
+        return create_storage(self.namespace, self.state_path)
+
+
+def split_id_range(partitions: int) -> list[tuple[uuid.UUID, uuid.UUID]]:
+    """Делит пространство UUID на partitions равных диапазонов (after, upto]."""
+    step = (MAX_UUID.int + 1) // partitions
+    bounds = [uuid.UUID(int=step * number) for number in range(partitions)] + [MAX_UUID]
+    return list(zip(bounds, bounds[1:]))
+
+
+def load_range(task: BackfillRange) -> Optional[float]:
+    """
+    Точка входа воркера: загрузить один диапазон через собственные соединения с Postgres и ES.
+    Вернуть время загрузки или None, если диапазон загружает другой экземпляр ETL.
+    """
+    started = time.monotonic()
+
+    with hold_shard(create_leases(), task.namespace) as owned:
+        if not owned:
+            return None
+
+        es_loader = ElasticsearchLoader()
+        es_loader.write_targets[task.alias] = task.target
+        pg_extractor = PostgresExtractor(es_loader, DataTransform(), State(task.create_storage()))
+        # Диапазоны и так загружаются в отдельных процессах, свой пул преобразования воркеру не нужен.
+        pg_extractor.transform_workers = 0
+
+        try:
+            pg_extractor.backfill_range(SOURCE_TABLES[task.alias], task.after, task.upto)
+        finally:
+            pg_extractor.conn.close()
+            es_loader.connection.close()
+
+    return time.monotonic() - started
+
+
+class Backfill:
+    """
+    Параллельная начальная загрузка.
+
+    Таблица-источник индекса делится на диапазоны id, каждый диапазон загружает
+    отдельный процесс со своими соединениями с Postgres и Elasticsearch. Контрольная
+    точка у каждого диапазона своя (файл в state_dir или ключ общего хранилища), так что
+    упавший воркер не влияет на остальные, а повторный запуск догружает только
+    незавершённые диапазоны. С общим хранилищем диапазоны арендуются, и несколько
+    экземпляров ETL, запущенных с --backfill, делят их между собой.
+    Диапазонов стоит задавать в несколько раз больше, чем воркеров: id - случайные
+    UUID, диапазоны получаются примерно равными, и освободившийся воркер берёт следующий.
+    """
+    def __init__(self, workers: int, partitions: int, state_dir: str):
+        self.workers = workers
+        self.partitions = partitions
+        self.state_dir = state_dir
+        self.logger = logging.getLogger('main')
+
+    def ranges(self, alias: str, target: str) -> list[BackfillRange]:
+        tasks = []
+        for number, (after, upto) in enumerate(split_id_range(self.partitions)):
+            name = f'{target}_{number:03d}_of_{self.partitions:03d}'
+            tasks.append(
+                BackfillRange(alias, target, number, after, upto, f'backfill:{name}',
+                              os.path.join(self.state_dir, f'{name}.json'))
+            )
+        return tasks
+
+    def load(self, alias: str, target: Optional[str] = None) -> bool:
+        """
+        Загрузить индекс alias в target (по умолчанию в сам алиас).
+        Вернуть False, если часть диапазонов ещё загружают другие экземпляры ETL.
+        """
+        target = target or alias
+        tasks = self.ranges(alias, target)
+        os.makedirs(self.state_dir, exist_ok=True)
+
+        self.logger.info(f'Backfilling {alias} into {target}: {len(tasks)} ranges, {self.workers} workers')
+        started = time.monotonic()
+        failed, foreign = [], []
+
+        # spawn: воркеры не наследуют открытые соединения родительского процесса.
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(self.workers, mp_context=context, initializer=init_logging) as executor:
+            futures = {executor.submit(load_range, task): task for task in tasks}
+
+            for future in as_completed(futures):
+                task = futures[future]
+                try:
+                    elapsed = future.result()
+                    if elapsed is None:
+                        foreign.append(task)
+                    else:
+                        self.logger.info(f'[{alias}] range {task.number} loaded in {elapsed:.2f}s')
+                except Exception:
+                    self.logger.exception(f'[{alias}] range {task.number} failed')
+                    failed.append(task)
+
+        if failed:
+            # При полной переиндексации новый индекс будет удалён, продолжать в него нечего.
+            if target != alias:
+                self.discard(tasks)
+            raise RuntimeError(
+                f'{len(failed)} of {len(tasks)} ranges of {alias} failed, rerun to resume them'
+            )
+
+        pending = [task for task in foreign if not self.is_done(task)]
+        if pending:
+            self.logger.info(f'[{alias}] {len(pending)} ranges are still loaded by other instances')
+            return False
+
+        self.logger.info(f'[{alias}] backfill finished in {time.monotonic() - started:.2f}s')
+        self.discard(tasks)
+        return True
+
+    @staticmethod
+    def is_done(task: BackfillRange) -> bool:
+        progress = State(task.create_storage()).get_state('backfill')
+        return bool(progress and progress['done'])
+
+    @staticmethod
+    def discard(tasks: list[BackfillRange]) -> None:
+        """Удалить контрольные точки диапазонов: загрузка завершена или индекс удалён."""
+        for task in tasks:
+            storage = task.create_storage()
+
+            if storage.shared:
+                storage.save_value('backfill', None)
+            elif os.path.exists(task.state_path):
+                os.remove(task.state_path)
@@ -1,8 +1,14 @@
+import asyncio
+import inspect
+import logging
+import random
 import time
 from functools import wraps
 
+logger = logging.getLogger('main')
 
-def backoff(exception_types=None, start_sleep_time=0.1, factor=2, border_sleep_time=30, timeout=None):
+
+def backoff(exception_types=None, start_sleep_time=0.1, factor=2, border_sleep_time=30, timeout=None, jitter=True):
     """
     Функция для повторного выполнения функции через некоторое время, если возникла ошибка.
     Использует наивный экспоненциальный рост времени повтора (factor) до
@@ -11,29 +17,86 @@ def backoff(exception_types=None, start_sleep_time=0.1, factor=2, border_sleep_t
     Формула:
         t = start_sleep_time * (factor ^ n), если t < border_sleep_time
         t = border_sleep_time, иначе
+
+    Ошибкой считается результат None или исключение из exception_types, остальные
+    исключения пробрасываются сразу. Без timeout повторы прекращаются, как только время
+    ожидания превысило border_sleep_time; если последняя попытка завершилась исключением
+    из exception_types, оно пробрасывается. Подходит и для обычных функций, и для корутин:
+    корутина ждёт через asyncio.sleep, не блокируя цикл событий.
     :param start_sleep_time: начальное время ожидания
     :param factor: во сколько раз нужно увеличивать время ожидания на каждой итерации
     :param border_sleep_time: максимальное время ожидания
     :param exception_types:  список типов исключений, при которых вызов функции надо повторять
-    :return: результат выполнения функции
+    :param timeout: сколько секунд всего повторять; None - пока время ожидания не превысит border_sleep_time
+    :param jitter: ждать случайное время от t / 2 до t, чтобы клиенты не повторяли вызовы одновременно
+    :return: результат выполнения функции (None, если вызов так и не удался)
     """
+    exception_types = tuple(exception_types or ())
+
+    def sleep_times():
+        num = 0
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        while True:
+            t = start_sleep_time * factor ** num
+            num = num + 1
+
+            if deadline is None and t > border_sleep_time:
+                return
+            t = min(t, border_sleep_time)
+            if jitter:
+                t = random.uniform(t / 2, t)
+            if deadline is not None:
+                if time.monotonic() >= deadline:
+                    return
+                t = min(t, deadline - time.monotonic())
+            yield t
 
     def func_wrapper(func):
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_inner(*args, **kwargs):
+                delays = sleep_times()
+
+                while True:
+                    try:
+                        result = await func(*args, **kwargs)
+                    except exception_types as err:
+                        logger.warning(f'{func.__name__} failed: {err!r}')
+                        result, error = None, err
+                    else:
+                        error = None
+
+                    if result is not None:
+                        return result
+                    t = next(delays, None)
+                    if t is None:
+                        if error is not None:
+                            raise error
+                        return None
+                    await asyncio.sleep(t)
+            return async_inner
+
         @wraps(func)
         def inner(*args, **kwargs):
-            num = 0
-            t = start_sleep_time
-            conn = None
-
-            while t <= border_sleep_time:
-                conn = func(*args, **kwargs)
+            delays = sleep_times()
 
-                if conn is not None:
-                    break
+            while True:
+                try:
+                    result = func(*args, **kwargs)
+                except exception_types as err:
+                    logger.warning(f'{func.__name__} failed: {err!r}')
+                    result, error = None, err
+                else:
+                    error = None
 
-                t = start_sleep_time * factor ** num
-                num = num + 1
+                if result is not None:
+                    return result
+                t = next(delays, None)
+                if t is None:
+                    if error is not None:
+                        raise error
+                    return None
                 time.sleep(t)
-            return conn
         return inner
     return func_wrapper
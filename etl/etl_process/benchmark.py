@@ -0,0 +1,106 @@
+"""
+Сравнение форматов документов ETL_DOCUMENT_FORMAT на синтетических фильмах.
+
+Для каждого формата измеряются процессорное время и пик выделенной памяти на
+преобразование строк Postgres в документы и их сериализацию в строки bulk NDJSON
+(то, что делает клиент Elasticsearch или ElasticsearchLoader.bulk_index_encoded).
+Postgres и Elasticsearch не нужны.
+
+    python -m etl_process.benchmark --documents 10000 --repeat 5
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+import uuid
+from typing import Callable
+
+from elasticsearch.helpers import expand_action
+from elasticsearch.serializer import JSONSerializer
+
+from .documents import bulk_header, dumps
+from .es_loader import MOVIES_INDEX, movie_action
+from .transform_data import DataTransform
+
+
+def make_rows(count: int, persons_per_role: int = 5, genres: int = 3) -> list[dict]:
+    """Строки в формате FILMS_AGGREGATED_QUERY."""
+    def persons() -> list[dict]:
+        return [{'id': str(uuid.uuid4()), 'name': f'Person {uuid.uuid4().hex[:8]}'} for _ in range(persons_per_role)]
+
+    rows = []
+    for number in range(count):
+        directors, actors, writers = persons(), persons(), persons()
+        rows.append({
+            'fw_id': str(uuid.uuid4()),
+            'title': f'Film {number}',
+            'description': 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 4,
+            'rating': 7.5,
+            'creation_date': '2020-01-01',
+            'file_path': None,
+            'genres': [{'id': str(uuid.uuid4()), 'name': f'Genre {i}', 'description': None} for i in range(genres)],
+            'directors': directors,
+            'directors_names': [person['name'] for person in directors],
+            'actors': actors,
+            'actors_names': [person['name'] for person in actors],
+            'writers': writers,
+            'writers_names': [person['name'] for person in writers],
+        })
+    return rows
+
+
+def encode_models(rows: list[dict]) -> list[tuple[bytes, bytes]]:
+    """Модели pydantic → действия generate_data → сериализатор клиента Elasticsearch."""
+    serializer = JSONSerializer()
+    items = []
+    for movie in DataTransform('model').transform_aggregated_movies(rows):
+        header, body = expand_action(movie_action(MOVIES_INDEX, movie))
+        items.append((serializer.dumps(header), serializer.dumps(body)))
+    return items
+
+
+def encode_dicts(rows: list[dict]) -> list[tuple[bytes, bytes]]:
+    """Словари с проверкой порции → сразу строки bulk NDJSON."""
+    return [
+        (bulk_header(MOVIES_INDEX, document['id']), dumps(document))
+        for document in DataTransform('dict').transform_aggregated_movies(rows)
+    ]
+
+
+def measure(encode: Callable[[list[dict]], list], rows: list[dict], repeat: int) -> tuple[float, float]:
+    """Лучшее процессорное время и пик памяти за repeat прогонов, в пересчёте на 1000 документов."""
+    best_time = float('inf')
+
+    for _ in range(repeat):
+        gc.collect()
+        started = time.process_time()
+        encode(rows)
+        best_time = min(best_time, time.process_time() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    encode(rows)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    scale = 1000 / len(rows)
+    return best_time * scale * 1000, peak * scale / 1024
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Сравнение ETL_DOCUMENT_FORMAT=model и dict')
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.documents)
+    results = {name: measure(encode, rows, args.repeat)
+               for name, encode in (('model', encode_models), ('dict', encode_dicts))}
+
+    print(f'{args.documents} documents, per 1000 documents:')
+    for name, (cpu_ms, peak_kb) in results.items():
+        print(f'  {name:<6} cpu {cpu_ms:8.1f} ms   peak memory {peak_kb:8.0f} KiB')
+
+    model_cpu, model_peak = results['model']
+    dict_cpu, dict_peak = results['dict']
+    print(f'  dict vs model: cpu x{model_cpu / dict_cpu:.1f} faster, memory x{model_peak / dict_peak:.1f} less')
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator
+
+import elastic_transport
+import elasticsearch
+from elasticsearch import Elasticsearch
+from elasticsearch.helpers import expand_action
+from elasticsearch.serializer import JSONSerializer
+
+# Статусы, при которых документ стоит отправить повторно: перегрузка кластера или временная недоступность.
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+# Меньше этого порцию при перегрузке кластера не уменьшаем.
+MIN_CHUNK_SIZE = 10
+
+# Пара строк bulk-запроса: заголовок операции и тело документа (для delete тела нет).
+BulkItem = tuple[bytes, ...]
+
+
+class BulkLoadError(Exception):
+    """
+    Порция загружена в Elasticsearch не полностью, а упавшие документы не сохранены
+    в dead-letter файл: контрольную точку сдвигать нельзя, порция будет загружена повторно.
+    """
+
+
+def is_success(op_type: str, status: int) -> bool:
+    """Операция bulk удалась; удаление уже отсутствующего документа (404) тоже успех."""
+    return 200 <= status < 300 or (op_type == 'delete' and status == 404)
+
+
+class ParallelBulkIndexer:
+    """
+    Параллельная потоковая загрузка документов в Elasticsearch.
+
+    - порции ограничены одновременно по числу документов и по размеру в байтах,
+      при ответах 429 число документов в порции уменьшается вдвое и затем постепенно
+      возвращается к chunk_size;
+    - одновременно выполняется до workers bulk-запросов, новые порции не формируются,
+      пока все воркеры заняты;
+    - при 429 и временных 5xx повторно отправляются только упавшие документы,
+      с экспоненциальной задержкой и случайным разбросом;
+    - документы, которые так и не удалось загрузить, дописываются в dead-letter файл
+      в формате bulk NDJSON, его можно переотправить через replay_dead_letters().
+    """
+    def __init__(
+            self,
+            connection: Elasticsearch,
+            chunk_size: int = 500,
+            max_chunk_bytes: int = 10 * 1024 * 1024,
+            workers: int = 4,
+            max_retries: int = 5,
+            initial_backoff: float = 1,
+            max_backoff: float = 60,
+            dead_letter_path: str = 'dead_letter.ndjson',
+    ):
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.workers = workers
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.dead_letter_path = dead_letter_path
+        self.serializer = JSONSerializer()
+        self._current_chunk_size = chunk_size
+        self.logger = logging.getLogger('es')
+        self._dead_letter_lock = threading.Lock()
+
+    def index(self, actions: Iterable[dict]) -> tuple[int, list]:
+        """Загрузить действия в формате elasticsearch.helpers.bulk, вернуть (успешно, ошибки)."""
+        return self.index_items(self._serialize(actions))
+
+    def replay_dead_letters(self) -> tuple[int, list]:
+        """Переотправить документы из dead-letter файла."""
+        if not os.path.exists(self.dead_letter_path):
+            return 0, []
+
+        # Новые неудачи во время повтора попадут в свежий файл.
+        replay_path = f'{self.dead_letter_path}.replay'
+        os.replace(self.dead_letter_path, replay_path)
+
+        self.logger.info(f'Replaying dead letters from {replay_path}')
+        with open(replay_path, 'rb') as file:
+            result = self.index_items(self._read_dead_letters(file))
+
+        os.remove(replay_path)
+        return result
+
+    def index_items(self, items: Iterable[BulkItem]) -> tuple[int, list]:
+        """Загрузить уже сериализованные строки bulk-запроса, вернуть (успешно, ошибки)."""
+        success, errors = 0, []
+
+        def collect(futures: set[Future]) -> None:
+            nonlocal success
+            for future in futures:
+                chunk_success, chunk_errors = future.result()
+                success += chunk_success
+                errors.extend(chunk_errors)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bulk') as executor:
+            pending = set()
+
+            for chunk in self._chunks(items):
+                if len(pending) >= self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(executor.submit(self._send, chunk))
+
+            collect(wait(pending).done)
+
+        self.logger.info(f'Indexed {success} documents, {len(errors)} failed')
+        return success, errors
+
+    def _serialize(self, actions: Iterable[dict]) -> Iterator[BulkItem]:
+        for action in actions:
+            header, body = expand_action(action)
+            if body is None:
+                yield self.serializer.dumps(header),
+            else:
+                yield self.serializer.dumps(header), self.serializer.dumps(body)
+
+    @staticmethod
+    def _read_dead_letters(file) -> Iterator[BulkItem]:
+        lines = (line.rstrip(b'\n') for line in file if line.strip())
+        for header in lines:
+            if 'delete' in json.loads(header):
+                yield header,
+            else:
+                yield header, next(lines)
+
+    def _chunks(self, items: Iterable[BulkItem]) -> Iterator[list[BulkItem]]:
+        chunk, chunk_bytes = [], 0
+
+        for item in items:
+            item_bytes = sum(len(line) + 1 for line in item)
+
+            if chunk and (len(chunk) >= self._current_chunk_size or chunk_bytes + item_bytes > self.max_chunk_bytes):
+                yield chunk
+                chunk, chunk_bytes = [], 0
+
+            chunk.append(item)
+            chunk_bytes += item_bytes
+
+        if chunk:
+            yield chunk
+
+    def _backoff_time(self, attempt: int) -> float:
+        sleep_time = min(self.max_backoff, self.initial_backoff * 2 ** attempt)
+        return random.uniform(sleep_time / 2, sleep_time)
+
+    def _adapt_chunk_size(self, throttled: bool) -> None:
+        if throttled:
+            self._current_chunk_size = max(MIN_CHUNK_SIZE, self._current_chunk_size // 2)
+        else:
+            self._current_chunk_size = min(self.chunk_size, self._current_chunk_size * 5 // 4 + 1)
+
+    def _send(self, chunk: list[BulkItem]) -> tuple[int, list]:
+        success, errors = 0, []
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                sleep_time = self._backoff_time(attempt - 1)
+                self.logger.warning(f'Retrying {len(chunk)} documents in {sleep_time:.1f}s (attempt {attempt})')
+                time.sleep(sleep_time)
+
+            try:
+                response = self.connection.bulk(operations=[line for item in chunk for line in item])
+            except elasticsearch.ApiError as err:
+                if err.status_code in RETRY_STATUSES:
+                    self._adapt_chunk_size(throttled=err.status_code == 429)
+                    continue
+                self.logger.exception(err)
+                errors.extend(self._dead_letter(chunk, [str(err)] * len(chunk)))
+                return success, errors
+            except elastic_transport.TransportError as err:
+                self.logger.warning(f'Bulk request failed: {err}')
+                continue
+
+            retry, failed, reasons = [], [], []
+            for item, result in zip(chunk, response['items']):
+                op_type, info = result.popitem()
+                status = info.get('status', 500)
+
+                if is_success(op_type, status):
+                    success += 1
+                elif status in RETRY_STATUSES:
+                    retry.append(item)
+                else:
+                    failed.append(item)
+                    reasons.append(info.get('error'))
+
+            errors.extend(self._dead_letter(failed, reasons))
+            self._adapt_chunk_size(throttled=bool(retry))
+
+            if not retry:
+                return success, errors
+            chunk = retry
+
+        self.logger.error(f'{len(chunk)} documents were not indexed after {self.max_retries} retries')
+        errors.extend(self._dead_letter(chunk, ['retries exhausted'] * len(chunk)))
+        return success, errors
+
+    def _dead_letter(self, items: list[BulkItem], reasons: list) -> list:
+        if not items:
+            return []
+
+        with self._dead_letter_lock, open(self.dead_letter_path, 'ab') as file:
+            for item in items:
+                file.write(b''.join(line + b'\n' for line in item))
+
+        self.logger.error(f'{len(items)} documents written to {self.dead_letter_path}: {reasons[0]}')
+        return [{'document': item[0].decode(), 'error': reason} for item, reason in zip(items, reasons)]
@@ -0,0 +1,75 @@
+import uuid
+from datetime import datetime
+from typing import Any, Optional
+
+# Начальная точка keyset-пагинации: (last_updated, MAX_UUID) эквивалентно условию modified > last_updated.
+MAX_UUID = uuid.UUID(int=2 ** 128 - 1)
+
+# Ключ (modified, id) последней обработанной записи таблицы.
+RowKey = tuple[str, str]
+
+
+def row_key(row: dict) -> RowKey:
+    modified = row['modified']
+    if isinstance(modified, datetime):
+        modified = modified.isoformat()
+    return str(modified), str(row['id'])
+
+
+class EntityCheckpoint:
+    """
+    Контрольные точки инкрементальной загрузки одного индекса.
+
+    {'watermarks': {'film_work': [modified, id], 'genre': [...], ...},
+     'cycle': {'upto': {'film_work': [modified, id], ...}, 'loaded': '<id>'}}
+
+    watermarks - до какой записи каждой таблицы-источника данные уже загружены.
+    cycle - незавершённый проход: верхние границы, зафиксированные до начала извлечения,
+    и id последнего загруженного документа. После перезапуска проход продолжается
+    с того же места, а изменения, сделанные во время прохода, попадают в следующий.
+    """
+    def __init__(self, state, key: str, default_watermark: Optional[str] = None) -> None:
+        self.state = state
+        self.key = key
+        self.default_watermark = default_watermark or str(datetime.min)
+        self.checkpoint: dict[str, Any] = state.get_state(key) or {'watermarks': {}, 'cycle': None}
+
+    def watermark(self, table_name: str) -> RowKey:
+        modified, id_ = self.checkpoint['watermarks'].get(table_name) or (self.default_watermark, str(MAX_UUID))
+        return modified, id_
+
+    @property
+    def cycle(self) -> Optional[dict]:
+        return self.checkpoint['cycle']
+
+    @property
+    def is_synced(self) -> bool:
+        """Был хотя бы один завершённый проход и сейчас нет прерванного."""
+        return bool(self.checkpoint['watermarks']) and self.checkpoint['cycle'] is None
+
+    def advance(self, table_name: str, key: RowKey) -> None:
+        self.checkpoint['watermarks'][table_name] = list(key)
+        self.save()
+
+    def open_cycle(self, upto: dict[str, Optional[RowKey]]) -> None:
+        self.checkpoint['cycle'] = {'upto': {table: list(key) if key else None for table, key in upto.items()},
+                                    'loaded': None}
+        self.save()
+
+    def mark_loaded(self, document_id: Any) -> None:
+        self.checkpoint['cycle']['loaded'] = str(document_id)
+        self.save()
+
+    def drop_cycle(self) -> None:
+        self.checkpoint['cycle'] = None
+        self.save()
+
+    def close_cycle(self) -> None:
+        for table_name, key in self.checkpoint['cycle']['upto'].items():
+            if key is not None:
+                self.checkpoint['watermarks'][table_name] = key
+        self.checkpoint['cycle'] = None
+        self.save()
+
+    def save(self) -> None:
+        self.state.set_state(self.key, self.checkpoint)
@@ -0,0 +1,82 @@
+import logging
+from datetime import date
+from typing import Any, Iterable, Optional, Union
+
+import orjson
+from pydantic import BaseModel
+
+# Документы в режиме ETL_DOCUMENT_FORMAT=dict - обычные словари с этими полями.
+# Типы проверяются одним проходом по всей порции вместо построения модели pydantic на документ.
+MOVIE_FIELDS: dict[str, tuple[type, ...]] = {
+    'id': (str,),
+    'imdb_rating': (float, int, type(None)),
+    'genres': (list,),
+    'title': (str,),
+    'file_path': (str, type(None)),
+    'description': (str, type(None)),
+    'creation_date': (str, date, type(None)),
+    'directors_names': (list,),
+    'actors_names': (list,),
+    'writers_names': (list,),
+    'directors': (list,),
+    'actors': (list,),
+    'writers': (list,),
+}
+
+GENRE_FIELDS: dict[str, tuple[type, ...]] = {
+    'id': (str,),
+    'name': (str,),
+    'description': (str, type(None)),
+    'films_count': (int,),
+}
+
+PERSON_FIELDS: dict[str, tuple[type, ...]] = {
+    'id': (str,),
+    'full_name': (str,),
+    'films': (list,),
+}
+
+
+def dumps(value: Any) -> bytes:
+    """Компактный JSON в bytes; orjson сам сериализует даты и в разы быстрее стандартного json."""
+    return orjson.dumps(value)
+
+
+def encode_document(document: Union[BaseModel, dict]) -> tuple[str, bytes]:
+    """Пара (id, тело документа в JSON) из модели pydantic или словаря."""
+    if isinstance(document, BaseModel):
+        document = document.model_dump()
+    return document['id'], dumps(document)
+
+
+def validate_documents(
+        documents: Iterable[dict], fields: dict[str, tuple[type, ...]], logger: Optional[logging.Logger] = None
+) -> list[dict]:
+    """Оставить документы, у которых есть все поля fields нужных типов; остальные записать в лог."""
+    valid, invalid = [], 0
+
+    for document in documents:
+        for name, types in fields.items():
+            if not isinstance(document.get(name), types):
+                invalid += 1
+                if logger is not None:
+                    logger.error(f'Invalid document {document.get("id")}: '
+                                 f'field "{name}" is {type(document.get(name)).__name__}')
+                break
+        else:
+            valid.append(document)
+
+    if invalid and logger is not None:
+        logger.error(f'{invalid} of {invalid + len(valid)} documents failed validation')
+
+    return valid
+
+
+def bulk_header(index: str, document_id: str) -> bytes:
+    """Заголовок операции index bulk-запроса."""
+    return dumps({'index': {'_index': index, '_id': document_id}})
+
+
+def delete_header(index: str, document_id: str) -> bytes:
+    """Строка операции delete bulk-запроса, тела у неё нет."""
+    return dumps({'delete': {'_index': index, '_id': document_id}})
@@ -1,30 +1,194 @@
 import json
 import logging
 import os
-from typing import Optional
+from datetime import datetime
+from typing import Callable, Optional
 
 import elastic_transport
 import elasticsearch
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
+from elasticsearch.helpers import bulk, scan
 
 from .backoff import backoff
-from .settings import ElasticsearchSettings
+from .bulk import BulkItem, BulkLoadError, ParallelBulkIndexer, is_success
+from .documents import bulk_header, delete_header, dumps
+from .invalidation import create_publisher
+from .settings import ElasticsearchSettings, EtlSettings
+
+MOVIES_INDEX = 'movies'
+PERSONS_INDEX = 'persons'
+GENRES_INDEX = 'genres'
+
+# Схемы индексов; API читает данные через алиасы с этими же именами.
+INDEX_SCHEMAS = {
+    MOVIES_INDEX: 'index.json',
+    PERSONS_INDEX: 'index_genres.json',
+    GENRES_INDEX: 'genres_index.json',
+}
+
+# Роли персон в документе фильма: вложенный список {id, name} и параллельный ему список имён.
+PERSON_ROLES = ('directors', 'actors', 'writers')
+
+# Новое имя персоны во всех ролях фильма; списки ролей и имён идут в одном порядке.
+RENAME_PERSONS_SCRIPT = """
+for (role in params.roles) {
+    def persons = ctx._source[role];
+    def names = ctx._source[role + '_names'];
+    if (persons == null) {
+        continue;
+    }
+    for (int i = 0; i < persons.size(); i++) {
+        def name = params.names[persons[i].id];
+        if (name != null) {
+            persons[i].name = name;
+            if (names != null && i < names.size()) {
+                names[i] = name;
+            }
+        }
+    }
+}
+"""
+
+# Новые название и описание жанра в документе фильма.
+RENAME_GENRES_SCRIPT = """
+if (ctx._source.genres != null) {
+    for (genre in ctx._source.genres) {
+        def update = params.genres[genre.id];
+        if (update != null) {
+            genre.name = update.name;
+            genre.description = update.description;
+        }
+    }
+}
+"""
+
+# Удалённые связи фильма: params.links[id фильма] = {persons: [{id, role}], genres: [id]}.
+REMOVE_MOVIE_LINKS_SCRIPT = """
+def links = params.links[ctx._id];
+boolean changed = false;
+for (person in links.persons) {
+    def persons = ctx._source[person.role];
+    def names = ctx._source[person.role + '_names'];
+    if (persons == null) {
+        continue;
+    }
+    for (int i = persons.size() - 1; i >= 0; i--) {
+        if (persons[i].id == person.id) {
+            persons.remove(i);
+            if (names != null && i < names.size()) {
+                names.remove(i);
+            }
+            changed = true;
+        }
+    }
+}
+if (ctx._source.genres != null && ctx._source.genres.removeIf(genre -> links.genres.contains(genre.id))) {
+    changed = true;
+}
+if (!changed) {
+    ctx.op = 'noop';
+}
+"""
+
+# Удалённые связи персоны: params.links[id персоны] = {id фильма: [роли]}; фильм без ролей убирается.
+REMOVE_PERSON_FILMS_SCRIPT = """
+def links = params.links[ctx._id];
+def films = ctx._source.films;
+boolean changed = false;
+if (films != null) {
+    for (int i = films.size() - 1; i >= 0; i--) {
+        def roles = links[films[i].id];
+        if (roles == null) {
+            continue;
+        }
+        films[i].roles.removeIf(role -> roles.contains(role));
+        if (films[i].roles.isEmpty()) {
+            films.remove(i);
+        }
+        changed = true;
+    }
+}
+if (!changed) {
+    ctx.op = 'noop';
+}
+"""
+
+
+def movie_action(index: str, movie) -> dict:
+    """Действие bulk-загрузки фильма из модели etl_process.models.Movie."""
+    return {
+        "_index": index,
+        "_id": movie.id,
+        "id": movie.id,
+        "imdb_rating": movie.imdb_rating,
+        "creation_date": movie.creation_date,
+        "file_path": movie.file_path,
+        "genres": movie.genres,
+        "title": movie.title,
+        "description": movie.description,
+        "directors_names": movie.directors_names,
+        "actors_names": movie.actors_names,
+        "writers_names": movie.writers_names,
+        "directors": movie.directors,
+        "actors": movie.actors,
+        "writers": movie.writers
+    }
+
+
+def person_action(index: str, person) -> dict:
+    """Действие bulk-загрузки персоны из модели etl_process.models.Person."""
+    return {
+        "_index": index,
+        "_id": person.id,
+        "id": person.id,
+        "full_name": person.full_name,
+        "films": person.films
+    }
+
+
+def genre_action(index: str, genre) -> dict:
+    """Действие bulk-загрузки жанра из модели etl_process.models.Genre."""
+    return {
+        "_index": index,
+        "_id": genre.id,
+        "id": genre.id,
+        "name": genre.name,
+        "description": genre.description,
+        "films_count": genre.films_count
+    }
 
 
 class ElasticsearchLoader:
-    """Загрузка данных в подготовленном формате в Elasticsearch."""
-    def __init__(self):
+    """
+    Загрузка данных в подготовленном формате в Elasticsearch.
+
+    Если порция загружена не полностью, методы загрузки выбрасывают BulkLoadError,
+    и контрольная точка не сдвигается. С ETL_BULK_MODE=parallel упавшие документы
+    пишутся в dead-letter файл и возвращаются в списке ошибок без исключения.
+    hash_store (state.hash_store.DocumentHashStore) включает пропуск документов,
+    содержимое которых не изменилось с прошлой загрузки. С ETL_PUBLISH_INVALIDATIONS
+    id документов, изменённых в рабочих индексах, публикуются для инвалидации кешей API.
+    """
+    def __init__(self, hash_store=None):
+        self.hash_store = hash_store
+        self.publisher = None
         self.host = None
         self.port = None
         self.connection = None
-        self.file_name = 'index.json'
-        self.index_name = 'movies'
+        self.etl_settings = None
+        self.bulk_indexer = None
+        self.file_name = INDEX_SCHEMAS[MOVIES_INDEX]
+        self.index_name = MOVIES_INDEX
+        self.persons_index_name = PERSONS_INDEX
+        self.genres_index_name = GENRES_INDEX
+        # Куда фактически пишутся документы: алиас или новый индекс во время полной переиндексации.
+        self.write_targets = {alias: alias for alias in INDEX_SCHEMAS}
         self.logger = logging.getLogger('es')
 
         self.init_env()
         self.set_connection()
         self.create_index()
+        self.set_bulk_indexer()
 
     @staticmethod
     def get_file_path(file_name: str, path: str) -> str:
@@ -37,6 +201,8 @@ class ElasticsearchLoader:
 
         self.host = settings.elastic_host
         self.port = settings.elastic_port
+        self.etl_settings = EtlSettings()
+        self.publisher = create_publisher()
 
     @backoff()
     def make_es_connection(self):
@@ -57,6 +223,19 @@ class ElasticsearchLoader:
     def set_connection(self):
         self.connection = self.make_es_connection()
 
+    def set_bulk_indexer(self):
+        if self.etl_settings.bulk_mode != 'parallel':
+            return
+
+        self.bulk_indexer = ParallelBulkIndexer(
+            self.connection,
+            chunk_size=self.etl_settings.bulk_chunk_size,
+            max_chunk_bytes=self.etl_settings.bulk_max_chunk_bytes,
+            workers=self.etl_settings.bulk_workers,
+            max_retries=self.etl_settings.bulk_max_retries,
+            dead_letter_path=self.etl_settings.bulk_dead_letter_path,
+        )
+
     def get_index_schema(self, file) -> Optional[dict]:
         file_path = self.get_file_path(file, '.')
 
@@ -67,74 +246,346 @@ class ElasticsearchLoader:
             self.logger.exception(err)
 
     def create_index(self):
-        self.logger.info(f'Creating an index {self.index_name}')
+        for alias, file_name in INDEX_SCHEMAS.items():
+            if self.connection.indices.exists(index=alias):
+                self.logger.info(f'Index {alias} already exists')
+                continue
+
+            index_name = self.versioned_index_name(alias)
+            self.logger.info(f'Creating an index {index_name} with alias {alias}')
+
+            mappings = self.get_index_schema(file_name)
+            if mappings is None:
+                self.logger.warning('Index will be created without settings and mappings!')
+
+            body = dict(mappings or {})
+            body['aliases'] = {alias: {}}
+
+            # Индекс создаётся пустым, сохранённые хеши больше не соответствуют его содержимому.
+            if self.hash_store is not None:
+                self.hash_store.reset(alias)
 
-        mappings = self.get_index_schema(self.file_name)
-        mappings_persons = self.get_index_schema('index_genres.json')
+            try:
+                response = self.connection.indices.create(index=index_name, body=body)
+                if response.body['acknowledged']:
+                    self.logger.info(f'Index {index_name} created')
+            except elasticsearch.BadRequestError as err:
+                self.logger.exception(err)
 
-        if mappings is None:
-            self.logger.warning('Index will be created without settings and mappings!')
+    @staticmethod
+    def versioned_index_name(alias: str) -> str:
+        return f'{alias}_{datetime.now():%Y%m%d%H%M%S}'
+
+    def rebuild_index(self, alias: str, load: Callable[[], None]) -> str:
+        """
+        Полная переиндексация без простоя.
+
+        Документы загружаются в новый версионный индекс с отключёнными refresh и репликами,
+        затем индекс сливается в один сегмент и алиас атомарно переключается на него.
+        Предыдущий индекс остаётся для быстрого отката (rollback_index).
+        """
+        new_index = self.versioned_index_name(alias)
+        schema = self.get_index_schema(INDEX_SCHEMAS[alias]) or {}
+        index_settings = schema.get('settings', {})
+        refresh_interval = index_settings.get('refresh_interval', '1s')
+        replicas = index_settings.get('number_of_replicas', self.get_replicas(alias))
 
+        self.logger.info(f'Rebuilding {alias} into {new_index}')
+        self.connection.indices.create(index=new_index, body=schema)
+        self.connection.indices.put_settings(
+            index=new_index, settings={'index': {'refresh_interval': '-1', 'number_of_replicas': 0}}
+        )
+
+        self.write_targets[alias] = new_index
         try:
-            response = self.connection.indices.create(index=self.index_name, body=mappings)
-            response = self.connection.indices.create(index='persons', body=mappings_persons)
-            if response.body['acknowledged']:
-                self.logger.info(f'Index {self.index_name} created')
-        except elasticsearch.BadRequestError as err:
-            self.logger.exception(err)
+            load()
+        except BaseException:
+            self.logger.exception(f'Rebuild of {alias} failed, dropping {new_index}')
+            self.connection.indices.delete(index=new_index)
+            if self.hash_store is not None:
+                self.hash_store.reset(alias)
+            raise
+        finally:
+            self.write_targets[alias] = alias
+
+        self.connection.indices.put_settings(
+            index=new_index, settings={'index': {'refresh_interval': refresh_interval, 'number_of_replicas': replicas}}
+        )
+        self.connection.indices.refresh(index=new_index)
+        self.connection.indices.forcemerge(index=new_index, max_num_segments=1)
+
+        self.swap_alias(alias, new_index)
+        return new_index
+
+    def get_replicas(self, alias: str) -> int:
+        if not self.connection.indices.exists(index=alias):
+            return 1
+
+        response = self.connection.indices.get_settings(index=alias, name='index.number_of_replicas')
+        replicas = [int(item['settings']['index']['number_of_replicas']) for item in response.body.values()]
+        return max(replicas, default=1)
+
+    def swap_alias(self, alias: str, new_index: str) -> None:
+        """Атомарно переключить алиас на new_index."""
+        actions = [{'add': {'index': new_index, 'alias': alias}}]
+
+        if self.connection.indices.exists_alias(name=alias):
+            for old_index in self.connection.indices.get_alias(name=alias).body:
+                actions.insert(0, {'remove': {'index': old_index, 'alias': alias}})
+        elif self.connection.indices.exists(index=alias):
+            # Старый индекс без версии занимает имя алиаса: удаляем его в той же атомарной операции.
+            self.logger.warning(f'{alias} is a concrete index, it will be replaced by alias without rollback')
+            actions.insert(0, {'remove_index': {'index': alias}})
+
+        self.connection.indices.update_aliases(actions=actions)
+        self.logger.info(f'Alias {alias} switched to {new_index}')
+
+    def rollback_index(self, alias: str) -> Optional[str]:
+        """Вернуть алиас на предыдущую версию индекса."""
+        if not self.connection.indices.exists_alias(name=alias):
+            self.logger.warning(f'{alias} is not an alias, nothing to roll back')
+            return None
+
+        current = set(self.connection.indices.get_alias(name=alias).body)
+        versions = sorted(self.connection.indices.get(index=f'{alias}_*').body)
+        previous = [index for index in versions if index not in current and index < min(current)]
+
+        if not previous:
+            self.logger.warning(f'There is no previous version of {alias} to roll back to')
+            return None
+
+        self.swap_alias(alias, previous[-1])
+        if self.hash_store is not None:
+            self.hash_store.reset(alias)
+        return previous[-1]
 
     def generate_data(self, data: list):
         for movie in data:
-            yield {
-                "_index": self.index_name,
-                "_id": movie.id,
-                "id": movie.id,
-                "imdb_rating": movie.imdb_rating,
-                "creation_date": movie.creation_date,
-                "file_path": movie.file_path,
-                "genres": movie.genres,
-                "title": movie.title,
-                "description": movie.description,
-                "directors_names": movie.directors_names,
-                "actors_names": movie.actors_names,
-                "writers_names": movie.writers_names,
-                "directors": movie.directors,
-                "actors": movie.actors,
-                "writers": movie.writers
-            }
+            yield movie_action(self.write_targets[self.index_name], movie)
 
     def generate_persons(self, data: list):
         for person in data:
-            yield {
-                "_index": 'persons',
-                "_id": person.id,
-                "id": person.id,
-                "full_name": person.full_name,
-                "films": person.films
-            }
+            yield person_action(self.write_targets[self.persons_index_name], person)
+
+    def generate_genres(self, data: list):
+        for genre in data:
+            yield genre_action(self.write_targets[self.genres_index_name], genre)
 
     def index_documents(self, index_documents):
-        self.logger.info('Indexing documents...')
-        success, errors = None, None
+        if self.etl_settings.document_format == 'dict':
+            return self.bulk_index_encoded(self.index_name, index_documents)
+        return self.bulk_index(self.index_name, self.generate_data(index_documents))
+
+    def index_persons(self, index_documents):
+        if self.etl_settings.document_format == 'dict':
+            return self.bulk_index_encoded(self.persons_index_name, index_documents)
+        return self.bulk_index(self.persons_index_name, self.generate_persons(index_documents))
+
+    def index_genres(self, index_documents):
+        if self.etl_settings.document_format == 'dict':
+            return self.bulk_index_encoded(self.genres_index_name, index_documents)
+        return self.bulk_index(self.genres_index_name, self.generate_genres(index_documents))
+
+    def rename_persons_in_movies(self, names: dict[str, str]) -> int:
+        """
+        Заменить имена персон {id: full_name} во всех фильмах, где они участвуют,
+        не пересобирая документы: _update_by_query со скриптом по вложенным спискам ролей.
+        """
+        query = {'bool': {'should': [
+            {'nested': {'path': role, 'query': {'terms': {f'{role}.id': list(names)}}}} for role in PERSON_ROLES
+        ]}}
+        script = {'source': RENAME_PERSONS_SCRIPT, 'params': {'names': names, 'roles': list(PERSON_ROLES)}}
+        return self.update_by_query(self.index_name, query, script)
+
+    def rename_genres_in_movies(self, genres: dict[str, dict]) -> int:
+        """Заменить название и описание жанров {id: {name, description}} во всех фильмах жанра."""
+        query = {'nested': {'path': 'genres', 'query': {'terms': {'genres.id': list(genres)}}}}
+        script = {'source': RENAME_GENRES_SCRIPT, 'params': {'genres': genres}}
+        return self.update_by_query(self.index_name, query, script)
+
+    def remove_movie_links(self, links: dict[str, dict]) -> int:
+        """Убрать удалённые связи с персонами и жанрами из фильмов {id: {persons, genres}}."""
+        script = {'source': REMOVE_MOVIE_LINKS_SCRIPT, 'params': {'links': links}}
+        return self.update_by_query(self.index_name, {'ids': {'values': list(links)}}, script)
+
+    def remove_person_films(self, links: dict[str, dict]) -> int:
+        """Убрать роли в удалённых связях из фильмов персон {id персоны: {id фильма: [роли]}}."""
+        script = {'source': REMOVE_PERSON_FILMS_SCRIPT, 'params': {'links': links}}
+        return self.update_by_query(self.persons_index_name, {'ids': {'values': list(links)}}, script)
+
+    def update_by_query(self, alias: str, query: dict, script: dict) -> int:
+        """
+        Обновить документы скриптом. При конфликте версий запрос прерывается
+        с ошибкой: обновление не потеряется, контрольная точка не сдвинется, и оно
+        повторится в следующем цикле. Хеши изменённых документов забываются: иначе
+        следующая пересборка документа совпала бы со старым хешем и не была бы загружена.
+        """
+        target = self.write_targets[alias]
+        ids = self.matching_ids(alias, query) if self.publishes(alias) or self.hash_store is not None else None
+        response = self.connection.update_by_query(
+            index=target, query=query, script=script, slices='auto', wait_for_completion=True
+        )
+
+        self.logger.info(f'{target}: {response["updated"]} documents patched in place')
+        if self.hash_store is not None:
+            self.hash_store.forget(alias, ids)
+        self.publish_changes(alias, ids)
+        return response['updated']
+
+    def matching_ids(self, alias: str, query: dict) -> list[str]:
+        """id документов, подходящих под запрос, без их содержимого."""
+        hits = scan(self.connection, index=self.write_targets[alias], query={'query': query, '_source': False})
+        return [hit['_id'] for hit in hits]
+
+    def publishes(self, alias: str) -> bool:
+        """
+        Публиковать ли изменения индекса для инвалидации кешей API. Во время полной
+        переиндексации документы пишутся в новый индекс, который API ещё не читает;
+        изменения, сделанные за это время, догружаются в рабочий индекс после неё.
+        """
+        return self.publisher is not None and self.write_targets[alias] == alias
+
+    def publish_changes(self, alias: str, ids: list[str]) -> None:
+        if ids and self.publishes(alias):
+            self.publisher.publish(alias, ids)
+
+    def delete_documents(self, alias: str, ids: list[str]):
+        """Удалить документы bulk-операциями delete, вернуть (успешно, ошибки)."""
+        target = self.write_targets[alias]
+        items = [(delete_header(target, document_id),) for document_id in ids]
+        self.logger.info(f'Deleting {len(items)} documents from {target}...')
+
+        if self.bulk_indexer is not None:
+            success, errors = self.bulk_indexer.index_items(items)
+        else:
+            success, errors = self.send_bulk(items)
+
+        if self.hash_store is not None:
+            self.hash_store.forget(alias, ids)
+        self.publish_changes(alias, ids)
+        return success, errors
+
+    def delete_missing(self, alias: str, ids: list[str]) -> int:
+        """Удалить из индекса документы, id которых нет в ids; для небольших индексов, которые синхронизируются целиком."""
+        query = {'bool': {'must_not': {'ids': {'values': ids}}}}
 
         try:
-            success, errors = bulk(self.connection, self.generate_data(index_documents))
-        except elastic_transport.SerializationError as err:
-            self.logger.exception(err)
-        except elasticsearch.helpers.BulkIndexError as err:
+            missing = self.matching_ids(alias, query) if self.publishes(alias) else None
+            response = self.connection.delete_by_query(index=self.write_targets[alias], query=query, refresh=True)
+        except elasticsearch.ApiError as err:
             self.logger.exception(err)
+            return 0
+
+        if response['deleted']:
+            self.logger.info(f'{alias}: {response["deleted"]} missing documents deleted')
+            self.publish_changes(alias, missing)
+        return response['deleted']
+
+    def bulk_index(self, alias: str, actions):
+        pending_hashes = None
+
+        if self.hash_store is not None:
+            # Во время переиндексации новый индекс пуст, поэтому отправляются все документы.
+            skip_unchanged = self.write_targets[alias] == alias
+            actions, pending_hashes = self.hash_store.filter_changed(alias, actions, skip_unchanged)
+
+            if not actions:
+                return 0, []
+
+        # id нужны для инвалидации кешей API после загрузки, генератор действий читается один раз.
+        if self.publishes(alias):
+            actions = list(actions)
+
+        self.logger.info('Indexing documents...')
+
+        if self.bulk_indexer is not None:
+            success, errors = self.bulk_indexer.index(actions)
+        else:
+            try:
+                success, errors = bulk(self.connection, actions)
+            except (elasticsearch.helpers.BulkIndexError, elasticsearch.ApiError,
+                    elastic_transport.TransportError) as err:
+                self.logger.exception(err)
+                raise BulkLoadError(f'{alias}: bulk request failed') from err
+
+        # Если часть порции не загрузилась, хеши не фиксируем: порция будет отправлена повторно.
+        if pending_hashes is not None and not errors:
+            self.hash_store.commit(alias, pending_hashes)
+
+        if success and self.publishes(alias):
+            self.publish_changes(alias, [str(action['_id']) for action in actions])
 
         return success, errors
 
-    def index_persons(self, index_documents):
+    def bulk_index_encoded(self, alias: str, documents: list[dict]):
+        """
+        Загрузка документов-словарей (ETL_DOCUMENT_FORMAT=dict): каждый документ один раз
+        сериализуется в строку bulk NDJSON, без промежуточного словаря действия
+        и сериализатора клиента.
+        """
+        return self.bulk_index_bodies(alias, [(document['id'], dumps(document)) for document in documents])
+
+    def bulk_index_bodies(self, alias: str, bodies: list[tuple[str, bytes]]):
+        """Загрузка уже сериализованных документов: пары (id, тело документа в JSON)."""
+        target = self.write_targets[alias]
+        pending_hashes = None
+
+        if self.hash_store is not None:
+            bodies, pending_hashes = self.hash_store.filter_changed_encoded(alias, bodies, target == alias)
+
+            if not bodies:
+                return 0, []
+
+        items = [(bulk_header(target, document_id), body) for document_id, body in bodies]
         self.logger.info('Indexing documents...')
-        success, errors = None, None
 
+        if self.bulk_indexer is not None:
+            success, errors = self.bulk_indexer.index_items(items)
+        else:
+            success, errors = self.send_bulk(items)
+
+        if pending_hashes is not None and not errors:
+            self.hash_store.commit(alias, pending_hashes)
+
+        if success:
+            self.publish_changes(alias, [document_id for document_id, _ in bodies])
+
+        return success, errors
+
+    def send_bulk(self, items: list[BulkItem]):
+        """Один bulk-запрос из готовых строк NDJSON, вернуть (успешно, ошибки); BulkLoadError, если не всё загружено."""
         try:
-            success, errors = bulk(self.connection, self.generate_persons(index_documents))
-        except elastic_transport.SerializationError as err:
-            self.logger.exception(err)
-        except elasticsearch.helpers.BulkIndexError as err:
+            response = self.connection.bulk(operations=[line for item in items for line in item])
+        except (elasticsearch.ApiError, elastic_transport.TransportError) as err:
             self.logger.exception(err)
+            raise BulkLoadError(f'Bulk request failed: {err}') from err
+
+        success, errors = 0, []
+        for result in response['items']:
+            op_type, info = result.popitem()
+            if is_success(op_type, info.get('status', 500)):
+                success += 1
+            else:
+                errors.append({op_type: info})
 
+        if errors:
+            self.logger.error(f'{len(errors)} documents failed: {errors[0]}')
+            raise BulkLoadError(f'{len(errors)} of {len(items)} documents were not loaded')
         return success, errors
+
+    def finish_cycle(self):
+        """Сохранить хеши документов и вывести статистику за цикл."""
+        if self.hash_store is None:
+            return
+
+        for alias, stats in self.hash_store.pop_stats().items():
+            self.logger.info(f'{alias}: {stats["sent"]} documents sent, {stats["skipped"]} unchanged skipped')
+
+        self.hash_store.save()
+
+    def replay_dead_letters(self):
+        if self.bulk_indexer is None:
+            self.logger.warning('Dead letters are written only with ETL_BULK_MODE=parallel')
+            return None, None
+
+        return self.bulk_indexer.replay_dead_letters()
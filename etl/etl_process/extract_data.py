@@ -1,13 +1,23 @@
+import json
 import logging
-from typing import Tuple, Union
+import os
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from functools import partial
+from typing import Iterable, Iterator, Optional, Tuple, Union
 
 import psycopg
 from psycopg.rows import dict_row
+from state.lease import ensure_lease
 
 from .backoff import backoff
-from .es_loader import ElasticsearchLoader
-from .settings import PostgresSettings
+from .checkpoints import MAX_UUID, EntityCheckpoint, RowKey, row_key
+from .es_loader import PERSON_ROLES, ElasticsearchLoader
+from .pipeline import Checkpoint, Pipeline, Stage
+from .settings import EtlSettings, PostgresSettings
 from .transform_data import DataTransform
+from .transform_pool import MOVIES, PERSONS, TransformPool
 
 GENRE = 'genre'
 FILM_WORK = 'film_work'
@@ -15,12 +25,258 @@ PERSON = 'person'
 GENRE_FILM_WORK = 'genre_film_work'
 PERSON_FILM_WORK = 'person_film_work'
 
+# Таблицы, изменения которых затрагивают документы фильмов.
+MOVIES_SOURCES = (GENRE, PERSON, FILM_WORK)
+
+CHANGELOG = 'etl_changelog'
+TOMBSTONE = 'etl_tombstone'
+# Задача цикла, которая переносит удаления; с общим хранилищем состояния её выполняет один экземпляр.
+DELETIONS = 'deletions'
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+# Журнал изменений и уведомления нужны только с ETL_CHANGE_SOURCE=changelog: в режиме modified
+# их триггеры заполняли бы журнал, который никто не читает.
+CHANGELOG_MIGRATIONS_DIR = os.path.join(MIGRATIONS_DIR, 'changelog')
+# Ключ блокировки Postgres, под которой миграции применяет один экземпляр ETL.
+MIGRATIONS_LOCK_ID = 7_452_019
+
+FILMS_INFO_QUERY = """SELECT
+                        fw.id as fw_id, 
+                        fw.title, 
+                        fw.description, 
+                        fw.rating, 
+                        fw.type, 
+                        fw.creation_date, 
+                        fw.file_path, 
+                        pfw.role, 
+                        p.id, 
+                        p.full_name,
+                        g.name,
+                        g.id as g_id,
+                        g.description as g_description
+                    FROM content.film_work as fw
+                    LEFT JOIN content.person_film_work as pfw ON pfw.film_work_id = fw.id
+                    LEFT JOIN content.person as p ON p.id = pfw.person_id
+                    LEFT JOIN content.genre_film_work as gfw ON gfw.film_work_id = fw.id
+                    LEFT JOIN content.genre as g ON g.id = gfw.genre_id
+                    WHERE {condition}
+                    ORDER BY fw_id;"""
+
+# Документ фильма целиком собирается в Postgres: одна строка на фильм вместо
+# декартова произведения персон и жанров.
+FILMS_AGGREGATED_QUERY = """SELECT
+                        fw.id as fw_id,
+                        fw.title,
+                        fw.description,
+                        fw.rating,
+                        fw.creation_date::text as creation_date,
+                        fw.file_path,
+                        COALESCE(g.genres, '[]') as genres,
+                        COALESCE(p.directors, '[]') as directors,
+                        COALESCE(p.directors_names, '{{}}') as directors_names,
+                        COALESCE(p.actors, '[]') as actors,
+                        COALESCE(p.actors_names, '{{}}') as actors_names,
+                        COALESCE(p.writers, '[]') as writers,
+                        COALESCE(p.writers_names, '{{}}') as writers_names
+                    FROM content.film_work as fw
+                    LEFT JOIN LATERAL (
+                        SELECT json_agg(
+                            json_build_object('id', g.id::text, 'name', g.name, 'description', g.description)
+                            ORDER BY g.name
+                        ) as genres
+                        FROM content.genre_film_work as gfw
+                        JOIN content.genre as g ON g.id = gfw.genre_id
+                        WHERE gfw.film_work_id = fw.id
+                    ) as g ON true
+                    LEFT JOIN LATERAL (
+                        SELECT
+                            json_agg(json_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.full_name, p.id)
+                                FILTER (WHERE pfw.role = 'director') as directors,
+                            array_agg(p.full_name ORDER BY p.full_name, p.id)
+                                FILTER (WHERE pfw.role = 'director') as directors_names,
+                            json_agg(json_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.full_name, p.id)
+                                FILTER (WHERE pfw.role = 'actor') as actors,
+                            array_agg(p.full_name ORDER BY p.full_name, p.id)
+                                FILTER (WHERE pfw.role = 'actor') as actors_names,
+                            json_agg(json_build_object('id', p.id::text, 'name', p.full_name) ORDER BY p.full_name, p.id)
+                                FILTER (WHERE pfw.role = 'writer') as writers,
+                            array_agg(p.full_name ORDER BY p.full_name, p.id)
+                                FILTER (WHERE pfw.role = 'writer') as writers_names
+                        FROM content.person_film_work as pfw
+                        JOIN content.person as p ON p.id = pfw.person_id
+                        WHERE pfw.film_work_id = fw.id
+                    ) as p ON true
+                    WHERE {condition}
+                    ORDER BY fw_id;"""
+
+PERSONS_INFO_QUERY = """SELECT
+                    p.id as person_id, 
+                    p.full_name,
+                    pfw.role, 
+                    pfw.film_work_id as film_id
+                FROM content.person as p
+                JOIN content.person_film_work as pfw ON pfw.person_id = p.id
+                WHERE {condition}
+                ORDER BY person_id;"""
+
+PERSONS_AGGREGATED_QUERY = """SELECT
+                    p.id as person_id,
+                    p.full_name,
+                    COALESCE(f.films, '[]') as films
+                FROM content.person as p
+                LEFT JOIN LATERAL (
+                    SELECT json_agg(json_build_object('id', pfw.film_work_id::text, 'roles', pfw.roles)
+                                    ORDER BY pfw.film_work_id) as films
+                    FROM (
+                        SELECT film_work_id, array_agg(role ORDER BY role) as roles
+                        FROM content.person_film_work
+                        WHERE person_id = p.id
+                        GROUP BY film_work_id
+                    ) as pfw
+                ) as f ON true
+                WHERE {condition}
+                ORDER BY person_id;"""
+
+# Жанров единицы и десятки: индекс жанров каждый цикл собирается целиком вместе с числом фильмов.
+GENRES_QUERY = """SELECT
+                    g.id,
+                    g.name,
+                    g.description,
+                    count(gfw.film_work_id) as films_count
+                FROM content.genre as g
+                LEFT JOIN content.genre_film_work as gfw ON gfw.genre_id = g.id
+                GROUP BY g.id
+                ORDER BY g.name;"""
+
+# Полная загрузка через COPY: документ целиком собирается в Postgres и передаётся одной
+# JSON-строкой, без построения строк и словарей psycopg для каждой записи.
+COPY_DOCUMENTS_QUERY = 'COPY (SELECT row_to_json(docs) FROM ({query}) as docs) TO STDOUT;'
+
+# Запросы, ключ документа и условие на диапазон id для полной загрузки через COPY.
+COPY_SOURCES = {
+    FILM_WORK: (FILMS_AGGREGATED_QUERY, 'fw_id', 'fw.id > %s AND fw.id <= %s'),
+    PERSON: (PERSONS_AGGREGATED_QUERY, 'person_id', 'p.id > %s AND p.id <= %s'),
+}
+
+# Надгробия удалённых строк в порядке удаления, см. migrations/0003_tombstones.sql.
+TOMBSTONES_QUERY = f"""SELECT id, table_name, film_work_id, person_id, genre_id, role
+                FROM content.{TOMBSTONE}
+                ORDER BY id
+                LIMIT %s;"""
+
+# Ключ связи в связующих таблицах и типы его полей: по нему проверяется, что связь не вставили заново.
+LINK_KEYS = {
+    PERSON_FILM_WORK: {'film_work_id': 'uuid', 'person_id': 'uuid', 'role': 'text'},
+    GENRE_FILM_WORK: {'film_work_id': 'uuid', 'genre_id': 'uuid'},
+}
+
+
+def existing_query(table_name) -> str:
+    """Запрос строк, которые есть в таблице, из списков ключей; параметры - по списку на поле ключа."""
+    if table_name not in LINK_KEYS:
+        return f'SELECT id FROM content.{table_name} WHERE id = ANY(%s);'
+
+    columns = ', '.join(LINK_KEYS[table_name])
+    placeholders = ', '.join(f'%s::{column_type}[]' for column_type in LINK_KEYS[table_name].values())
+    return f"""SELECT DISTINCT {columns}
+                FROM content.{table_name}
+                JOIN unnest({placeholders}) as deleted({columns}) USING ({columns});"""
+
+
+def changed_films_query(
+        watermarks: dict, upto: dict, sources: Iterable[str], after: uuid.UUID
+) -> Tuple[Optional[str], list]:
+    """
+    Запрос id фильмов с id больше after, изменённых напрямую или через связанные жанры
+    и персоны; watermarks и upto - границы (modified, id) по таблицам: (после, до включительно].
+    UNION убирает повторы в Postgres, результат упорядочен по id и читается серверным
+    курсором, поэтому в памяти ETL не копятся id всех изменённых фильмов.
+    Таблицы, у которых в upto None, пропускаются; если пропущены все, запроса нет.
+    """
+    subqueries, params = [], []
+
+    for table_name in sources:
+        if table_name in upto and upto[table_name] is None:
+            continue
+
+        condition = '(t.modified, t.id) > (%s, %s)'
+        params.extend(watermarks[table_name])
+        if upto.get(table_name) is not None:
+            condition += ' AND (t.modified, t.id) <= (%s, %s)'
+            params.extend(upto[table_name])
+
+        if table_name == FILM_WORK:
+            subqueries.append(f'SELECT t.id FROM content.{FILM_WORK} as t WHERE {condition}')
+        else:
+            subqueries.append(f"""SELECT l.film_work_id as id
+                FROM content.{table_name}_film_work as l
+                JOIN content.{table_name} as t ON t.id = l.{table_name}_id
+                WHERE {condition}""")
+
+    if not subqueries:
+        return None, []
+
+    query = f"""SELECT id
+                FROM ({' UNION '.join(subqueries)}) as changed
+                WHERE id > %s
+                ORDER BY id;"""
+    return query, [*params, after]
+
+
+# id фильмов из записей журнала и фильмов, связанных с изменёнными в журнале жанрами и персонами.
+CHANGELOG_FILMS_QUERY = f"""SELECT id
+                FROM (
+                    SELECT unnest(%s::uuid[]) as id
+                    UNION SELECT film_work_id FROM content.{GENRE_FILM_WORK} WHERE genre_id = ANY(%s::uuid[])
+                    UNION SELECT film_work_id FROM content.{PERSON_FILM_WORK} WHERE person_id = ANY(%s::uuid[])
+                ) as changed
+                ORDER BY id;"""
+
+
+def split_tombstones(rows: list[dict]) -> dict[str, list]:
+    """Ключи удалённых строк по таблицам: id фильмов и персон, кортежи LINK_KEYS связей."""
+    deleted = {table_name: [] for table_name in (FILM_WORK, PERSON, *LINK_KEYS)}
+
+    for row in rows:
+        table_name = row['table_name']
+        if table_name in LINK_KEYS:
+            deleted[table_name].append(tuple(row[column] for column in LINK_KEYS[table_name]))
+        elif table_name in deleted:
+            deleted[table_name].append(row[f'{table_name}_id'])
+
+    return deleted
+
+
+def deletion_changes(deleted: dict[str, set]) -> Tuple[dict, dict]:
+    """
+    Изменения документов по удалённым связям: {id фильма: {persons, genres}} для
+    вложенных списков фильмов и {id персоны: {id фильма: [роли]}} для фильмов персон.
+    Связи удалённых фильмов и персон пропускаются, их документы удаляются целиком.
+    """
+    movie_links, person_films = {}, {}
+
+    def links_of(film_id) -> dict:
+        return movie_links.setdefault(str(film_id), {'persons': [], 'genres': []})
+
+    for film_id, person_id, role in deleted[PERSON_FILM_WORK]:
+        field = f'{role}s'
+        if film_id not in deleted[FILM_WORK] and field in PERSON_ROLES:
+            links_of(film_id)['persons'].append({'id': str(person_id), 'role': field})
+        if person_id not in deleted[PERSON]:
+            person_films.setdefault(str(person_id), {}).setdefault(str(film_id), []).append(role)
+
+    for film_id, genre_id in deleted[GENRE_FILM_WORK]:
+        if film_id not in deleted[FILM_WORK]:
+            links_of(film_id)['genres'].append(str(genre_id))
+
+    return movie_links, person_films
+
 
 class PostgresExtractor:
     """Получение данных из Postgres, преобразование во внутренний формат, передача в Elasticsearch."""
-    def __init__(self, es_loader: ElasticsearchLoader, data_transformer: DataTransform):
+    def __init__(self, es_loader: ElasticsearchLoader, data_transformer: DataTransform, state=None):
         self.load_data = es_loader
         self.data_transformer = data_transformer
+        self.state = state
         self.conn = None
         self.cursor = None
         self.db = None
@@ -28,10 +284,23 @@ class PostgresExtractor:
         self.password = None
         self.host = None
         self.port = None
+        self.extract_mode = None
+        self.batch_size = None
+        self.pipeline = None
+        self.pipeline_queue_size = None
+        self.aggregate_in_db = None
+        self.change_source = None
+        self.related_changes = None
+        self.backfill_extract = None
+        self.copy_block_size = None
+        self.document_format = None
+        self.transform_workers = None
+        self._transform_pool = None
         self.logger = logging.getLogger('postgres')
 
         self.init_env()
         self.set_connection_cursor()
+        self.apply_migrations()
 
     @staticmethod
     def get_placeholders(data: list[str]) -> str:
@@ -50,15 +319,18 @@ class PostgresExtractor:
 
         return connection
 
-    def set_connection_cursor(self):
-        dsn = {
+    @property
+    def dsn(self) -> dict:
+        return {
             'dbname': self.db,
             'user': self.user,
             'password': self.password,
             'host': self.host,
             'port': self.port
         }
-        self.conn = self.make_db_connection(dsn)
+
+    def set_connection_cursor(self):
+        self.conn = self.make_db_connection(self.dsn)
         self.cursor = self.conn.cursor()
 
     def init_env(self):
@@ -70,8 +342,485 @@ class PostgresExtractor:
         self.host = settings.db_host
         self.port = settings.db_port
 
+        etl_settings = EtlSettings()
+
+        self.extract_mode = etl_settings.extract_mode
+        self.batch_size = etl_settings.batch_size
+        self.pipeline = etl_settings.pipeline
+        self.pipeline_queue_size = etl_settings.pipeline_queue_size
+        self.aggregate_in_db = etl_settings.aggregate_in_db
+        self.change_source = etl_settings.change_source
+        self.related_changes = etl_settings.related_changes
+        self.backfill_extract = etl_settings.backfill_extract
+        self.copy_block_size = etl_settings.copy_block_size
+        self.document_format = etl_settings.document_format
+        self.transform_workers = etl_settings.transform_workers
+
+    @property
+    def transform_pool(self) -> Optional[TransformPool]:
+        """Пул процессов для преобразования, создаётся при первой загрузке, если ETL_TRANSFORM_WORKERS > 0."""
+        if self._transform_pool is None and self.transform_workers:
+            self._transform_pool = TransformPool(self.transform_workers, self.document_format)
+        return self._transform_pool
+
+    def close_transform_pool(self) -> None:
+        """Остановить процессы пула преобразования, если он создавался."""
+        if self._transform_pool is not None:
+            self._transform_pool.close()
+            self._transform_pool = None
+
+    @property
+    def films_info_query(self) -> str:
+        return FILMS_AGGREGATED_QUERY if self.aggregate_in_db else FILMS_INFO_QUERY
+
+    @property
+    def persons_info_query(self) -> str:
+        return PERSONS_AGGREGATED_QUERY if self.aggregate_in_db else PERSONS_INFO_QUERY
+
+    def apply_migrations(self) -> None:
+        """
+        Применить ещё не применённые SQL-миграции ETL. Надгробия удалений (sync_deletions)
+        нужны в любом режиме, журнал изменений и уведомления - только с ETL_CHANGE_SOURCE=changelog.
+        """
+        directories = [MIGRATIONS_DIR]
+        if self.change_source == 'changelog':
+            directories.append(CHANGELOG_MIGRATIONS_DIR)
+
+        # Экземпляры ETL, запущенные одновременно, применяют миграции по очереди.
+        self.cursor.execute('SELECT pg_advisory_xact_lock(%s);', (MIGRATIONS_LOCK_ID,))
+        self.cursor.execute("""
+                            CREATE TABLE IF NOT EXISTS content.etl_migration (
+                                name text PRIMARY KEY,
+                                applied_at timestamp with time zone NOT NULL DEFAULT now()
+                            );
+                            """)
+        self.cursor.execute('SELECT name FROM content.etl_migration;')
+        applied = {row['name'] for row in self.cursor.fetchall()}
+
+        migrations = sorted(
+            (file_name, directory)
+            for directory in directories
+            for file_name in os.listdir(directory)
+            if file_name.endswith('.sql')
+        )
+        for file_name, directory in migrations:
+            if file_name in applied:
+                continue
+
+            self.logger.info(f'Applying migration {file_name}')
+            with open(os.path.join(directory, file_name), 'r') as f:
+                self.cursor.execute(f.read())
+            self.cursor.execute('INSERT INTO content.etl_migration (name) VALUES (%s);', (file_name,))
+
+        self.conn.commit()
+
+    def fetch_changes_from_changelog(self) -> None:
+        """
+        Загрузка изменений из журнала etl_changelog, который заполняют триггеры.
+
+        Стоимость цикла пропорциональна числу изменений, а не размеру таблиц; учитываются
+        и изменения связующих таблиц. Журнал читается порциями по batch_size записей,
+        записи порции удаляются в той же транзакции после загрузки её документов, поэтому
+        запись, закоммиченная позже записей с большим id, не теряется, а в памяти
+        не копятся id всего журнала.
+
+        С ETL_RELATED_CHANGES=patch изменённые жанры и персоны правятся в документах
+        фильмов на месте, а не через повторное извлечение их фильмов.
+        """
+        self.logger.info(f'Fetch changes from "{CHANGELOG}"')
+        query = f"""
+                SELECT id, table_name, film_work_id, person_id, genre_id
+                FROM content.{CHANGELOG}
+                ORDER BY id
+                LIMIT %s;
+                """
+        total = 0
+
+        while True:
+            self.cursor.execute(query, (self.batch_size,))
+            rows = self.cursor.fetchall()
+
+            if not rows:
+                break
+
+            total += len(rows)
+            self.load_changelog_rows(rows)
+
+            ensure_lease()
+            self.cursor.execute(f'DELETE FROM content.{CHANGELOG} WHERE id = ANY(%s);', ([row['id'] for row in rows],))
+            self.conn.commit()
+
+            if len(rows) < self.batch_size:
+                break
+
+        if not total:
+            self.logger.info('There are no modifications.')
+
+    def load_changelog_rows(self, rows: list[dict]) -> None:
+        """Загрузить фильмы и персоны, затронутые порцией записей журнала."""
+        films_id, persons_id = set(), set()
+        related = {GENRE: set(), PERSON: set()}
+
+        for row in rows:
+            if row['film_work_id'] is not None:
+                films_id.add(row['film_work_id'])
+            if row['person_id'] is not None:
+                persons_id.add(row['person_id'])
+            if row['table_name'] in related:
+                related[row['table_name']].add(row[f'{row["table_name"]}_id'])
+
+        self.logger.info(f'{len(rows)} changes: {len(films_id)} films, {len(persons_id)} persons')
+
+        if self.related_changes == 'patch':
+            for table_name, changed_rows_id in related.items():
+                if changed_rows_id:
+                    self.patch_movies(table_name, sorted(changed_rows_id))
+            related = {GENRE: set(), PERSON: set()}
+
+        if films_id or related[GENRE] or related[PERSON]:
+            params = (sorted(films_id), sorted(related[GENRE]), sorted(related[PERSON]))
+            films_id_batches = self.iter_films_id('changelog_films_ids', CHANGELOG_FILMS_QUERY, params)
+            self.load_movies(self.iter_films_info_batches(films_id_batches))
+        if persons_id:
+            self.load_persons_by_ids(sorted(persons_id))
+
+    def movies_checkpoint(self, default_watermark: Optional[str] = None) -> EntityCheckpoint:
+        return EntityCheckpoint(self.state, 'movies', default_watermark)
+
+    def persons_checkpoint(self, default_watermark: Optional[str] = None) -> EntityCheckpoint:
+        return EntityCheckpoint(self.state, 'persons', default_watermark)
+
+    def is_synced(self) -> bool:
+        """Начальная загрузка по modified завершена и не прервана."""
+        return self.movies_checkpoint().is_synced and self.persons_checkpoint().is_synced
+
+    def sync_movies(self, default_watermark: Optional[str] = None) -> None:
+        """
+        Инкрементальная загрузка фильмов с контрольными точками.
+
+        Перед проходом фиксируются верхние границы (modified, id) таблиц-источников,
+        затем фильмы, изменённые между сохранёнными и новыми границами, загружаются
+        в порядке id порциями по batch_size. После индексации каждой порции её последний
+        id сохраняется в состоянии: прерванный проход продолжается с первой недогруженной
+        порции, а не с начала.
+
+        С ETL_RELATED_CHANGES=patch изменения жанров и персон (у них меняются только имена
+        и описания) правятся в документах фильмов на месте, а целиком пересобираются
+        только фильмы, изменённые сами.
+        """
+        checkpoint = self.movies_checkpoint(default_watermark)
+
+        if checkpoint.cycle is None:
+            checkpoint.open_cycle(self.get_upper_bounds(MOVIES_SOURCES))
+        else:
+            self.logger.info(f'Resuming films sync after {checkpoint.cycle["loaded"]}')
+
+        watermarks = {table_name: checkpoint.watermark(table_name) for table_name in MOVIES_SOURCES}
+        sources = MOVIES_SOURCES
+
+        if self.related_changes == 'patch':
+            for table_name in (GENRE, PERSON):
+                self.patch_modified_rows(table_name, watermarks[table_name], checkpoint.cycle['upto'][table_name])
+            sources = (FILM_WORK,)
+
+        self.logger.info(f'Collecting films changed through {", ".join(f"{name!r}" for name in sources)}')
+        loaded = checkpoint.cycle['loaded']
+        films_id_batches = self.iter_changed_films_id(
+            watermarks, checkpoint.cycle['upto'], sources, uuid.UUID(loaded) if loaded is not None else None
+        )
+        self.load_movies(self.iter_films_info_batches(films_id_batches, checkpoint.mark_loaded))
+
+        checkpoint.close_cycle()
+
+    def sync_persons(self, default_watermark: Optional[str] = None) -> None:
+        """
+        Инкрементальная загрузка персон с контрольными точками: после индексации каждой
+        порции keyset-пагинации в состоянии сохраняется её последний (modified, id).
+        """
+        self.logger.info('Fetch from "person" if data modified')
+        checkpoint = self.persons_checkpoint(default_watermark)
+
+        # Прерванная параллельная загрузка: персоны догружаются от водяного знака.
+        if checkpoint.cycle is not None:
+            checkpoint.drop_cycle()
+
+        def batches() -> Iterator[Union[list[dict], Checkpoint]]:
+            for rows in self.iter_modified_rows(PERSON, checkpoint.watermark(PERSON)):
+                yield from self.iter_persons_info([row['id'] for row in rows])
+                yield Checkpoint(partial(checkpoint.advance, PERSON, row_key(rows[-1])))
+
+        self.load_persons(batches())
+
+    def sync_genres(self) -> None:
+        """
+        Синхронизация индекса жанров: все жанры с числом фильмов загружаются заново,
+        а жанры, удалённые из Postgres, удаляются из индекса. С ETL_SKIP_UNCHANGED
+        неизменившиеся жанры в Elasticsearch не отправляются.
+        """
+        self.logger.info('Fetch all genres')
+        self.cursor.execute(GENRES_QUERY)
+        rows = self.cursor.fetchall()
+
+        documents = self.data_transformer.transform_genres(rows)
+        if documents:
+            self.load_data.index_genres(documents)
+        self.load_data.delete_missing(self.load_data.genres_index_name, [str(row['id']) for row in rows])
+
+    def sync_deletions(self) -> None:
+        """
+        Перенос удалений в Elasticsearch по надгробиям etl_tombstone, которые пишет триггер
+        на удаление. Документы удалённых фильмов и персон удаляются bulk-операциями delete,
+        удалённые связи убираются из вложенных списков фильмов и персон на месте, без
+        полной переиндексации. Надгробия удаляются после обработки каждой порции.
+        """
+        while True:
+            self.cursor.execute(TOMBSTONES_QUERY, (self.batch_size,))
+            rows = self.cursor.fetchall()
+
+            if not rows:
+                break
+
+            self.logger.info(f'Fetched {len(rows)} rows from "{TOMBSTONE}"')
+            self.apply_deletions(split_tombstones(rows))
+
+            ensure_lease()
+            self.cursor.execute(f'DELETE FROM content.{TOMBSTONE} WHERE id = ANY(%s);', ([row['id'] for row in rows],))
+            self.conn.commit()
+
+            if len(rows) < self.batch_size:
+                break
+
+    def apply_deletions(self, deleted: dict[str, list]) -> None:
+        # Строку могли удалить и вставить заново с тем же ключом: такие надгробия пропускаются.
+        deleted = {table_name: self.filter_deleted(table_name, keys) for table_name, keys in deleted.items()}
+
+        if deleted[FILM_WORK]:
+            self.load_data.delete_documents(self.load_data.index_name, sorted(map(str, deleted[FILM_WORK])))
+        if deleted[PERSON]:
+            self.load_data.delete_documents(self.load_data.persons_index_name, sorted(map(str, deleted[PERSON])))
+
+        # Удалённые жанры убирает из индекса жанров sync_genres.
+        movie_links, person_films = deletion_changes(deleted)
+        if movie_links:
+            self.load_data.remove_movie_links(movie_links)
+        if person_films:
+            self.load_data.remove_person_films(person_films)
+
+    def filter_deleted(self, table_name, keys: list) -> set:
+        """Оставить ключи строк, которых в таблице действительно нет."""
+        if not keys:
+            return set()
+
+        params = (list(keys),) if table_name not in LINK_KEYS else tuple(map(list, zip(*keys)))
+        self.cursor.execute(existing_query(table_name), params)
+        existing = {tuple(row.values()) if table_name in LINK_KEYS else row['id'] for row in self.cursor.fetchall()}
+
+        return set(keys) - existing
+
+    def get_upper_bounds(self, tables: Iterable[str]) -> dict[str, Optional[RowKey]]:
+        return {table_name: self.get_upper_bound(table_name) for table_name in tables}
+
+    def get_upper_bound(self, table_name) -> Optional[RowKey]:
+        """Последний по (modified, id) ключ таблицы или None, если таблица пуста."""
+        query = f"""
+                SELECT id, modified
+                FROM content.{table_name}
+                WHERE modified IS NOT NULL
+                ORDER BY modified DESC, id DESC
+                LIMIT 1;
+                """
+        self.cursor.execute(query)
+        row = self.cursor.fetchone()
+        return row_key(row) if row else None
+
+    def fetch_changed_movies(self, last_updated) -> None:
+        """
+        Загрузка всех фильмов, затронутых изменениями жанров, персон и самих фильмов,
+        за один проход: фильм, изменённый сразу через несколько источников, извлекается
+        и индексируется один раз за цикл.
+        """
+        self.logger.info('Collecting films changed through "genre", "person" and "film_work"')
+        films_id_batches = self.iter_changed_films_id(
+            {table_name: (last_updated, MAX_UUID) for table_name in MOVIES_SOURCES}
+        )
+        self.load_movies(self.iter_films_info_batches(films_id_batches))
+
+    def iter_changed_films_id(
+            self, watermarks: dict, upto: Optional[dict] = None, sources: Iterable[str] = MOVIES_SOURCES,
+            after: Optional[uuid.UUID] = None
+    ) -> Iterator[list]:
+        """
+        Отдаёт по возрастанию порциями по batch_size id фильмов, изменённых напрямую или
+        через связанные жанры и персоны, с id больше after, см. changed_films_query.
+        """
+        query, params = changed_films_query(watermarks, upto or {}, sources, after or uuid.UUID(int=0))
+        total = 0
+
+        if query is not None:
+            for films_id in self.iter_films_id('changed_films_ids', query, params):
+                total += len(films_id)
+                yield films_id
+
+        self.logger.info(f'Changed films: {total} distinct' if total else 'There are no modifications.')
+
+    def iter_films_id(self, name: str, query: str, params) -> Iterator[list]:
+        """Отдаёт id фильмов из запроса через серверный курсор порциями по batch_size."""
+        with self.conn.cursor(name=name) as cursor:
+            cursor.execute(query, params)
+
+            for chunk in self.iter_cursor_chunks(cursor):
+                yield [row['id'] for row in chunk]
+
+    def patch_modified_rows(self, table_name, after: tuple, upto: Optional[tuple]) -> None:
+        """Поправить в фильмах жанры или персоны с ключом (modified, id) в интервале (after, upto]."""
+        if upto is None:
+            return
+
+        for rows in self.iter_modified_rows(table_name, after, upto):
+            self.patch_movies(table_name, [row['id'] for row in rows])
+
+    def patch_movies(self, table_name, changed_rows_id: list) -> None:
+        """
+        Записать новые имена персон или название и описание жанров в документы их фильмов
+        на месте (_update_by_query), без повторного извлечения фильмов из Postgres.
+        """
+        if table_name == PERSON:
+            self.cursor.execute('SELECT id, full_name FROM content.person WHERE id = ANY(%s);', (changed_rows_id,))
+            names = {str(row['id']): row['full_name'] for row in self.cursor.fetchall()}
+            if names:
+                self.load_data.rename_persons_in_movies(names)
+            return
+
+        self.cursor.execute('SELECT id, name, description FROM content.genre WHERE id = ANY(%s);', (changed_rows_id,))
+        genres = {str(row['id']): {'name': row['name'], 'description': row['description']}
+                  for row in self.cursor.fetchall()}
+        if genres:
+            self.load_data.rename_genres_in_movies(genres)
+
+    def split_batches(self, ids: list) -> Iterator[list]:
+        return (ids[i:i + self.batch_size] for i in range(0, len(ids), self.batch_size))
+
+    def fetch_all_movies(self) -> None:
+        """Загрузка всех фильмов, используется при полной переиндексации."""
+        self.logger.info('Fetching all films')
+
+        if self.backfill_extract == 'copy':
+            self.copy_range(FILM_WORK, uuid.UUID(int=0), MAX_UUID)
+            return
+
+        self.load_movies(self.iter_films_info_batches(self.iter_all_ids(FILM_WORK)))
+
+    def fetch_all_persons(self) -> None:
+        """Загрузка всех персон, используется при полной переиндексации."""
+        self.logger.info('Fetching all persons')
+
+        if self.backfill_extract == 'copy':
+            self.copy_range(PERSON, uuid.UUID(int=0), MAX_UUID)
+            return
+
+        self.load_persons(self.iter_persons_info_batches(self.iter_all_ids(PERSON)))
+
+    def backfill_range(self, table_name, after: uuid.UUID, upto: uuid.UUID) -> None:
+        """
+        Загрузка всех фильмов или персон с id из диапазона (after, upto].
+
+        Используется воркерами параллельной загрузки: прогресс диапазона хранится
+        в собственном состоянии и сохраняется после каждой проиндексированной порции,
+        поэтому перезапущенный воркер продолжает с того же места.
+        """
+        progress = self.state.get_state('backfill') or {'after': str(after), 'done': False}
+        if progress['done']:
+            self.logger.info(f'Range ({after}, {upto}] of "{table_name}" is already loaded')
+            return
+
+        def save_progress(last_id) -> None:
+            self.state.set_state('backfill', {'after': str(last_id), 'done': False})
+
+        if self.backfill_extract == 'copy':
+            self.copy_range(table_name, uuid.UUID(progress['after']), upto, save_progress)
+            self.state.set_state('backfill', {'after': str(upto), 'done': True})
+            return
+
+        ids_batches = self.iter_all_ids(table_name, uuid.UUID(progress['after']), upto)
+        if table_name == FILM_WORK:
+            self.load_movies(self.iter_films_info_batches(ids_batches, save_progress))
+        else:
+            self.load_persons(self.iter_persons_info_batches(ids_batches, save_progress))
+
+        self.state.set_state('backfill', {'after': str(upto), 'done': True})
+
+    def copy_range(self, table_name, after: uuid.UUID, upto: uuid.UUID, on_block_loaded=None) -> None:
+        """
+        Полная загрузка фильмов или персон с id из диапазона (after, upto] через COPY.
+
+        Документы собираются запросами с агрегацией в Postgres и читаются блоками
+        по copy_block_size; on_block_loaded вызывается с последним id блока, когда
+        блок уже проиндексирован.
+        """
+        query, id_key, condition = COPY_SOURCES[table_name]
+        query = COPY_DOCUMENTS_QUERY.format(query=query.format(condition=condition).rstrip().rstrip(';'))
+
+        def blocks() -> Iterator[Union[list[dict], Checkpoint]]:
+            for documents in self.iter_copy_documents(query, (after, upto)):
+                yield documents
+
+                if on_block_loaded is not None:
+                    yield Checkpoint(partial(on_block_loaded, documents[-1][id_key]))
+
+        if self.transform_pool is not None:
+            if table_name == FILM_WORK:
+                self.run_pooled_load(MOVIES, blocks(), True, self.load_data.index_name)
+            else:
+                self.run_pooled_load(PERSONS, blocks(), True, self.load_data.persons_index_name)
+        elif table_name == FILM_WORK:
+            self.run_load('movies', blocks(), self.data_transformer.transform_aggregated_movies, None,
+                          self.load_data.index_documents)
+        else:
+            self.run_load('persons', blocks(), self.data_transformer.transform_aggregated_persons, None,
+                          self.load_data.index_persons)
+
+    def iter_copy_documents(self, query: str, params: tuple) -> Iterator[list[dict]]:
+        """Отдаёт результат COPY ... TO STDOUT из одной JSON-колонки блоками по copy_block_size строк."""
+        with self.conn.cursor() as cursor, cursor.copy(query, params) as copy:
+            block, rows = [], 0
+
+            for data in copy:
+                data = bytes(data)
+                block.append(data)
+                rows += data.count(b'\n')
+
+                if rows >= self.copy_block_size:
+                    yield self.decode_copy_block(b''.join(block))
+                    block, rows = [], 0
+
+            if block:
+                yield self.decode_copy_block(b''.join(block))
+
+    @staticmethod
+    def decode_copy_block(data: bytes) -> list[dict]:
+        """
+        Разбирает блок строк COPY в текстовом формате, по одному JSON-документу в строке.
+        Управляющих символов в JSON нет, поэтому из экранирования COPY остаётся только
+        удвоенная обратная косая черта, а весь блок разбирается одним вызовом json.loads.
+        """
+        lines = data.replace(b'\\\\', b'\\').rstrip(b'\n').replace(b'\n', b',')
+        return json.loads(b'[' + lines + b']')
+
+    def load_persons_by_ids(self, persons_id: list) -> None:
+        self.load_persons(self.iter_persons_info_batches(self.split_batches(persons_id)))
+
     def fetch_movies_if_genres_changed(self, last_updated):
         self.logger.info('Fetch from "genre" if data modified')
+
+        if self.related_changes == 'patch':
+            for changed_rows_id in self.iter_modified_ids(last_updated, GENRE):
+                self.patch_movies(GENRE, changed_rows_id)
+            return
+
+        if self.extract_mode == 'stream':
+            self.stream_movies_by_related_changes(last_updated, GENRE)
+            return
+
         genres_info = self.check_if_data_modified(last_updated, GENRE)
 
         if genres_info is None:
@@ -85,6 +834,15 @@ class PostgresExtractor:
     def fetch_movies_if_persons_changed(self, last_updated):
         self.logger.info('Fetch from "person" if data modified')
 
+        if self.related_changes == 'patch':
+            for changed_rows_id in self.iter_modified_ids(last_updated, PERSON):
+                self.patch_movies(PERSON, changed_rows_id)
+            return
+
+        if self.extract_mode == 'stream':
+            self.stream_movies_by_related_changes(last_updated, PERSON)
+            return
+
         persons_info = self.check_if_data_modified(last_updated, PERSON)
 
         if persons_info is None:
@@ -98,6 +856,10 @@ class PostgresExtractor:
     def fetch_movies_if_films_changed(self, last_updated):
         self.logger.info('Fetch from "film_work" if data modified')
 
+        if self.extract_mode == 'stream':
+            self.load_movies(self.iter_films_info_batches(self.iter_modified_ids(last_updated, FILM_WORK)))
+            return
+
         films_info = self.check_if_data_modified(last_updated, FILM_WORK)
 
         if films_info is None:
@@ -108,8 +870,17 @@ class PostgresExtractor:
         self.get_all_films_info(films_info[0], films_info[1])
 
     def fetch_persons_if_persons_changed(self, last_updated):
+        """
+        Загрузка изменённых персон в индекс персон. ETL_RELATED_CHANGES=patch правит на месте
+        только документы фильмов (fetch_movies_if_persons_changed), документы персон
+        всегда пересобираются из Postgres.
+        """
         self.logger.info('Fetch from "person" if data modified')
 
+        if self.extract_mode == 'stream':
+            self.load_persons(self.iter_persons_info_batches(self.iter_modified_ids(last_updated, PERSON)))
+            return
+
         persons_info = self.check_if_data_modified(last_updated, PERSON)
 
         if persons_info is None:
@@ -153,56 +924,262 @@ class PostgresExtractor:
 
     def get_all_films_info(self, films_id, film_placeholders) -> None:
         self.logger.info('Fetching all films information')
-        query = f"""SELECT
-                        fw.id as fw_id, 
-                        fw.title, 
-                        fw.description, 
-                        fw.rating, 
-                        fw.type, 
-                        fw.creation_date, 
-                        fw.file_path, 
-                        pfw.role, 
-                        p.id, 
-                        p.full_name,
-                        g.name,
-                        g.id as g_id,
-                        g.description as g_description
-                    FROM content.film_work as fw
-                    LEFT JOIN content.person_film_work as pfw ON pfw.film_work_id = fw.id
-                    LEFT JOIN content.person as p ON p.id = pfw.person_id
-                    LEFT JOIN content.genre_film_work as gfw ON gfw.film_work_id = fw.id
-                    LEFT JOIN content.genre as g ON g.id = gfw.genre_id
-                    WHERE fw.id IN ({film_placeholders})
-                    ORDER BY fw_id;"""
+        query = self.films_info_query.format(condition=f'fw.id IN ({film_placeholders})')
         self.cursor.execute(query, films_id)
+        self.load_movies(self.iter_cursor_chunks(self.cursor))
 
+    def get_all_persons_info(self, persons_id: list, persons_placeholders: str):
+        self.logger.info('Fetching all persons information')
+        query = self.persons_info_query.format(condition=f'p.id IN ({persons_placeholders})')
+        self.cursor.execute(query, persons_id)
+        self.load_persons(self.iter_cursor_chunks(self.cursor))
+
+    def iter_cursor_chunks(self, cursor) -> Iterator[list[dict]]:
+        """Отдаёт результат запроса порциями по batch_size строк."""
         while True:
-            changed_films_chunk = self.cursor.fetchmany(1000)
+            chunk = cursor.fetchmany(self.batch_size)
 
-            if not changed_films_chunk:
+            if not chunk:
                 break
 
-            data_to_load = self.data_transformer.transform_movies_pgdata_to_esdata(raw_data=changed_films_chunk)
-            self.load_data.index_documents(data_to_load)
+            yield chunk
 
-    def get_all_persons_info(self, persons_id: list, persons_placeholders: str):
-        self.logger.info('Fetching all persons information')
-        query = f"""SELECT
-                    p.id as person_id, 
-                    p.full_name,
-                    pfw.role, 
-                    pfw.film_work_id as film_id
-                FROM content.person as p
-                JOIN content.person_film_work as pfw ON pfw.person_id = p.id
-                WHERE p.id IN ({persons_placeholders})
-                ORDER BY person_id;"""
-        self.cursor.execute(query, persons_id)
+    def load_movies(self, chunks: Iterable[list[dict]]) -> None:
+        if self.transform_pool is not None:
+            self.run_pooled_load(MOVIES, chunks, self.aggregate_in_db, self.load_data.index_name)
+            return
+
+        if self.aggregate_in_db:
+            transform = self.data_transformer.transform_aggregated_movies
+            self.run_load('movies', chunks, transform, None, self.load_data.index_documents)
+            return
+
+        accumulator = self.data_transformer.movies_accumulator()
+        self.run_load('movies', chunks, accumulator.feed, accumulator.flush, self.load_data.index_documents)
+
+    def load_persons(self, chunks: Iterable[list[dict]]) -> None:
+        if self.transform_pool is not None:
+            self.run_pooled_load(PERSONS, chunks, self.aggregate_in_db, self.load_data.persons_index_name)
+            return
+
+        if self.aggregate_in_db:
+            transform = self.data_transformer.transform_aggregated_persons
+            self.run_load('persons', chunks, transform, None, self.load_data.index_persons)
+            return
+
+        accumulator = self.data_transformer.persons_accumulator()
+        self.run_load('persons', chunks, accumulator.feed, accumulator.flush, self.load_data.index_persons)
+
+    def run_load(self, name: str, chunks: Iterable[list[dict]], transform, flush, load) -> None:
+        """
+        Преобразование и загрузка порций данных.
+
+        transform получает порции строк и возвращает готовые документы, необязательный
+        flush отдаёт документ, оставшийся незавершённым после последней порции.
+        Среди порций могут быть маркеры Checkpoint: их commit вызывается, когда все
+        документы, извлечённые до маркера, уже загружены. Если порция не загрузилась
+        (load выбросил BulkLoadError), исключение пробрасывается и следующие маркеры
+        не фиксируются: после перезапуска загрузка продолжится с этой порции.
+        При ETL_PIPELINE=true извлечение, преобразование и индексация выполняются
+        параллельно в отдельных потоках конвейера.
+        """
+        if self.pipeline:
+            stages = [Stage('transform', transform, flush), Stage('load', load)]
+            Pipeline(name, stages, self.pipeline_queue_size).run(chunks)
+            return
+
+        for chunk in chunks:
+            if isinstance(chunk, Checkpoint):
+                documents = flush() if flush is not None else None
+                if documents:
+                    load(documents)
+                chunk.commit()
+                continue
+
+            documents = transform(chunk)
+            if documents:
+                load(documents)
+
+        documents = flush() if flush is not None else None
+        if documents:
+            load(documents)
+
+    def run_pooled_load(self, name: str, chunks: Iterable[list[dict]], aggregated: bool, alias: str) -> None:
+        """
+        Загрузка с преобразованием в пуле процессов: стадия transform отдаёт порции воркерам
+        и передаёт дальше Future, стадия load дожидается готовых тел документов по порядку
+        и отправляет их в Elasticsearch.
+
+        Без конвейера Future и маркеры Checkpoint копятся в окне: пока в работе не больше
+        transform_workers порций, следующие порции отдаются воркерам, не дожидаясь загрузки.
+        Маркер фиксируется, когда загружены все порции перед ним.
+        """
+        transform = self.transform_pool.transform(name, aggregated)
+
+        def load(future) -> None:
+            self.load_data.bulk_index_bodies(alias, future.result())
+
+        if self.pipeline:
+            self.run_load(name, chunks, transform.feed, transform.flush, load)
+            return
+
+        window: deque[Union[Future, Checkpoint]] = deque()
+        in_flight = 0
+
+        def drain(limit: int) -> None:
+            nonlocal in_flight
+            while window and (isinstance(window[0], Checkpoint) or in_flight > limit):
+                item = window.popleft()
+                if isinstance(item, Checkpoint):
+                    item.commit()
+                    continue
+                in_flight -= 1
+                load(item)
+
+        try:
+            for chunk in chunks:
+                is_checkpoint = isinstance(chunk, Checkpoint)
+                future = transform.flush() if is_checkpoint else transform.feed(chunk)
+                if future is not None:
+                    window.append(future)
+                    in_flight += 1
+                if is_checkpoint:
+                    window.append(chunk)
+                drain(self.transform_workers)
+
+            future = transform.flush()
+            if future is not None:
+                window.append(future)
+                in_flight += 1
+            drain(0)
+        except BaseException:
+            # Порции после незагруженной не нужны: их повторит следующий цикл.
+            for item in window:
+                if isinstance(item, Future):
+                    item.cancel()
+            raise
+
+    def stream_movies_by_related_changes(self, last_updated, table_name) -> None:
+        """Потоковая загрузка фильмов, связанных с изменёнными жанрами или персонами."""
+        self.load_movies(
+            self.iter_films_info_batches(
+                films_id
+                for changed_rows_id in self.iter_modified_ids(last_updated, table_name)
+                for films_id in self.iter_changed_filmworks_id(table_name, changed_rows_id)
+            )
+        )
+
+    def iter_modified_ids(self, last_updated, table_name) -> Iterator[list]:
+        """Отдаёт id записей, изменённых после last_updated, порциями не больше batch_size."""
+        for rows in self.iter_modified_rows(table_name, (last_updated, MAX_UUID)):
+            yield [row['id'] for row in rows]
+
+    def iter_modified_rows(self, table_name, after: tuple, upto: Optional[tuple] = None) -> Iterator[list[dict]]:
+        """
+        Отдаёт (id, modified) записей с ключом (modified, id) в интервале (after, upto]
+        порциями не больше batch_size.
+
+        Используется keyset-пагинация по (modified, id), поэтому размер запроса
+        и потребление памяти не зависят от числа изменений.
+        """
+        upper_condition = 'AND (modified, id) <= (%s, %s)' if upto is not None else ''
+        query = f"""
+                SELECT id, modified
+                FROM content.{table_name}
+                WHERE (modified, id) > (%s, %s) {upper_condition}
+                ORDER BY modified, id
+                LIMIT %s;
+                """
+        last_modified, last_id = after
 
         while True:
-            changed_films_chunk = self.cursor.fetchmany(1000)
+            upper_params = tuple(upto) if upto is not None else ()
+            self.cursor.execute(query, (last_modified, last_id, *upper_params, self.batch_size))
+            changed_rows = self.cursor.fetchall()
 
-            if not changed_films_chunk:
+            if not changed_rows:
                 break
 
-            data_to_load = self.data_transformer.transform_persons_pgdata_to_esdata(raw_data=changed_films_chunk)
-            self.load_data.index_persons(data_to_load)
+            self.logger.info(f'Fetched {len(changed_rows)} modified rows from "{table_name}"')
+            yield changed_rows
+
+            if len(changed_rows) < self.batch_size:
+                break
+
+            last_modified, last_id = changed_rows[-1]['modified'], changed_rows[-1]['id']
+
+    def iter_all_ids(self, table_name, after=None, upto=None) -> Iterator[list]:
+        """
+        Отдаёт id записей таблицы порциями не больше batch_size (keyset по id).
+        after и upto ограничивают диапазон: after < id <= upto.
+        """
+        upper_condition = 'AND id <= %s' if upto is not None else ''
+        query = f"""
+                SELECT id
+                FROM content.{table_name}
+                WHERE id > %s {upper_condition}
+                ORDER BY id
+                LIMIT %s;
+                """
+        last_id = after or uuid.UUID(int=0)
+        upper_params = (upto,) if upto is not None else ()
+
+        while True:
+            self.cursor.execute(query, (last_id, *upper_params, self.batch_size))
+            rows = self.cursor.fetchall()
+
+            if not rows:
+                break
+
+            yield [row['id'] for row in rows]
+
+            if len(rows) < self.batch_size:
+                break
+
+            last_id = rows[-1]['id']
+
+    def iter_changed_filmworks_id(self, table_name, changed_rows_id: list) -> Iterator[list]:
+        """Отдаёт id фильмов, связанных с изменёнными записями, через серверный курсор."""
+        query = f"""
+                SELECT DISTINCT film_work_id as id
+                FROM content.{table_name}_film_work
+                WHERE {table_name}_id = ANY(%s)
+                ORDER BY id;
+                """
+        with self.conn.cursor(name=f'{table_name}_film_work_ids') as cursor:
+            cursor.execute(query, (changed_rows_id,))
+
+            for chunk in self.iter_cursor_chunks(cursor):
+                yield [row['id'] for row in chunk]
+
+    def open_cursor(self, name: str):
+        """В режиме stream - серверный курсор, в режиме batch результат целиком передаётся клиенту."""
+        return self.conn.cursor(name=name) if self.extract_mode == 'stream' else self.conn.cursor()
+
+    def iter_films_info(self, films_id: list) -> Iterator[list[dict]]:
+        with self.open_cursor('films_info') as cursor:
+            cursor.execute(self.films_info_query.format(condition='fw.id = ANY(%s)'), (films_id,))
+            yield from self.iter_cursor_chunks(cursor)
+
+    def iter_films_info_batches(
+            self, films_id_batches: Iterable[list], on_batch_loaded=None
+    ) -> Iterator[Union[list[dict], Checkpoint]]:
+        for films_id in films_id_batches:
+            yield from self.iter_films_info(films_id)
+
+            if on_batch_loaded is not None:
+                yield Checkpoint(partial(on_batch_loaded, films_id[-1]))
+
+    def iter_persons_info(self, persons_id: list) -> Iterator[list[dict]]:
+        with self.open_cursor('persons_info') as cursor:
+            cursor.execute(self.persons_info_query.format(condition='p.id = ANY(%s)'), (persons_id,))
+            yield from self.iter_cursor_chunks(cursor)
+
+    def iter_persons_info_batches(
+            self, persons_id_batches: Iterable[list], on_batch_loaded=None
+    ) -> Iterator[Union[list[dict], Checkpoint]]:
+        for persons_id in persons_id_batches:
+            yield from self.iter_persons_info(persons_id)
+
+            if on_batch_loaded is not None:
+                yield Checkpoint(partial(on_batch_loaded, persons_id[-1]))
@@ -0,0 +1,80 @@
+import logging
+from typing import Iterable, Optional
+
+from redis import Redis, RedisError
+from redis.asyncio import Redis as AsyncRedis
+
+from .documents import dumps
+from .settings import EtlSettings, RedisSettings
+
+# Столько id уходит в одном сообщении: большие bulk-порции публикуются несколькими сообщениями.
+MESSAGE_IDS_LIMIT = 1000
+
+logger = logging.getLogger('es')
+
+
+def invalidation_messages(index: str, ids: Iterable[str]) -> Iterable[bytes]:
+    """Сообщения {"index": алиас, "ids": [...]} для канала инвалидации кешей API."""
+    ids = list(ids)
+    for i in range(0, len(ids), MESSAGE_IDS_LIMIT):
+        yield dumps({'index': index, 'ids': ids[i:i + MESSAGE_IDS_LIMIT]})
+
+
+class InvalidationPublisher:
+    """
+    Публикует id изменённых и удалённых документов в канал Redis pub/sub
+    (ETL_PUBLISH_INVALIDATIONS): API удаляет эти документы из Redis и из кеша
+    в памяти своих воркеров. Ошибка публикации не прерывает загрузку: записи
+    кеша в худшем случае истекут по сроку жизни.
+    """
+    def __init__(self, connection: Redis, channel: str):
+        self.connection = connection
+        self.channel = channel
+
+    def publish(self, index: str, ids: Iterable[str]) -> None:
+        try:
+            for message in invalidation_messages(index, ids):
+                self.connection.publish(self.channel, message)
+        except RedisError as err:
+            logger.warning(f'Cache invalidation for {index} was not published: {err!r}')
+
+
+class AsyncInvalidationPublisher:
+    """То же для ETL_RUNTIME=async, см. InvalidationPublisher."""
+    def __init__(self, connection: AsyncRedis, channel: str):
+        self.connection = connection
+        self.channel = channel
+
+    async def publish(self, index: str, ids: Iterable[str]) -> None:
+        try:
+            for message in invalidation_messages(index, ids):
+                await self.connection.publish(self.channel, message)
+        except RedisError as err:
+            logger.warning(f'Cache invalidation for {index} was not published: {err!r}')
+
+    async def close(self) -> None:
+        await self.connection.close()
+
+
+def create_publisher() -> Optional[InvalidationPublisher]:
+    settings = EtlSettings()
+    if not settings.publish_invalidations:
+        return None
+
+    redis_settings = RedisSettings()
+    connection = Redis(
+        host=redis_settings.redis_host, port=redis_settings.redis_port, password=redis_settings.redis_password
+    )
+    return InvalidationPublisher(connection, settings.invalidation_channel)
+
+
+def create_async_publisher() -> Optional[AsyncInvalidationPublisher]:
+    settings = EtlSettings()
+    if not settings.publish_invalidations:
+        return None
+
+    redis_settings = RedisSettings()
+    connection = AsyncRedis(
+        host=redis_settings.redis_host, port=redis_settings.redis_port, password=redis_settings.redis_password
+    )
+    return AsyncInvalidationPublisher(connection, settings.invalidation_channel)
@@ -0,0 +1,77 @@
+import logging
+import select
+import time
+
+import psycopg
+
+from .backoff import backoff
+
+NOTIFY_CHANNEL = 'etl_changes'
+
+
+class ChangeListener:
+    """
+    Ожидание изменений в Postgres через LISTEN/NOTIFY.
+
+    Уведомления отправляют триггеры из миграции changelog/0002_notify.sql, в payload имя
+    изменённой таблицы. После первого уведомления слушатель ещё debounce секунд
+    собирает следующие, чтобы серия правок обработалась одним циклом ETL.
+    """
+    def __init__(self, dsn: dict, debounce: float = 2.0):
+        self.dsn = dsn
+        self.debounce = debounce
+        self.conn = None
+        self.pending = []
+        self.logger = logging.getLogger('postgres')
+
+        self.set_connection()
+
+    @backoff()
+    def make_listen_connection(self):
+        self.logger.info(f'Подключение к Postgres для LISTEN {NOTIFY_CHANNEL}...')
+
+        try:
+            connection = psycopg.connect(**self.dsn, autocommit=True)
+            connection.add_notify_handler(self.on_notify)
+            connection.execute(f'LISTEN {NOTIFY_CHANNEL};')
+            self.logger.info('Подписка на уведомления Postgres оформлена')
+        except psycopg.OperationalError:
+            connection = None
+            self.logger.exception('Ошибка подключения к Postgres!')
+
+        return connection
+
+    def set_connection(self):
+        self.conn = self.make_listen_connection()
+
+    def on_notify(self, notify: psycopg.Notify) -> None:
+        self.pending.append(notify.payload)
+
+    def wait(self, timeout: float) -> list[str]:
+        """
+        Заблокироваться до уведомления или до истечения timeout (резервный опрос).
+        Возвращает имена изменённых таблиц, пустой список означает срабатывание по таймауту.
+        """
+        deadline = time.monotonic() + timeout
+        while not self.pending and time.monotonic() < deadline:
+            self.poll(deadline - time.monotonic())
+
+        if self.pending:
+            debounce_deadline = time.monotonic() + self.debounce
+            while time.monotonic() < debounce_deadline:
+                self.poll(debounce_deadline - time.monotonic())
+
+        notifications, self.pending = self.pending, []
+        return notifications
+
+    def poll(self, timeout: float) -> None:
+        try:
+            ready, _, _ = select.select([self.conn.fileno()], [], [], max(timeout, 0))
+            if ready:
+                # Уведомления разбираются и передаются в on_notify при обработке ответа на запрос.
+                self.conn.execute('SELECT 1;')
+        except (psycopg.OperationalError, OSError):
+            self.logger.exception('Соединение LISTEN потеряно, переподключение')
+            self.set_connection()
+            # Пока соединения не было, уведомления могли быть пропущены: запускаем цикл ETL.
+            self.pending.append(NOTIFY_CHANNEL)
@@ -19,6 +19,13 @@ class Movie(BaseModel):
     writers: list[dict[str, str]]
 
 
+class Genre(BaseModel):
+    id: str
+    name: str
+    description: Optional[str]
+    films_count: int
+
+
 class Person(BaseModel):
     id: str
     full_name: str
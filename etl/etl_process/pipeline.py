@@ -0,0 +1,220 @@
+import contextvars
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Optional
+
+# Маркер конца потока данных между стадиями.
+_STOP = object()
+# Как часто заблокированная стадия проверяет, не остановлен ли конвейер.
+_POLL_INTERVAL = 0.1
+
+
+@dataclass
+class Stage:
+    """
+    Стадия конвейера: обрабатывает порцию данных и отдаёт результат следующей стадии.
+
+    flush вызывается после последней порции и перед каждой контрольной точкой
+    и позволяет stateful-стадии отдать накопленный остаток.
+    """
+    name: str
+    handler: Callable[[Any], Any]
+    flush: Optional[Callable[[], Any]] = None
+
+
+@dataclass
+class Checkpoint:
+    """
+    Маркер конца партии в потоке данных.
+
+    Проходит через все стадии по порядку: stateful-стадия перед ним отдаёт накопленный
+    остаток, а после последней стадии вызывается commit — к этому моменту все
+    документы партии уже загружены.
+    """
+    commit: Callable[[], None]
+
+
+@dataclass
+class StageStats:
+    name: str
+    batches: int = 0
+    records: int = 0
+    busy_time: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.records / self.busy_time if self.busy_time else 0.0
+
+    def __str__(self) -> str:
+        return (f'{self.name}: {self.batches} batches, {self.records} records, '
+                f'busy {self.busy_time:.2f}s, {self.throughput:.0f} records/s')
+
+
+class Pipeline:
+    """
+    Конвейер extract → transform → load.
+
+    Источник и каждая стадия работают в отдельных потоках и обмениваются данными через
+    ограниченные очереди: пока Elasticsearch индексирует одну порцию, Postgres уже отдаёт
+    следующую. Заполненная очередь блокирует предыдущую стадию (backpressure), ошибка
+    в любой стадии останавливает весь конвейер и пробрасывается из run().
+    """
+    def __init__(self, name: str, stages: list[Stage], queue_size: int = 4):
+        self.name = name
+        self.stages = stages
+        self.queue_size = queue_size
+        self.logger = logging.getLogger('main')
+
+    def run(self, source: Iterable) -> list[StageStats]:
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        stop_event = threading.Event()
+        errors = []
+        stats = [StageStats('extract')] + [StageStats(stage.name) for stage in self.stages]
+
+        # Стадии выполняются в копии контекста вызывающего потока: так в них видна аренда шарда (ensure_lease).
+        threads = [
+            threading.Thread(
+                target=contextvars.copy_context().run,
+                args=(self._produce, source, queues[0], stats[0], stop_event, errors),
+                name=f'{self.name}-extract', daemon=True
+            )
+        ]
+        for num, stage in enumerate(self.stages):
+            output = queues[num + 1] if num + 1 < len(queues) else None
+            threads.append(
+                threading.Thread(
+                    target=contextvars.copy_context().run,
+                    args=(self._consume, stage, queues[num], output, stats[num + 1], stop_event, errors),
+                    name=f'{self.name}-{stage.name}', daemon=True
+                )
+            )
+
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                thread.join()
+        except BaseException:
+            stop_event.set()
+            raise
+
+        elapsed = time.monotonic() - started
+        self.logger.info(f'[{self.name}] pipeline finished in {elapsed:.2f}s')
+        for stage_stats in stats:
+            self.logger.info(f'[{self.name}] {stage_stats}')
+
+        if errors:
+            raise errors[0]
+
+        return stats
+
+    @staticmethod
+    def _put(output: queue.Queue, item: Any, stop_event: threading.Event) -> bool:
+        while not stop_event.is_set():
+            try:
+                output.put(item, timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    @staticmethod
+    def _get(input_: queue.Queue, stop_event: threading.Event) -> Any:
+        while not stop_event.is_set():
+            try:
+                return input_.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    @staticmethod
+    def _is_empty(item: Any) -> bool:
+        return item is None or (hasattr(item, '__len__') and not len(item))
+
+    @staticmethod
+    def _count(item: Any) -> int:
+        try:
+            return len(item)
+        except TypeError:
+            return 1
+
+    def _pass_checkpoint(self, stage: Stage, checkpoint: Checkpoint, output: queue.Queue | None,
+                         stop_event: threading.Event) -> bool:
+        if stage.flush is not None:
+            result = stage.flush()
+            if output is not None and not self._is_empty(result):
+                if not self._put(output, result, stop_event):
+                    return False
+
+        if output is None:
+            checkpoint.commit()
+            return True
+
+        return self._put(output, checkpoint, stop_event)
+
+    def _produce(self, source: Iterable, output: queue.Queue, stats: StageStats,
+                 stop_event: threading.Event, errors: list) -> None:
+        iterator = iter(source)
+        try:
+            while not stop_event.is_set():
+                started = time.monotonic()
+                item = next(iterator, _STOP)
+                stats.busy_time += time.monotonic() - started
+
+                if item is _STOP:
+                    break
+
+                if not isinstance(item, Checkpoint):
+                    stats.batches += 1
+                    stats.records += self._count(item)
+                if not self._put(output, item, stop_event):
+                    break
+        except Exception as err:
+            self.logger.exception(f'[{self.name}] extract stage failed')
+            errors.append(err)
+            stop_event.set()
+        finally:
+            if hasattr(iterator, 'close'):
+                iterator.close()
+            self._put(output, _STOP, stop_event)
+
+    def _consume(self, stage: Stage, input_: queue.Queue, output: queue.Queue | None, stats: StageStats,
+                 stop_event: threading.Event, errors: list) -> None:
+        try:
+            while True:
+                item = self._get(input_, stop_event)
+
+                if item is _STOP:
+                    break
+
+                if isinstance(item, Checkpoint):
+                    if not self._pass_checkpoint(stage, item, output, stop_event):
+                        break
+                    continue
+
+                started = time.monotonic()
+                result = stage.handler(item)
+                stats.busy_time += time.monotonic() - started
+                stats.batches += 1
+                stats.records += self._count(item)
+
+                if output is not None and not self._is_empty(result):
+                    if not self._put(output, result, stop_event):
+                        break
+
+            if stage.flush is not None and not stop_event.is_set():
+                result = stage.flush()
+                if output is not None and not self._is_empty(result):
+                    self._put(output, result, stop_event)
+        except Exception as err:
+            self.logger.exception(f'[{self.name}] {stage.name} stage failed')
+            errors.append(err)
+            stop_event.set()
+        finally:
+            if output is not None:
+                self._put(output, _STOP, stop_event)
@@ -1,5 +1,8 @@
 import os
+import socket
+from typing import Literal, Optional
 
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -27,3 +30,64 @@ class ElasticsearchSettings(BaseSettings):
 
     elastic_host: str
     elastic_port: int
+
+
+class RedisSettings(BaseSettings):
+    model_config = SettingsConfigDict(extra='ignore', env_file=env_path)
+
+    redis_host: str = 'localhost'
+    redis_port: int = 6379
+    redis_password: Optional[str] = None
+
+
+class EtlSettings(BaseSettings):
+    model_config = SettingsConfigDict(extra='ignore', env_file=env_path, env_prefix='etl_')
+
+    runtime: Literal['sync', 'async'] = 'sync'
+    extract_mode: Literal['batch', 'stream'] = 'batch'
+    batch_size: int = 1000
+    pipeline: bool = False
+    pipeline_queue_size: int = 4
+    aggregate_in_db: bool = False
+    document_format: Literal['model', 'dict'] = 'model'
+    transform_workers: int = 0
+    bulk_mode: Literal['simple', 'parallel'] = 'simple'
+    bulk_chunk_size: int = 500
+    bulk_max_chunk_bytes: int = 10 * 1024 * 1024
+    bulk_workers: int = 4
+    bulk_max_retries: int = 5
+    bulk_dead_letter_path: str = 'dead_letter.ndjson'
+    skip_unchanged: bool = False
+    hash_store_path: str = 'document_hashes.json'
+    change_source: Literal['modified', 'changelog'] = 'modified'
+    related_changes: Literal['reindex', 'patch'] = 'reindex'
+    publish_invalidations: bool = False
+    invalidation_channel: str = 'cache:invalidate'
+    sync_mode: Literal['poll', 'listen'] = 'poll'
+    poll_interval: float = 3600
+    debounce_seconds: float = 2
+    backfill_workers: int = 4
+    backfill_partitions: int = 16
+    backfill_state_dir: str = 'backfill_state'
+    backfill_extract: Literal['cursor', 'copy'] = 'copy'
+    copy_block_size: int = 5000
+    state_backend: Literal['json', 'redis', 'sqlite'] = 'json'
+    state_sqlite_path: str = 'etl_state.db'
+    instance_id: str = Field(default_factory=lambda: f'{socket.gethostname()}-{os.getpid()}')
+    lease_ttl: float = 300
+
+    @model_validator(mode='after')
+    def check_sync_mode(self) -> 'EtlSettings':
+        # Уведомления и журнал изменений ставятся одними миграциями, без журнала слушать нечего.
+        if self.sync_mode == 'listen' and self.change_source != 'changelog':
+            raise ValueError('ETL_SYNC_MODE=listen requires ETL_CHANGE_SOURCE=changelog')
+        if self.runtime == 'async' and self.change_source != 'modified':
+            raise ValueError('ETL_RUNTIME=async supports only ETL_CHANGE_SOURCE=modified')
+        # Правки на месте, dead-letter файл и пул процессов есть только в синхронном режиме.
+        if self.runtime == 'async' and self.related_changes != 'reindex':
+            raise ValueError('ETL_RUNTIME=async supports only ETL_RELATED_CHANGES=reindex')
+        if self.runtime == 'async' and self.bulk_mode != 'simple':
+            raise ValueError('ETL_RUNTIME=async supports only ETL_BULK_MODE=simple')
+        if self.runtime == 'async' and self.transform_workers:
+            raise ValueError('ETL_RUNTIME=async does not support ETL_TRANSFORM_WORKERS')
+        return self
@@ -0,0 +1,52 @@
+from contextlib import nullcontext
+from typing import ContextManager, Optional
+
+from state.base_storage import BaseStorage
+from state.json_file_storage import JsonFileStorage
+from state.lease import ShardLeases
+
+from .settings import EtlSettings, RedisSettings
+
+
+def create_storage(namespace: str, file_path: str) -> BaseStorage:
+    """
+    Хранилище состояния по ETL_STATE_BACKEND.
+
+    json - локальный файл file_path, подходит для одного экземпляра ETL;
+    redis и sqlite - общее хранилище, в котором namespace отделяет разные состояния.
+    """
+    settings = EtlSettings()
+
+    if settings.state_backend == 'redis':
+        from redis import Redis
+
+        from state.redis_storage import RedisStorage
+
+        redis_settings = RedisSettings()
+        connection = Redis(
+            host=redis_settings.redis_host, port=redis_settings.redis_port, password=redis_settings.redis_password
+        )
+        return RedisStorage(connection, f'etl:{namespace}')
+
+    if settings.state_backend == 'sqlite':
+        from state.sqlite_storage import SqliteStorage
+
+        return SqliteStorage(settings.state_sqlite_path, namespace)
+
+    return JsonFileStorage(file_path)
+
+
+def create_leases() -> Optional[ShardLeases]:
+    """Аренда шардов нужна, только если состояние общее для нескольких экземпляров ETL."""
+    settings = EtlSettings()
+    storage = create_storage('leases', 'leases.json')
+
+    if not storage.shared:
+        return None
+
+    return ShardLeases(storage, settings.instance_id, settings.lease_ttl)
+
+
+def hold_shard(leases: Optional[ShardLeases], shard: str) -> ContextManager[bool]:
+    """Удерживать шард на время блока; без общего хранилища шард всегда свой."""
+    return leases.hold(shard) if leases is not None else nullcontext(True)
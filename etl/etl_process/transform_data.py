@@ -1,154 +1,257 @@
 import logging
+from datetime import date
+from typing import Callable, Optional, Union
 
 from pydantic import ValidationError
 
-from .models import Movie, Person
+from .documents import GENRE_FIELDS, MOVIE_FIELDS, PERSON_FIELDS, validate_documents
+from .models import Genre, Movie, Person
+from .settings import EtlSettings
+
+ROLES = ('director', 'actor', 'writer')
+
+# Готовые документы: модели pydantic или словари (ETL_DOCUMENT_FORMAT=dict).
+MovieDocument = Union[Movie, dict]
+PersonDocument = Union[Person, dict]
+GenreDocument = Union[Genre, dict]
+
+
+def date_to_text(value: Optional[date]) -> Optional[str]:
+    """Дата из Postgres в виде строки ISO: модель Movie хранит creation_date строкой."""
+    return value.isoformat() if isinstance(value, date) else value
+
+
+class MovieAccumulator:
+    """
+    Потоковая группировка строк join-запроса в документы фильмов.
+
+    Строки должны приходить отсортированными по fw_id. Незавершённый фильм переносится
+    между порциями fetchmany, поэтому каждый фильм отдаётся ровно один раз, даже если
+    его строки попали в разные порции. Дубликаты жанров и персон отсекаются словарями,
+    так что стоимость линейна по числу строк.
+    build превращает собранные словари в документы: строит модели или проверяет их разом.
+    """
+    def __init__(self, build: Callable[[list[dict]], list[MovieDocument]]):
+        self.build = build
+        self._current_id: Optional[str] = None
+        self._schema: dict = {}
+        self._genres: dict[str, dict] = {}
+        self._persons: dict[str, dict[str, str]] = {}
+
+    def feed(self, raw_data: list[dict]) -> list[MovieDocument]:
+        """Добавить порцию строк, вернуть фильмы, все строки которых уже получены."""
+        data_to_transfer = []
+
+        for raw_dict in raw_data:
+            film_id = str(raw_dict['fw_id'])
+
+            if film_id != self._current_id:
+                self._emit(data_to_transfer)
+                self._open(film_id, raw_dict)
+
+            self._add(raw_dict)
+
+        return self.build(data_to_transfer)
+
+    def flush(self) -> list[MovieDocument]:
+        """Вернуть последний незавершённый фильм."""
+        data_to_transfer = []
+        self._emit(data_to_transfer)
+        return self.build(data_to_transfer)
+
+    def _open(self, film_id: str, raw_dict: dict) -> None:
+        self._current_id = film_id
+        self._schema = {
+            'id': film_id,
+            'imdb_rating': raw_dict['rating'],
+            'title': raw_dict['title'],
+            'creation_date': date_to_text(raw_dict['creation_date']),
+            'description': raw_dict['description'],
+            'file_path': raw_dict['file_path'],
+        }
+        self._genres = {}
+        self._persons = {role: {} for role in ROLES}
+
+    def _add(self, raw_dict: dict) -> None:
+        if raw_dict['g_id'] is not None:
+            self._genres.setdefault(
+                str(raw_dict['g_id']),
+                {'id': str(raw_dict['g_id']), 'name': raw_dict['name'], 'description': raw_dict['g_description']}
+            )
+
+        persons = self._persons.get(raw_dict['role'])
+        if persons is not None:
+            persons.setdefault(str(raw_dict['id']), raw_dict['full_name'])
+
+    def _emit(self, data_to_transfer: list) -> None:
+        if self._current_id is None:
+            return
+
+        schema = self._schema
+        schema['genres'] = list(self._genres.values())
+        for role in ROLES:
+            persons = self._persons[role]
+            schema[f'{role}s'] = [{'id': id_, 'name': name} for id_, name in persons.items()]
+            schema[f'{role}s_names'] = list(persons.values())
+
+        data_to_transfer.append(schema)
+        self._current_id = None
+        self._schema = {}
+
+
+class PersonAccumulator:
+    """
+    Потоковая группировка строк join-запроса в документы персон.
+
+    person_schema: {id: 22, full_name: George Lucas, films: [{id: 123, roles: ['actor', 'writer']}, ...]}
+
+    Строки должны приходить отсортированными по person_id, незавершённая персона
+    переносится между порциями.
+    """
+    def __init__(self, build: Callable[[list[dict]], list[PersonDocument]]):
+        self.build = build
+        self._current_id: Optional[str] = None
+        self._full_name: Optional[str] = None
+        self._films: dict[str, set] = {}
+
+    def feed(self, raw_data: list[dict]) -> list[PersonDocument]:
+        """Добавить порцию строк, вернуть персон, все строки которых уже получены."""
+        data_to_transfer = []
+
+        for raw_dict in raw_data:
+            person_id = str(raw_dict['person_id'])
+
+            if person_id != self._current_id:
+                self._emit(data_to_transfer)
+                self._current_id = person_id
+                self._full_name = raw_dict['full_name']
+                self._films = {}
+
+            self._films.setdefault(str(raw_dict['film_id']), set()).add(raw_dict['role'])
+
+        return self.build(data_to_transfer)
+
+    def flush(self) -> list[PersonDocument]:
+        """Вернуть последнюю незавершённую персону."""
+        data_to_transfer = []
+        self._emit(data_to_transfer)
+        return self.build(data_to_transfer)
+
+    def _emit(self, data_to_transfer: list) -> None:
+        if self._current_id is None:
+            return
+
+        films = [{'id': film_id, 'roles': sorted(roles)} for film_id, roles in self._films.items()]
+
+        data_to_transfer.append({'id': self._current_id, 'full_name': self._full_name, 'films': films})
+        self._current_id = None
+        self._films = {}
 
 
 class DataTransform:
     """
     данные преобразуются из формата Postgres в формат, пригодный для Elasticsearch.
     тот этап можно пропустить, если преобразования не требуется.
+
+    document_format (по умолчанию ETL_DOCUMENT_FORMAT): model - документы проверяются
+    и хранятся как модели pydantic; dict - остаются словарями, типы полей проверяются
+    одним проходом по порции, а загрузчик сериализует их сразу в bulk NDJSON.
     """
 
-    def __init__(self):
+    def __init__(self, document_format: Optional[str] = None):
         self.logger = logging.getLogger('data_transform')
+        self.document_format = document_format or EtlSettings().document_format
+
+    def build_movies(self, schemas: list[dict]) -> list[MovieDocument]:
+        if self.document_format == 'dict':
+            return validate_documents(schemas, MOVIE_FIELDS, self.logger)
 
-    def transform_movies_pgdata_to_esdata(self, raw_data: list[dict]):
-        """Данные преобразуются из формата Postgres в формат, пригодный для Elasticsearch"""
         data_to_transfer = []
-        schema = {}
-        for dict_ in raw_data:
-            role = dict_['role']
-            id_ = schema.setdefault('id', str(dict_['fw_id']))
-
-            if id_ == str(dict_['fw_id']):
-                self.transform_raw_dict_for_movies(schema, role, dict_)
-            else:
-                try:
-                    data_to_transfer.append(Movie(**schema))
-                except ValidationError as err:
-                    self.logger.exception(err)
-                schema = {}
-                self.transform_raw_dict_for_movies(schema, role, dict_)
-
-        try:
-            data_to_transfer.append(Movie(**schema))
-        except ValidationError as err:
-            self.logger.exception(err)
+        for schema in schemas:
+            try:
+                data_to_transfer.append(Movie(**schema))
+            except ValidationError as err:
+                self.logger.exception(err)
         return data_to_transfer
 
-    def transform_persons_pgdata_to_esdata(self, raw_data: list[dict]):
-        """
-        Данные преобразуются из формата Postgres в формат, пригодный для Elasticsearch
+    def build_persons(self, schemas: list[dict]) -> list[PersonDocument]:
+        if self.document_format == 'dict':
+            return validate_documents(schemas, PERSON_FIELDS, self.logger)
 
-        person_schema: {id: 22, full_name: George Lucas, films: [{id: 123, roles: 'actor', 'writer'}, ...]}
-        film_schema: {id: 123, roles: 'actor', 'writer'}
-        """
         data_to_transfer = []
-        person_schema = {}
-        film_schema = {}
-        role_set = set()
-
-        for dict_ in raw_data:
-            person_schema.setdefault('full_name', dict_['full_name'])
-            person_id = person_schema.setdefault('id', str(dict_['person_id']))
-
-            if person_id == str(dict_['person_id']):
-                films_list = person_schema.setdefault('films', [])
-
-                film_id = film_schema.setdefault('id', str(dict_['film_id']))
-                if film_id == str(dict_['film_id']):
-                    role_set.add(dict_['role'])
-                    film_schema.update({'roles': [role for role in role_set]})
-                else:
-                    if film_schema not in films_list:
-                        films_list.append(film_schema)
-                    role_set = set()
-                    film_schema = {}
-                    film_schema.setdefault('id', str(dict_['film_id']))
-                    role_set.add(dict_['role'])
-                    film_schema.update({'roles': [role for role in role_set]})
-            else:
-                if film_schema not in films_list:
-                    films_list.append(film_schema)
-                person_schema.update({'films': films_list})
-                data_to_transfer.append(Person(**person_schema))
-                person_schema = {}
-                film_schema = {}
-                role_set = set()
-
-                film_id = film_schema.setdefault('id', str(dict_['film_id']))
-
-                if film_id == str(dict_['film_id']):
-                    role_set.add(dict_['role'])
-                    film_schema.update({'roles': [role for role in role_set]})
+        for schema in schemas:
+            try:
+                data_to_transfer.append(Person(**schema))
+            except ValidationError as err:
+                self.logger.exception(err)
         return data_to_transfer
 
-    @staticmethod
-    def transform_raw_dict_for_movies(schema: dict, role: str, raw_dict: dict) -> None:
-        schema.setdefault('id', str(raw_dict['fw_id']))
-        schema.setdefault('imdb_rating', raw_dict['rating'])
-        schema.setdefault('title', raw_dict['title'])
-        schema.setdefault('creation_date', raw_dict['creation_date'])
-        schema.setdefault('description', raw_dict['description'])
-        schema.setdefault('file_path', raw_dict['file_path'])
-        schema.setdefault('genres', [])
-        schema.setdefault('directors_names', [])
-        schema.setdefault('actors_names', [])
-        schema.setdefault('writers_names', [])
-        schema.setdefault('directors', [])
-        schema.setdefault('actors', [])
-        schema.setdefault('writers', [])
-
-        value = {'id': str(raw_dict['id']), 'name': raw_dict['full_name']}
-        value_name = value['name']
-        genre_value = {'id': str(raw_dict['g_id']), 'name': raw_dict['name'], 'description': raw_dict['g_description']}
-
-        genres_list = schema.setdefault('genres', [genre_value])
-        if genre_value not in genres_list:
-            genres_list.append(genre_value)
-            schema.update({'genres': genres_list})
-
-        if role == 'director':
-            directors_list = schema.setdefault('directors', [value])
-            directors_names_list = schema.setdefault('directors_names', [value_name])
-            if value not in directors_list:
-                directors_list.append(value)
-                directors_names_list.append(value_name)
-                schema.update({'directors': directors_list})
-                schema.update({'directors_names': directors_names_list})
-
-        if role == 'actor':
-            actors_list = schema.setdefault('actors', [value])
-            actors_names_list = schema.setdefault('actors_names', [value_name])
-            if value not in actors_list:
-                actors_list.append(value)
-                actors_names_list.append(value_name)
-                schema.update({'actors': actors_list})
-                schema.update({'actors_names': actors_names_list})
-
-        if role == 'writer':
-            writers_list = schema.setdefault('writers', [value])
-            writers_names_list = schema.setdefault('writers_names', [value_name])
-            if value not in writers_list:
-                writers_list.append(value)
-                writers_names_list.append(value_name)
-                schema.update({'writers': writers_list})
-                schema.update({'writers_names': writers_names_list})
-
-    @staticmethod
-    def transform_raw_dict_for_persons(schema: dict, schema_film: dict, raw_dict: dict) -> None:
-        schema.setdefault('id', str(raw_dict['person_id']))
-        schema.setdefault('full_name', raw_dict['full_name'])
-        schema.setdefault('films', [])
-
-        value = {'id': str(raw_dict['id']), 'name': raw_dict['full_name']}
-        genre_value = {'id': str(raw_dict['g_id']), 'name': raw_dict['name'], 'description': raw_dict['g_description']}
-
-        films_value = {'id': str(raw_dict['film_id']), 'roles': []}
-
-        films_list = schema.setdefault('films', [films_value])
-        if films_value not in films_list:
-            films_list.append(genre_value)
-            schema.update({'films': films_list})
+    def build_genres(self, schemas: list[dict]) -> list[GenreDocument]:
+        if self.document_format == 'dict':
+            return validate_documents(schemas, GENRE_FIELDS, self.logger)
+
+        data_to_transfer = []
+        for schema in schemas:
+            try:
+                data_to_transfer.append(Genre(**schema))
+            except ValidationError as err:
+                self.logger.exception(err)
+        return data_to_transfer
+
+    def movies_accumulator(self) -> MovieAccumulator:
+        """Накопитель для потокового преобразования фильмов, строки которых приходят порциями."""
+        return MovieAccumulator(self.build_movies)
+
+    def persons_accumulator(self) -> PersonAccumulator:
+        """Накопитель для потокового преобразования персон, строки которых приходят порциями."""
+        return PersonAccumulator(self.build_persons)
+
+    def transform_movies_pgdata_to_esdata(self, raw_data: list[dict]) -> list[MovieDocument]:
+        """Данные преобразуются из формата Postgres в формат, пригодный для Elasticsearch"""
+        accumulator = self.movies_accumulator()
+        return accumulator.feed(raw_data) + accumulator.flush()
+
+    def transform_persons_pgdata_to_esdata(self, raw_data: list[dict]) -> list[PersonDocument]:
+        """Данные преобразуются из формата Postgres в формат, пригодный для Elasticsearch"""
+        accumulator = self.persons_accumulator()
+        return accumulator.feed(raw_data) + accumulator.flush()
+
+    def transform_aggregated_movies(self, raw_data: list[dict]) -> list[MovieDocument]:
+        """Строки уже агрегированы в Postgres (json_agg/array_agg): одна строка на фильм."""
+        return self.build_movies([
+            {
+                'id': str(raw_dict['fw_id']),
+                'imdb_rating': raw_dict['rating'],
+                'title': raw_dict['title'],
+                'creation_date': date_to_text(raw_dict['creation_date']),
+                'description': raw_dict['description'],
+                'file_path': raw_dict['file_path'],
+                'genres': raw_dict['genres'],
+                'directors': raw_dict['directors'],
+                'directors_names': raw_dict['directors_names'],
+                'actors': raw_dict['actors'],
+                'actors_names': raw_dict['actors_names'],
+                'writers': raw_dict['writers'],
+                'writers_names': raw_dict['writers_names'],
+            }
+            for raw_dict in raw_data
+        ])
+
+    def transform_aggregated_persons(self, raw_data: list[dict]) -> list[PersonDocument]:
+        """Строки уже агрегированы в Postgres (json_agg/array_agg): одна строка на персону."""
+        return self.build_persons([
+            {'id': str(raw_dict['person_id']), 'full_name': raw_dict['full_name'], 'films': raw_dict['films']}
+            for raw_dict in raw_data
+        ])
+
+    def transform_genres(self, raw_data: list[dict]) -> list[GenreDocument]:
+        """Одна строка GENRES_QUERY на жанр, вместе с числом фильмов жанра."""
+        return self.build_genres([
+            {
+                'id': str(raw_dict['id']),
+                'name': raw_dict['name'],
+                'description': raw_dict['description'],
+                'films_count': raw_dict['films_count'],
+            }
+            for raw_dict in raw_data
+        ])
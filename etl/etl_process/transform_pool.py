@@ -0,0 +1,103 @@
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+from config.logging_config import init_logging
+
+from .documents import encode_document
+from .transform_data import DataTransform
+
+MOVIES = 'movies'
+PERSONS = 'persons'
+
+# Ключ, по которому строки join-запроса группируются в документ.
+DOCUMENT_KEYS = {
+    MOVIES: 'fw_id',
+    PERSONS: 'person_id',
+}
+
+# Преобразователи воркера по формату документов, создаются один раз на процесс.
+_transformers: dict[str, DataTransform] = {}
+
+
+def encode_documents(kind: str, aggregated: bool, document_format: str, rows: list[dict]) -> list[tuple[str, bytes]]:
+    """
+    Точка входа воркера: строки Postgres → документы → пары (id, тело документа в JSON).
+    Документы проверяются так же, как без пула: моделями pydantic или проверкой словарей.
+    """
+    transformer = _transformers.get(document_format)
+    if transformer is None:
+        transformer = _transformers[document_format] = DataTransform(document_format)
+
+    if kind == MOVIES:
+        transform = (transformer.transform_aggregated_movies if aggregated
+                     else transformer.transform_movies_pgdata_to_esdata)
+    else:
+        transform = (transformer.transform_aggregated_persons if aggregated
+                     else transformer.transform_persons_pgdata_to_esdata)
+
+    return [encode_document(document) for document in transform(rows)]
+
+
+class PooledTransform:
+    """
+    Преобразование одного потока порций в пуле процессов.
+
+    feed и flush возвращают Future со списком (id, тело) или None, если отправлять нечего.
+    Строки join-запроса одного документа могут попасть в соседние порции, поэтому строки
+    последнего документа порции придерживаются и уходят в воркер вместе со следующей:
+    каждый воркер получает только целые документы.
+    """
+    def __init__(self, executor: ProcessPoolExecutor, kind: str, aggregated: bool, document_format: str):
+        self.executor = executor
+        self.kind = kind
+        self.aggregated = aggregated
+        self.document_format = document_format
+        self._carry: list[dict] = []
+
+    def feed(self, rows: list[dict]) -> Optional[Future]:
+        if not self.aggregated and rows:
+            rows = self._carry + list(rows)
+            key = DOCUMENT_KEYS[self.kind]
+            last_id = rows[-1][key]
+
+            split = len(rows)
+            while split and rows[split - 1][key] == last_id:
+                split -= 1
+            rows, self._carry = rows[:split], rows[split:]
+
+        return self._submit(rows)
+
+    def flush(self) -> Optional[Future]:
+        rows, self._carry = self._carry, []
+        return self._submit(rows)
+
+    def _submit(self, rows: list[dict]) -> Optional[Future]:
+        if not rows:
+            return None
+        return self.executor.submit(encode_documents, self.kind, self.aggregated, self.document_format, rows)
+
+
+class TransformPool:
+    """
+    Пул процессов для стадии transform (ETL_TRANSFORM_WORKERS).
+
+    Проверка документов и сериализация в JSON упираются в GIL, поэтому выполняются
+    в отдельных процессах, а стадия load получает готовые тела документов в bytes.
+    Порции обрабатываются параллельно, пока результаты ждут загрузки: в очереди
+    конвейера (ETL_PIPELINE=true) одновременно в работе до ETL_PIPELINE_QUEUE_SIZE + 1
+    порций, без конвейера - до ETL_TRANSFORM_WORKERS + 1. Порядок загрузки и контрольные
+    точки сохраняются.
+    """
+    def __init__(self, workers: int, document_format: str):
+        self.document_format = document_format
+        # spawn: воркеры не наследуют открытые соединения родительского процесса.
+        self.executor = ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_logging
+        )
+
+    def transform(self, kind: str, aggregated: bool) -> PooledTransform:
+        return PooledTransform(self.executor, kind, aggregated, self.document_format)
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
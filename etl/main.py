@@ -1,34 +1,157 @@
+import argparse
+import asyncio
 import logging
 import time
 from datetime import datetime
+from functools import partial
 
 from config.logging_config import init_logging
-from etl_process.es_loader import ElasticsearchLoader
-from etl_process.extract_data import PostgresExtractor
+from etl_process.async_runtime import run_forever
+from etl_process.backfill import SOURCE_TABLES, Backfill
+from etl_process.bulk import BulkLoadError
+from etl_process.es_loader import GENRES_INDEX, INDEX_SCHEMAS, MOVIES_INDEX, PERSONS_INDEX, ElasticsearchLoader
+from etl_process.extract_data import DELETIONS, MOVIES_SOURCES, PERSON, PostgresExtractor
+from etl_process.listener import ChangeListener
+from etl_process.settings import EtlSettings
+from etl_process.storage import create_leases, create_storage, hold_shard
 from etl_process.transform_data import DataTransform
-from state.json_file_storage import JsonFileStorage
+from state.hash_store import DocumentHashStore
+from state.lease import LeaseLostError
 from state.state import State
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='ETL из Postgres в Elasticsearch')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='полная переиндексация в новые индексы с атомарным переключением алиасов')
+    parser.add_argument('--rollback', action='store_true',
+                        help='вернуть алиасы на предыдущие версии индексов')
+    parser.add_argument('--backfill', action='store_true',
+                        help='начальная загрузка диапазонами id в нескольких процессах '
+                             '(вместе с --rebuild - в новые индексы)')
+    parser.add_argument('--replay-dead-letters', action='store_true',
+                        help='переотправить документы, которые не удалось загрузить в Elasticsearch')
+    args = parser.parse_args()
+
     init_logging()
     logger = logging.getLogger('main')
     logger.info('Starting etl process...')
 
-    state = State(JsonFileStorage('state_file.json'))
-    es_loader = ElasticsearchLoader()
+    etl_settings = EtlSettings()
+    state = State(create_storage('state', 'state_file.json'))
+    leases = create_leases()
+    hash_store = None
+    if etl_settings.skip_unchanged:
+        hash_store = DocumentHashStore(create_storage('hashes', etl_settings.hash_store_path))
+    es_loader = ElasticsearchLoader(hash_store)
     data_transformer = DataTransform()
-    pg_extractor = PostgresExtractor(es_loader, data_transformer)
+    pg_extractor = PostgresExtractor(es_loader, data_transformer, state)
+
+    try:
+        if args.rollback:
+            for alias in INDEX_SCHEMAS:
+                es_loader.rollback_index(alias)
+            es_loader.finish_cycle()
+
+        elif args.replay_dead_letters:
+            es_loader.replay_dead_letters()
+
+        elif args.rebuild:
+            rebuild_started = str(datetime.now())
+
+            if args.backfill:
+                backfill = Backfill(
+                    etl_settings.backfill_workers, etl_settings.backfill_partitions, etl_settings.backfill_state_dir
+                )
+                for alias in SOURCE_TABLES:
+                    es_loader.rebuild_index(alias, lambda: backfill.load(alias, es_loader.write_targets[alias]))
+                    # Документы загружали воркеры, сохранённые хеши не соответствуют новому индексу.
+                    if hash_store is not None:
+                        hash_store.reset(alias)
+            else:
+                es_loader.rebuild_index(MOVIES_INDEX, pg_extractor.fetch_all_movies)
+                es_loader.rebuild_index(PERSONS_INDEX, pg_extractor.fetch_all_persons)
+            es_loader.rebuild_index(GENRES_INDEX, pg_extractor.sync_genres)
+
+            # Изменения, сделанные во время переиндексации, могли попасть только в старый индекс.
+            pg_extractor.fetch_changed_movies(rebuild_started)
+            pg_extractor.fetch_persons_if_persons_changed(rebuild_started)
+            es_loader.finish_cycle()
+
+        elif args.backfill:
+            backfill = Backfill(
+                etl_settings.backfill_workers, etl_settings.backfill_partitions, etl_settings.backfill_state_dir
+            )
+            # Границы фиксируются до загрузки: всё, что изменится во время неё, догрузит обычный цикл.
+            movies_checkpoint = pg_extractor.movies_checkpoint()
+            persons_checkpoint = pg_extractor.persons_checkpoint()
+            if movies_checkpoint.cycle is None:
+                movies_checkpoint.open_cycle(pg_extractor.get_upper_bounds(MOVIES_SOURCES))
+            if persons_checkpoint.cycle is None:
+                persons_checkpoint.open_cycle(pg_extractor.get_upper_bounds([PERSON]))
+
+            # Водяные знаки сдвигает экземпляр, который видит все диапазоны загруженными.
+            if backfill.load(MOVIES_INDEX):
+                movies_checkpoint.close_cycle()
+            if backfill.load(PERSONS_INDEX):
+                persons_checkpoint.close_cycle()
+
+            if hash_store is not None:
+                for alias in SOURCE_TABLES:
+                    hash_store.reset(alias)
+            es_loader.finish_cycle()
+
+        elif etl_settings.runtime == 'async':
+            # Синхронное соединение нужно было только для миграций и проверок при старте.
+            pg_extractor.conn.close()
+            asyncio.run(run_forever(pg_extractor.dsn, state, leases, hash_store))
+
+        else:
+            listener = None
+            if etl_settings.sync_mode == 'listen':
+                listener = ChangeListener(pg_extractor.dsn, etl_settings.debounce_seconds)
+
+            # Дата из прежнего формата состояния - начальная граница для контрольных точек.
+            legacy_watermark = state.get_state('state_key')
 
-    while True:
-        last_updated = state.get_state('state_key') or str(datetime.min)
-        logger.info(f'last_updated: {last_updated}')
+            while True:
+                # Первый проход всегда по modified: журнал содержит только изменения после установки триггеров.
+                if etl_settings.change_source == 'changelog' and pg_extractor.is_synced():
+                    jobs = {'changelog': pg_extractor.fetch_changes_from_changelog}
+                else:
+                    jobs = {
+                        MOVIES_INDEX: partial(pg_extractor.sync_movies, legacy_watermark),
+                        PERSONS_INDEX: partial(pg_extractor.sync_persons, legacy_watermark),
+                    }
+                jobs[GENRES_INDEX] = pg_extractor.sync_genres
+                jobs[DELETIONS] = pg_extractor.sync_deletions
 
-        pg_extractor.fetch_movies_if_genres_changed(last_updated)
-        pg_extractor.fetch_movies_if_persons_changed(last_updated)
-        pg_extractor.fetch_movies_if_films_changed(last_updated)
+                # С общим хранилищем состояния каждую задачу цикла выполняет один экземпляр ETL.
+                for shard, job in jobs.items():
+                    with hold_shard(leases, shard) as owned:
+                        if not owned:
+                            continue
 
-        pg_extractor.fetch_persons_if_persons_changed(last_updated)
+                        try:
+                            job()
+                        except BulkLoadError:
+                            # Контрольная точка не сдвинулась: незагруженная порция повторится в следующем цикле.
+                            logger.exception(f'{shard}: documents were not loaded')
+                            pg_extractor.conn.rollback()
+                        except LeaseLostError:
+                            # Шард забрал другой экземпляр, он продолжит с последней зафиксированной точки.
+                            logger.exception(f'{shard}: job is stopped')
+                            pg_extractor.conn.rollback()
+                es_loader.finish_cycle()
 
-        state.set_state('state_key', str(datetime.now()))
+                if listener is None:
+                    time.sleep(etl_settings.poll_interval)
+                    continue
 
-        time.sleep(3600)
+                changed_tables = listener.wait(etl_settings.poll_interval)
+                if changed_tables:
+                    logger.info(f'Changes in {", ".join(sorted(set(changed_tables)))}')
+                else:
+                    logger.info('No notifications, fallback poll')
+    finally:
+        # Процессы пула преобразования не должны пережить основной процесс.
+        pg_extractor.close_transform_pool()
@@ -0,0 +1,44 @@
+-- Надгробия удалённых строк: по ним ETL удаляет документы и убирает удалённые связи
+-- из вложенных списков документов в любом режиме (ETL_CHANGE_SOURCE=modified тоже).
+-- Триггер уровня оператора с таблицей переходов: массовое удаление - одна вставка.
+
+CREATE TABLE IF NOT EXISTS content.etl_tombstone (
+    id bigserial PRIMARY KEY,
+    table_name text NOT NULL,
+    row_id uuid NOT NULL,
+    film_work_id uuid,
+    person_id uuid,
+    genre_id uuid,
+    role text,
+    deleted_at timestamp with time zone NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION content.etl_log_delete() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO content.etl_tombstone (table_name, row_id, film_work_id, person_id, genre_id, role)
+    SELECT
+        TG_TABLE_NAME,
+        (data ->> 'id')::uuid,
+        CASE WHEN TG_TABLE_NAME = 'film_work' THEN (data ->> 'id')::uuid ELSE (data ->> 'film_work_id')::uuid END,
+        CASE WHEN TG_TABLE_NAME = 'person' THEN (data ->> 'id')::uuid ELSE (data ->> 'person_id')::uuid END,
+        CASE WHEN TG_TABLE_NAME = 'genre' THEN (data ->> 'id')::uuid ELSE (data ->> 'genre_id')::uuid END,
+        data ->> 'role'
+    FROM (SELECT to_jsonb(deleted_rows) as data FROM deleted_rows) as deleted;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    tbl text;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['film_work', 'genre', 'person', 'genre_film_work', 'person_film_work'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS etl_tombstone ON content.%I', tbl);
+        EXECUTE format(
+            'CREATE TRIGGER etl_tombstone AFTER DELETE ON content.%I '
+            'REFERENCING OLD TABLE AS deleted_rows '
+            'FOR EACH STATEMENT EXECUTE FUNCTION content.etl_log_delete()', tbl
+        );
+    END LOOP;
+END
+$$;
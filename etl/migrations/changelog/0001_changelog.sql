@@ -0,0 +1,71 @@
+-- Журнал изменений для инкрементального ETL.
+-- Триггеры записывают каждую вставку, изменение и удаление в таблицах контента,
+-- включая связующие таблицы, у которых нет поля modified.
+
+CREATE TABLE IF NOT EXISTS content.etl_changelog (
+    id bigserial PRIMARY KEY,
+    table_name text NOT NULL,
+    operation char(1) NOT NULL,
+    row_id uuid NOT NULL,
+    film_work_id uuid,
+    person_id uuid,
+    genre_id uuid,
+    changed_at timestamp with time zone NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION content.etl_log_row(source_table text, source_operation text, data jsonb) RETURNS void AS $$
+BEGIN
+    INSERT INTO content.etl_changelog (table_name, operation, row_id, film_work_id, person_id, genre_id)
+    VALUES (
+        source_table,
+        left(source_operation, 1),
+        (data ->> 'id')::uuid,
+        CASE WHEN source_table = 'film_work' THEN (data ->> 'id')::uuid ELSE (data ->> 'film_work_id')::uuid END,
+        CASE WHEN source_table = 'person' THEN (data ->> 'id')::uuid ELSE (data ->> 'person_id')::uuid END,
+        CASE WHEN source_table = 'genre' THEN (data ->> 'id')::uuid ELSE (data ->> 'genre_id')::uuid END
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION content.etl_log_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM content.etl_log_row(TG_TABLE_NAME, TG_OP, to_jsonb(OLD));
+        RETURN OLD;
+    END IF;
+
+    -- Связь перенесли на другой фильм или персону: затронуты обе стороны.
+    IF TG_OP = 'UPDATE' AND TG_TABLE_NAME LIKE '%\_film\_work' THEN
+        PERFORM content.etl_log_row(TG_TABLE_NAME, TG_OP, to_jsonb(OLD));
+    END IF;
+
+    PERFORM content.etl_log_row(TG_TABLE_NAME, TG_OP, to_jsonb(NEW));
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    tbl text;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['film_work', 'genre', 'person', 'genre_film_work', 'person_film_work'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS etl_changelog_insert_delete ON content.%I', tbl);
+        EXECUTE format(
+            'CREATE TRIGGER etl_changelog_insert_delete AFTER INSERT OR DELETE ON content.%I '
+            'FOR EACH ROW EXECUTE FUNCTION content.etl_log_change()', tbl
+        );
+        EXECUTE format('DROP TRIGGER IF EXISTS etl_changelog_update ON content.%I', tbl);
+        EXECUTE format(
+            'CREATE TRIGGER etl_changelog_update AFTER UPDATE ON content.%I '
+            'FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) EXECUTE FUNCTION content.etl_log_change()', tbl
+        );
+    END LOOP;
+END
+$$;
+
+-- Индексы для выборок по modified (keyset-пагинация) и для поиска фильмов по жанру и персоне.
+CREATE INDEX IF NOT EXISTS film_work_modified_idx ON content.film_work (modified, id);
+CREATE INDEX IF NOT EXISTS genre_modified_idx ON content.genre (modified, id);
+CREATE INDEX IF NOT EXISTS person_modified_idx ON content.person (modified, id);
+CREATE INDEX IF NOT EXISTS genre_film_work_genre_idx ON content.genre_film_work (genre_id);
+CREATE INDEX IF NOT EXISTS person_film_work_person_idx ON content.person_film_work (person_id);
@@ -0,0 +1,24 @@
+-- Уведомления для режима синхронизации ETL_SYNC_MODE=listen.
+-- Триггер уровня оператора: одно уведомление на оператор, одинаковые уведомления
+-- в пределах транзакции Postgres схлопывает сам.
+
+CREATE OR REPLACE FUNCTION content.etl_notify_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('etl_changes', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    tbl text;
+BEGIN
+    FOREACH tbl IN ARRAY ARRAY['film_work', 'genre', 'person', 'genre_film_work', 'person_film_work'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS etl_notify ON content.%I', tbl);
+        EXECUTE format(
+            'CREATE TRIGGER etl_notify AFTER INSERT OR UPDATE OR DELETE ON content.%I '
+            'FOR EACH STATEMENT EXECUTE FUNCTION content.etl_notify_change()', tbl
+        );
+    END LOOP;
+END
+$$;
@@ -1,9 +1,15 @@
 import abc
-from typing import Any, Dict
+from typing import Any, Dict, Iterable, List
 
 
 class BaseStorage(abc.ABC):
-    """Абстрактное хранилище состояния."""
+    """
+    Абстрактное хранилище состояния.
+
+    shared - хранилище общее для нескольких экземпляров ETL: значения нельзя кешировать
+    в памяти, а записывать нужно по одному ключу, не затирая чужие.
+    """
+    shared: bool = False
 
     @abc.abstractmethod
     def save_state(self, state: Dict[str, Any]) -> None:
@@ -12,3 +18,50 @@ class BaseStorage(abc.ABC):
     @abc.abstractmethod
     def retrieve_state(self) -> Dict[str, Any]:
         """Получить состояние из хранилища."""
+
+    def get_value(self, key: str) -> Any:
+        """Получить значение одного ключа."""
+        return self.retrieve_state().get(key)
+
+    def save_value(self, key: str, value: Any) -> None:
+        """Сохранить значение одного ключа."""
+        state = self.retrieve_state()
+        state[key] = value
+        self.save_state(state)
+
+    def get_values(self, keys: List[str]) -> Dict[str, Any]:
+        """Получить значения нескольких ключей, отсутствующих ключей в ответе нет."""
+        state = self.retrieve_state()
+        return {key: state[key] for key in keys if key in state}
+
+    def save_values(self, values: Dict[str, Any]) -> None:
+        """Сохранить значения нескольких ключей."""
+        state = self.retrieve_state()
+        state.update(values)
+        self.save_state(state)
+
+    def delete_values(self, keys: Iterable[str]) -> None:
+        """Удалить ключи."""
+        state = self.retrieve_state()
+        for key in keys:
+            state.pop(key, None)
+        self.save_state(state)
+
+    def delete_prefix(self, prefix: str) -> None:
+        """Удалить все ключи, которые начинаются с prefix."""
+        state = self.retrieve_state()
+        self.save_state({key: value for key, value in state.items() if not key.startswith(prefix)})
+
+    def compare_and_set(self, key: str, expected: Any, value: Any) -> bool:
+        """
+        Записать value, только если текущее значение ключа равно expected (None - ключа нет).
+        Вернуть, удалась ли запись. Реализация по умолчанию атомарна только в пределах
+        одного процесса, общие хранилища переопределяют её.
+        """
+        state = self.retrieve_state()
+        if state.get(key) != expected:
+            return False
+
+        state[key] = value
+        self.save_state(state)
+        return True
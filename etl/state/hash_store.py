@@ -0,0 +1,122 @@
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Tuple
+
+from .base_storage import BaseStorage
+
+
+class DocumentHashStore:
+    """
+    Хеши содержимого документов, уже загруженных в Elasticsearch.
+    {'movies': {'<id>': '<hash>'}, 'persons': {...}}
+
+    Позволяет не отправлять документ повторно, если после пересборки он не изменился.
+    Хеш фиксируется только после успешной загрузки, поэтому при сбое документ
+    будет отправлен ещё раз.
+
+    Общее хранилище (storage.shared) меняют другие экземпляры ETL, поэтому хеши в памяти
+    не держатся: каждый хеш - отдельный ключ '<index>:<id>', известные хеши партии
+    читаются одним запросом, а фиксируются сразу в хранилище.
+    """
+    def __init__(self, storage: BaseStorage) -> None:
+        self.storage = storage
+        self.hashes: Dict[str, Dict[str, str]] = {} if storage.shared else storage.retrieve_state()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    @staticmethod
+    def document_hash(document: Dict[str, Any]) -> str:
+        data = json.dumps(document, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(data.encode(), digest_size=8).hexdigest()
+
+    @staticmethod
+    def hash_key(index: str, document_id: str) -> str:
+        return f'{index}:{document_id}'
+
+    def known_hashes(self, index: str, ids: List[str]) -> Dict[str, str]:
+        """Хеши документов партии, зафиксированные при прошлых загрузках."""
+        if not self.storage.shared:
+            return self.hashes.setdefault(index, {})
+
+        stored = self.storage.get_values([self.hash_key(index, document_id) for document_id in ids])
+        return {document_id: stored[key] for document_id in ids if (key := self.hash_key(index, document_id)) in stored}
+
+    def filter_changed(
+            self, index: str, actions: Iterable[Dict[str, Any]], skip_unchanged: bool = True
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+        """Отобрать изменившиеся документы, вернуть их и хеши для фиксации после загрузки."""
+        actions = list(actions)
+        known = self.known_hashes(index, [str(action['_id']) for action in actions]) if skip_unchanged else {}
+        stats = self.stats.setdefault(index, {'skipped': 0, 'sent': 0})
+        changed, pending = [], {}
+
+        for action in actions:
+            document_id = str(action['_id'])
+            # Имя индекса в документе не участвует: при переиндексации он пишется в новый индекс.
+            document_hash = self.document_hash({key: value for key, value in action.items() if key != '_index'})
+
+            if skip_unchanged and known.get(document_id) == document_hash:
+                stats['skipped'] += 1
+                continue
+
+            stats['sent'] += 1
+            changed.append(action)
+            pending[document_id] = document_hash
+
+        return changed, pending
+
+    def filter_changed_encoded(
+            self, index: str, bodies: Iterable[Tuple[str, bytes]], skip_unchanged: bool = True
+    ) -> Tuple[List[Tuple[str, bytes]], Dict[str, str]]:
+        """
+        То же для уже сериализованных документов (id, тело в JSON): хешируются байты тела,
+        без повторной сериализации с сортировкой ключей. Хеши отличаются от хешей
+        filter_changed, поэтому после смены формата документы будут отправлены один раз заново.
+        """
+        bodies = list(bodies)
+        known = self.known_hashes(index, [document_id for document_id, _ in bodies]) if skip_unchanged else {}
+        stats = self.stats.setdefault(index, {'skipped': 0, 'sent': 0})
+        changed, pending = [], {}
+
+        for document_id, body in bodies:
+            document_hash = hashlib.blake2b(body, digest_size=8).hexdigest()
+
+            if skip_unchanged and known.get(document_id) == document_hash:
+                stats['skipped'] += 1
+                continue
+
+            stats['sent'] += 1
+            changed.append((document_id, body))
+            pending[document_id] = document_hash
+
+        return changed, pending
+
+    def commit(self, index: str, pending: Dict[str, str]) -> None:
+        if self.storage.shared:
+            self.storage.save_values({self.hash_key(index, document_id): value
+                                      for document_id, value in pending.items()})
+            return
+        self.hashes.setdefault(index, {}).update(pending)
+
+    def forget(self, index: str, ids: Iterable[str]) -> None:
+        """Забыть хеши удалённых или изменённых на месте документов: следующая загрузка их отправит."""
+        if self.storage.shared:
+            self.storage.delete_values([self.hash_key(index, document_id) for document_id in ids])
+            return
+        known = self.hashes.setdefault(index, {})
+        for document_id in ids:
+            known.pop(document_id, None)
+
+    def reset(self, index: str) -> None:
+        if self.storage.shared:
+            self.storage.delete_prefix(self.hash_key(index, ''))
+            return
+        self.hashes[index] = {}
+
+    def save(self) -> None:
+        """Сохранить хеши в локальный файл; в общем хранилище они уже сохранены при фиксации."""
+        if not self.storage.shared:
+            self.storage.save_state(self.hashes)
+
+    def pop_stats(self) -> Dict[str, Dict[str, int]]:
+        stats, self.stats = self.stats, {}
+        return stats
@@ -1,4 +1,6 @@
 import json
+import os
+import tempfile
 from typing import Any, Dict
 
 from .base_storage import BaseStorage
@@ -13,9 +15,23 @@ class JsonFileStorage(BaseStorage):
         self.file_path: str = file_path
 
     def save_state(self, state: Dict[str, Any]) -> None:
-        """Сохранить состояние в хранилище."""
-        with open(self.file_path, 'w') as file:
-            json.dump(state, file)
+        """
+        Сохранить состояние в хранилище.
+        Запись атомарная: во временный файл рядом и переименование поверх старого,
+        поэтому при сбое на диске остаётся либо старое, либо новое состояние целиком.
+        """
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.state-', suffix='.tmp')
+
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(state, file)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
 
     def retrieve_state(self) -> Dict[str, Any]:
         """Получить состояние из хранилища."""
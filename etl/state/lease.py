@@ -0,0 +1,96 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from .base_storage import BaseStorage
+
+# Событие потери аренды шарда, который обрабатывается в текущем контексте.
+_lease_lost: ContextVar[Optional[threading.Event]] = ContextVar('lease_lost', default=None)
+
+
+class LeaseLostError(Exception):
+    """Аренду шарда забрал другой экземпляр ETL: фиксировать результаты работы нельзя."""
+
+
+def ensure_lease() -> None:
+    """
+    Проверить перед фиксацией контрольной точки или удалением журнала, что аренда шарда не потеряна.
+    Вне ShardLeases.hold ничего не проверяет.
+    """
+    lost = _lease_lost.get()
+    if lost is not None and lost.is_set():
+        raise LeaseLostError('shard lease is lost')
+
+
+class ShardLeases:
+    """
+    Аренда шардов работы (индексов, журнала изменений, диапазонов id) экземплярами ETL.
+
+    Аренда - запись {'owner': ..., 'expires_at': ...} в общем хранилище, захватывается
+    и продлевается через compare_and_set, поэтому из нескольких претендентов побеждает
+    ровно один. Пока шард в работе, аренда продлевается в фоновом потоке; если экземпляр
+    упал, через ttl шард может забрать другой и продолжить с сохранённой контрольной точки.
+    Если продлить аренду не удалось, ensure_lease в блоке hold поднимает LeaseLostError
+    и задача останавливается до следующей фиксации.
+    Сроки считаются по локальным часам, ttl должен заметно превышать расхождение часов хостов.
+    """
+    def __init__(self, storage: BaseStorage, owner: str, ttl: float = 300) -> None:
+        self.storage = storage
+        self.owner = owner
+        self.ttl = ttl
+        self.logger = logging.getLogger('main')
+
+    @staticmethod
+    def lease_key(shard: str) -> str:
+        return f'lease:{shard}'
+
+    def acquire(self, shard: str) -> bool:
+        """Захватить или продлить аренду шарда, вернуть, принадлежит ли он теперь этому экземпляру."""
+        key = self.lease_key(shard)
+        current = self.storage.get_value(key)
+        now = time.time()
+
+        if current is not None and current['owner'] != self.owner and current['expires_at'] > now:
+            return False
+
+        return self.storage.compare_and_set(key, current, {'owner': self.owner, 'expires_at': now + self.ttl})
+
+    def release(self, shard: str) -> None:
+        key = self.lease_key(shard)
+        current = self.storage.get_value(key)
+
+        if current is not None and current['owner'] == self.owner:
+            self.storage.compare_and_set(key, current, {'owner': None, 'expires_at': 0})
+
+    @contextmanager
+    def hold(self, shard: str) -> Iterator[bool]:
+        """Удерживать аренду шарда на время блока, в блок передаётся, удалось ли её захватить."""
+        if not self.acquire(shard):
+            self.logger.info(f'{shard} is owned by another instance')
+            yield False
+            return
+
+        stop_event, lost_event = threading.Event(), threading.Event()
+        keeper = threading.Thread(target=self._keep_alive, args=(shard, stop_event, lost_event),
+                                  name=f'lease-{shard}', daemon=True)
+        keeper.start()
+        token = _lease_lost.set(lost_event)
+
+        try:
+            yield True
+        finally:
+            _lease_lost.reset(token)
+            stop_event.set()
+            keeper.join()
+            if not lost_event.is_set():
+                self.release(shard)
+
+    def _keep_alive(self, shard: str, stop_event: threading.Event, lost_event: threading.Event) -> None:
+        while not stop_event.wait(self.ttl / 3):
+            if not self.acquire(shard):
+                self.logger.error(f'Lease of {shard} is lost, the job is stopped before its next commit')
+                lost_event.set()
+                return
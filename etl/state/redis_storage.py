@@ -0,0 +1,73 @@
+import json
+from typing import Any, Dict, Iterable, List
+
+from redis import Redis
+
+from .base_storage import BaseStorage
+
+# Столько полей удаляется одной командой HDEL.
+DELETE_BATCH_SIZE = 1000
+
+# Сравнение и запись выполняются в Redis одной командой, между ними никто не вклинится.
+COMPARE_AND_SET_SCRIPT = """
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if (current or '') ~= ARGV[2] then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[3])
+return 1
+"""
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, sort_keys=True)
+
+
+class RedisStorage(BaseStorage):
+    """
+    Хранилище в Redis, общее для нескольких экземпляров ETL.
+    Состояние лежит в хеше namespace, каждый ключ - отдельное поле со значением в JSON.
+    """
+    shared = True
+
+    def __init__(self, connection: Redis, namespace: str) -> None:
+        self.connection = connection
+        self.namespace = namespace
+        self._compare_and_set = connection.register_script(COMPARE_AND_SET_SCRIPT)
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        """Сохранить состояние в хранилище."""
+        if state:
+            self.connection.hset(self.namespace, mapping={key: dumps(value) for key, value in state.items()})
+
+    def retrieve_state(self) -> Dict[str, Any]:
+        """Получить состояние из хранилища."""
+        return {key.decode(): json.loads(value) for key, value in self.connection.hgetall(self.namespace).items()}
+
+    def get_value(self, key: str) -> Any:
+        value = self.connection.hget(self.namespace, key)
+        return json.loads(value) if value is not None else None
+
+    def save_value(self, key: str, value: Any) -> None:
+        self.connection.hset(self.namespace, key, dumps(value))
+
+    def get_values(self, keys: List[str]) -> Dict[str, Any]:
+        if not keys:
+            return {}
+        values = self.connection.hmget(self.namespace, keys)
+        return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def save_values(self, values: Dict[str, Any]) -> None:
+        self.save_state(values)
+
+    def delete_values(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        for i in range(0, len(keys), DELETE_BATCH_SIZE):
+            self.connection.hdel(self.namespace, *keys[i:i + DELETE_BATCH_SIZE])
+
+    def delete_prefix(self, prefix: str) -> None:
+        self.delete_values([key for key, _ in self.connection.hscan_iter(self.namespace, match=f'{prefix}*')])
+
+    def compare_and_set(self, key: str, expected: Any, value: Any) -> bool:
+        expected_raw = dumps(expected) if expected is not None else ''
+        return bool(self._compare_and_set(keys=[self.namespace], args=[key, expected_raw, dumps(value)]))
@@ -0,0 +1,110 @@
+import json
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, List
+
+from .base_storage import BaseStorage
+
+
+# Столько ключей передаётся в одно условие IN: число параметров запроса SQLite ограничено.
+KEYS_BATCH_SIZE = 500
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, sort_keys=True)
+
+
+def key_batches(keys: Iterable[str]) -> Iterator[List[str]]:
+    keys = list(keys)
+    return (keys[i:i + KEYS_BATCH_SIZE] for i in range(0, len(keys), KEYS_BATCH_SIZE))
+
+
+class SqliteStorage(BaseStorage):
+    """
+    Хранилище в файле SQLite, общее для нескольких экземпляров ETL на одном хосте
+    или общем томе. Каждый ключ - отдельная строка таблицы etl_state, записи атомарны
+    на уровне транзакций SQLite.
+    """
+    shared = True
+
+    def __init__(self, file_path: str, namespace: str) -> None:
+        self.file_path = file_path
+        self.namespace = namespace
+        # isolation_level=None: каждая команда сразу фиксируется, конкурирующие писатели ждут до timeout.
+        self.connection = sqlite3.connect(file_path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL;')
+        self.connection.execute("""
+                                CREATE TABLE IF NOT EXISTS etl_state (
+                                    namespace text NOT NULL,
+                                    key text NOT NULL,
+                                    value text NOT NULL,
+                                    PRIMARY KEY (namespace, key)
+                                );
+                                """)
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        """Сохранить состояние в хранилище."""
+        self.connection.execute('BEGIN IMMEDIATE;')
+        try:
+            for key, value in state.items():
+                self.save_value(key, value)
+        except BaseException:
+            self.connection.execute('ROLLBACK;')
+            raise
+        self.connection.execute('COMMIT;')
+
+    def retrieve_state(self) -> Dict[str, Any]:
+        """Получить состояние из хранилища."""
+        rows = self.connection.execute('SELECT key, value FROM etl_state WHERE namespace = ?;', (self.namespace,))
+        return {key: json.loads(value) for key, value in rows}
+
+    def get_value(self, key: str) -> Any:
+        row = self.connection.execute(
+            'SELECT value FROM etl_state WHERE namespace = ? AND key = ?;', (self.namespace, key)
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def save_value(self, key: str, value: Any) -> None:
+        self.connection.execute(
+            'INSERT INTO etl_state (namespace, key, value) VALUES (?, ?, ?) '
+            'ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value;',
+            (self.namespace, key, dumps(value))
+        )
+
+    def get_values(self, keys: List[str]) -> Dict[str, Any]:
+        values = {}
+        for batch in key_batches(keys):
+            rows = self.connection.execute(
+                f'SELECT key, value FROM etl_state WHERE namespace = ? AND key IN ({", ".join("?" * len(batch))});',
+                (self.namespace, *batch)
+            )
+            values.update((key, json.loads(value)) for key, value in rows)
+        return values
+
+    def save_values(self, values: Dict[str, Any]) -> None:
+        self.save_state(values)
+
+    def delete_values(self, keys: Iterable[str]) -> None:
+        for batch in key_batches(keys):
+            self.connection.execute(
+                f'DELETE FROM etl_state WHERE namespace = ? AND key IN ({", ".join("?" * len(batch))});',
+                (self.namespace, *batch)
+            )
+
+    def delete_prefix(self, prefix: str) -> None:
+        self.connection.execute(
+            'DELETE FROM etl_state WHERE namespace = ? AND substr(key, 1, ?) = ?;',
+            (self.namespace, len(prefix), prefix)
+        )
+
+    def compare_and_set(self, key: str, expected: Any, value: Any) -> bool:
+        if expected is None:
+            cursor = self.connection.execute(
+                'INSERT OR IGNORE INTO etl_state (namespace, key, value) VALUES (?, ?, ?);',
+                (self.namespace, key, dumps(value))
+            )
+        else:
+            cursor = self.connection.execute(
+                'UPDATE etl_state SET value = ? WHERE namespace = ? AND key = ? AND value = ?;',
+                (dumps(value), self.namespace, key, dumps(expected))
+            )
+        return cursor.rowcount == 1
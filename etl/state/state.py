@@ -1,5 +1,7 @@
 from typing import Any
 
+from .lease import ensure_lease
+
 
 class State:
     """
@@ -9,16 +11,30 @@ class State:
     {'state_key': '1990-01-01'} - значение является datetime,
                                   храним последнюю дату, после которой
                                   мы загружали в ES
+    {'movies': {'watermarks': {'film_work': ['2024-01-01T00:00:00+00:00', '<uuid>'], ...},
+                'cycle': {'upto': {...}, 'loaded': '<uuid>'}}} - контрольные точки ETL по индексам
+
+    Состояние читается из хранилища один раз при создании, дальше чтение идёт из памяти,
+    а каждое изменение сразу сохраняется в хранилище. Общее хранилище (storage.shared)
+    могут менять другие экземпляры ETL, поэтому с ним ключи читаются и пишутся по одному.
+    Если аренда обрабатываемого шарда потеряна, set_state поднимает LeaseLostError.
     """
     def __init__(self, storage) -> None:
         self.storage = storage
+        self.state = self.storage.retrieve_state()
 
     def set_state(self, key: str, value: Any) -> None:
         """Установить состояние для определённого ключа."""
-        state = self.storage.retrieve_state()
-        state[key] = value
-        self.storage.save_state(state)
+        ensure_lease()
+        self.state[key] = value
+
+        if self.storage.shared:
+            self.storage.save_value(key, value)
+        else:
+            self.storage.save_state(self.state)
 
     def get_state(self, key: str) -> Any:
         """Получить состояние по определённому ключу."""
-        return self.storage.retrieve_state().get(key)
+        if self.storage.shared:
+            return self.storage.get_value(key)
+        return self.state.get(key)
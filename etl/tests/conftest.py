@@ -0,0 +1,55 @@
+import os
+import sys
+
+import pytest
+
+# Модули ETL импортируются так же, как при запуске etl/main.py: от каталога etl.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from etl_process.es_loader import ElasticsearchLoader  # noqa: E402
+from etl_process.extract_data import PostgresExtractor  # noqa: E402
+from etl_process.transform_data import DataTransform  # noqa: E402
+from state.json_file_storage import JsonFileStorage  # noqa: E402
+from state.state import State  # noqa: E402
+from fakes import FakeConnection, FakeCursor, FakeElasticsearch  # noqa: E402
+
+
+@pytest.fixture
+def etl_env(monkeypatch, tmp_path):
+    for name, value in {
+        'DB_NAME': 'movies_database', 'DB_USER': 'app', 'DB_PASSWORD': 'secret',
+        'DB_HOST': 'localhost', 'DB_PORT': '5432', 'ELASTIC_HOST': 'localhost', 'ELASTIC_PORT': '9200',
+        # Документы-словари загружаются через FakeElasticsearch.bulk напрямую, без helpers.bulk.
+        'ETL_DOCUMENT_FORMAT': 'dict',
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def es_loader(etl_env, monkeypatch):
+    monkeypatch.setattr(ElasticsearchLoader, 'set_connection', lambda self: None)
+    monkeypatch.setattr(ElasticsearchLoader, 'create_index', lambda self: None)
+    loader = ElasticsearchLoader()
+    loader.connection = FakeElasticsearch()
+    return loader
+
+
+@pytest.fixture
+def make_extractor(es_loader, monkeypatch, tmp_path):
+    """Фабрика PostgresExtractor поверх FakeConnection; переменные окружения ETL_* задаются аргументами."""
+    def make(responses: list = (), **settings) -> PostgresExtractor:
+        for name, value in settings.items():
+            monkeypatch.setenv(f'ETL_{name.upper()}', str(value))
+
+        cursor = FakeCursor(list(responses))
+
+        def set_connection_cursor(self):
+            self.conn = FakeConnection(cursor)
+            self.cursor = cursor
+
+        monkeypatch.setattr(PostgresExtractor, 'set_connection_cursor', set_connection_cursor)
+        state = State(JsonFileStorage(str(tmp_path / 'state.json')))
+        return PostgresExtractor(es_loader, DataTransform(), state)
+
+    return make
@@ -0,0 +1,86 @@
+"""Заменители Postgres и Elasticsearch для тестов без внешних сервисов."""
+
+
+class FakeCursor:
+    """
+    Курсор psycopg без базы: на запрос отвечает строками первого ответа, фрагмент SQL
+    которого входит в запрос. Ответ - список строк или функция от параметров запроса.
+    """
+    def __init__(self, responses: list, executed: list = None):
+        self.responses = responses
+        self.executed = executed if executed is not None else []
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return None
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+        self._rows = []
+
+        for fragment, rows in self.responses:
+            if fragment in query:
+                self._rows = list(rows(params) if callable(rows) else rows)
+                break
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchone(self):
+        rows = self.fetchall()
+        return rows[0] if rows else None
+
+    def queries(self, fragment: str) -> list:
+        return [(query, params) for query, params in self.executed if fragment in query]
+
+
+class FakeConnection:
+    def __init__(self, cursor: FakeCursor):
+        self._cursor = cursor
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, name: str = None, **kwargs):
+        """Именованный (серверный) курсор - отдельный курсор с общим журналом запросов."""
+        if name is None:
+            return self._cursor
+        return FakeCursor(self._cursor.responses, self._cursor.executed)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeElasticsearch:
+    """Клиент Elasticsearch, который отдаёт заготовленные ответы bulk по очереди; исключение выбрасывается."""
+    def __init__(self, responses: list = ()):
+        self.responses = list(responses)
+        self.requests = []
+
+    def bulk(self, operations):
+        self.requests.append(operations)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def update_by_query(self, index, query, script, **kwargs):
+        self.requests.append({'index': index, 'query': query, 'script': script})
+        return {'updated': len(script['params'].get('links', ()))}
+
+
+def bulk_response(*statuses: int, op_type: str = 'index') -> dict:
+    return {'items': [
+        {op_type: {'status': status, **({'error': {'type': 'mapper_parsing_exception'}} if status >= 300 else {})}}
+        for status in statuses
+    ]}
@@ -0,0 +1,73 @@
+from datetime import date
+
+import pytest
+
+from etl_process.transform_data import DataTransform, MovieAccumulator, PersonAccumulator
+
+
+def film_row(fw_id: str, role: str, person_id: str, genre_id: str) -> dict:
+    return {'fw_id': fw_id, 'rating': 8.0, 'title': f'Film {fw_id}', 'creation_date': None, 'description': None,
+            'file_path': None, 'g_id': genre_id, 'name': f'Genre {genre_id}', 'g_description': None,
+            'role': role, 'id': person_id, 'full_name': f'Person {person_id}'}
+
+
+def person_row(person_id: str, film_id: str, role: str) -> dict:
+    return {'person_id': person_id, 'full_name': f'Person {person_id}', 'film_id': film_id, 'role': role}
+
+
+FILM_ROWS = [
+    film_row('1', 'actor', 'p1', 'g1'),
+    film_row('1', 'actor', 'p1', 'g2'),
+    film_row('1', 'director', 'p2', 'g1'),
+    film_row('2', 'writer', 'p3', 'g1'),
+]
+PERSON_ROWS = [
+    person_row('p1', '1', 'actor'),
+    person_row('p1', '1', 'writer'),
+    person_row('p1', '2', 'actor'),
+    person_row('p2', '1', 'director'),
+]
+
+
+def feed_in_chunks(accumulator, rows: list[dict], size: int) -> list[dict]:
+    documents = []
+    for i in range(0, len(rows), size):
+        documents.extend(accumulator.feed(rows[i:i + size]))
+    return documents + accumulator.flush()
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 4])
+def test_movie_split_between_chunks_is_emitted_once(size):
+    films = feed_in_chunks(MovieAccumulator(lambda schemas: schemas), FILM_ROWS, size)
+
+    assert [film['id'] for film in films] == ['1', '2']
+    first, second = films
+    assert [genre['id'] for genre in first['genres']] == ['g1', 'g2']
+    assert first['actors'] == [{'id': 'p1', 'name': 'Person p1'}]
+    assert first['directors_names'] == ['Person p2']
+    assert second['writers'] == [{'id': 'p3', 'name': 'Person p3'}]
+    assert second['actors'] == []
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 4])
+def test_person_split_between_chunks_is_emitted_once(size):
+    persons = feed_in_chunks(PersonAccumulator(lambda schemas: schemas), PERSON_ROWS, size)
+
+    assert persons == [
+        {'id': 'p1', 'full_name': 'Person p1', 'films': [{'id': '1', 'roles': ['actor', 'writer']},
+                                                          {'id': '2', 'roles': ['actor']}]},
+        {'id': 'p2', 'full_name': 'Person p2', 'films': [{'id': '1', 'roles': ['director']}]},
+    ]
+
+
+def test_flush_without_rows_is_empty():
+    assert MovieAccumulator(lambda schemas: schemas).flush() == []
+    assert PersonAccumulator(lambda schemas: schemas).flush() == []
+
+
+def test_creation_date_is_converted_for_model():
+    row = {**film_row('1', 'actor', 'p1', 'g1'), 'creation_date': date(2020, 5, 17)}
+
+    movie, = DataTransform('model').transform_movies_pgdata_to_esdata([row])
+
+    assert movie.creation_date == '2020-05-17'
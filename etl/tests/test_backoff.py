@@ -0,0 +1,46 @@
+import pydantic
+import pytest
+
+from etl_process import backoff as backoff_module
+from etl_process.backoff import backoff
+from etl_process.settings import EtlSettings
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list:
+    slept = []
+    monkeypatch.setattr(backoff_module.time, 'sleep', slept.append)
+    return slept
+
+
+def test_backoff_without_timeout_gives_up(sleeps):
+    calls = []
+
+    @backoff(start_sleep_time=1, border_sleep_time=8, jitter=False)
+    def connect():
+        calls.append(1)
+
+    assert connect() is None
+    assert sleeps == [1, 2, 4, 8]
+    assert len(calls) == 5
+
+
+def test_backoff_reraises_last_error(sleeps):
+    @backoff(exception_types=(ConnectionError,), start_sleep_time=1, border_sleep_time=2, jitter=False)
+    def connect():
+        raise ConnectionError('refused')
+
+    with pytest.raises(ConnectionError):
+        connect()
+    assert sleeps == [1, 2]
+
+
+@pytest.mark.parametrize('name, value', [
+    ('ETL_RELATED_CHANGES', 'patch'), ('ETL_BULK_MODE', 'parallel'), ('ETL_TRANSFORM_WORKERS', '2'),
+])
+def test_async_runtime_rejects_sync_only_settings(etl_env, monkeypatch, name, value):
+    monkeypatch.setenv('ETL_RUNTIME', 'async')
+    monkeypatch.setenv(name, value)
+
+    with pytest.raises(pydantic.ValidationError):
+        EtlSettings()
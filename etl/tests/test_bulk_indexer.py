@@ -0,0 +1,87 @@
+import elasticsearch
+import orjson
+import pytest
+
+from etl_process.bulk import ParallelBulkIndexer
+from fakes import FakeElasticsearch, bulk_response
+
+
+def items(*ids: str) -> list[tuple[bytes, bytes]]:
+    return [(orjson.dumps({'index': {'_index': 'movies', '_id': id_}}), orjson.dumps({'id': id_})) for id_ in ids]
+
+
+def sent_ids(operations: list[bytes]) -> list[str]:
+    return [orjson.loads(line)['index']['_id'] for line in operations[::2]]
+
+
+@pytest.fixture
+def dead_letter_path(tmp_path):
+    return tmp_path / 'dead_letter.ndjson'
+
+
+def make_indexer(connection, dead_letter_path, **kwargs) -> ParallelBulkIndexer:
+    return ParallelBulkIndexer(connection, workers=1, initial_backoff=0, max_backoff=0,
+                               dead_letter_path=str(dead_letter_path), **kwargs)
+
+
+def test_only_throttled_documents_are_retried(dead_letter_path):
+    connection = FakeElasticsearch([bulk_response(201, 429, 201), bulk_response(201)])
+
+    success, errors = make_indexer(connection, dead_letter_path).index_items(items('1', '2', '3'))
+
+    assert (success, errors) == (3, [])
+    assert [sent_ids(request) for request in connection.requests] == [['1', '2', '3'], ['2']]
+    assert not dead_letter_path.exists()
+
+
+def test_rejected_documents_are_dead_lettered_without_retry(dead_letter_path):
+    connection = FakeElasticsearch([bulk_response(201, 400, 503), bulk_response(201)])
+
+    success, errors = make_indexer(connection, dead_letter_path).index_items(items('1', '2', '3'))
+
+    assert success == 2
+    assert [error['error'] for error in errors] == [{'type': 'mapper_parsing_exception'}]
+    assert sent_ids(connection.requests[1]) == ['3']
+    assert sent_ids(dead_letter_path.read_bytes().splitlines()) == ['2']
+
+
+def test_documents_are_dead_lettered_after_retries(dead_letter_path):
+    connection = FakeElasticsearch([bulk_response(429, 201), bulk_response(429)])
+
+    success, errors = make_indexer(connection, dead_letter_path, max_retries=1).index_items(items('1', '2'))
+
+    assert success == 1
+    assert [error['error'] for error in errors] == ['retries exhausted']
+    assert sent_ids(dead_letter_path.read_bytes().splitlines()) == ['1']
+
+
+def test_rejected_request_is_dead_lettered(dead_letter_path):
+    error = elasticsearch.ApiError('request rejected', meta=type('Meta', (), {'status': 400})(), body={})
+    connection = FakeElasticsearch([error])
+
+    success, errors = make_indexer(connection, dead_letter_path).index_items(items('1', '2'))
+
+    assert success == 0
+    assert len(errors) == 2
+    assert sent_ids(dead_letter_path.read_bytes().splitlines()) == ['1', '2']
+
+
+def test_chunk_size_adapts_to_throttling(dead_letter_path):
+    connection = FakeElasticsearch([bulk_response(*[429] * 40), bulk_response(*[201] * 40)])
+    indexer = make_indexer(connection, dead_letter_path, chunk_size=40)
+
+    indexer.index_items(items(*map(str, range(40))))
+
+    # 40 -> 20 после 429, затем после успешного повтора снова растёт: 20 * 5 // 4 + 1.
+    assert indexer._current_chunk_size == 26
+
+
+def test_replay_dead_letters(dead_letter_path):
+    make_indexer(FakeElasticsearch([bulk_response(400)]), dead_letter_path).index_items(items('1'))
+    connection = FakeElasticsearch([bulk_response(201)])
+
+    success, errors = make_indexer(connection, dead_letter_path).replay_dead_letters()
+
+    assert (success, errors) == (1, [])
+    assert sent_ids(connection.requests[0]) == ['1']
+    assert not dead_letter_path.exists()
@@ -0,0 +1,77 @@
+import uuid
+
+from etl_process.extract_data import FILM_WORK, GENRE, PERSON, changed_films_query
+from etl_process.pipeline import Checkpoint
+
+FILMS = [uuid.UUID(int=i) for i in range(1, 5)]
+UPTO = {GENRE: ['2024-01-02', str(uuid.UUID(int=100))], PERSON: None, FILM_WORK: ['2024-01-03', str(FILMS[-1])]}
+WATERMARKS = {table_name: ('2024-01-01', str(uuid.UUID(int=0))) for table_name in (GENRE, PERSON, FILM_WORK)}
+
+
+def record_loaded_batches(extractor, monkeypatch) -> list:
+    """Заменить загрузку записью id фильмов из запросов и фиксацией маркеров Checkpoint."""
+    loaded = []
+
+    def load_movies(chunks):
+        for chunk in chunks:
+            if isinstance(chunk, Checkpoint):
+                chunk.commit()
+
+    monkeypatch.setattr(extractor, 'load_movies', load_movies)
+    monkeypatch.setattr(extractor, 'iter_films_info', lambda films_id: loaded.append(films_id) or iter(()))
+    return loaded
+
+
+def test_changed_films_query_skips_empty_tables():
+    query, params = changed_films_query(WATERMARKS, UPTO, (GENRE, PERSON, FILM_WORK), FILMS[0])
+
+    assert query.count('UNION') == 1
+    assert 'content.genre_film_work' in query and 'content.person' not in query
+    assert params == [*WATERMARKS[GENRE], *UPTO[GENRE], *WATERMARKS[FILM_WORK], *UPTO[FILM_WORK], FILMS[0]]
+
+
+def test_changed_films_query_without_sources():
+    assert changed_films_query(WATERMARKS, {FILM_WORK: None}, (FILM_WORK,), FILMS[0]) == (None, [])
+
+
+def test_sync_movies_resumes_after_loaded_film(make_extractor, monkeypatch):
+    extractor = make_extractor([('as changed', [{'id': film_id} for film_id in FILMS[1:]])], batch_size=2)
+    extractor.state.set_state('movies', {'watermarks': {}, 'cycle': {'upto': UPTO, 'loaded': str(FILMS[0])}})
+    loaded = record_loaded_batches(extractor, monkeypatch)
+
+    extractor.sync_movies()
+
+    (_, params), = extractor.cursor.queries('as changed')
+    assert params[-1] == FILMS[0]
+    assert loaded == [FILMS[1:3], FILMS[3:]]
+    assert extractor.state.get_state('movies') == {
+        'watermarks': {GENRE: UPTO[GENRE], FILM_WORK: UPTO[FILM_WORK]}, 'cycle': None
+    }
+
+
+def test_changelog_is_deleted_after_each_batch(make_extractor, monkeypatch):
+    batches = [
+        [{'id': 1, 'table_name': FILM_WORK, 'film_work_id': FILMS[0], 'person_id': None, 'genre_id': None},
+         {'id': 2, 'table_name': GENRE, 'film_work_id': None, 'person_id': None, 'genre_id': uuid.UUID(int=100)}],
+        [{'id': 3, 'table_name': PERSON, 'film_work_id': None, 'person_id': uuid.UUID(int=200), 'genre_id': None}],
+    ]
+    extractor = make_extractor([
+        ('DELETE FROM', []),
+        ('FROM content.etl_changelog', lambda params: batches.pop(0) if batches else []),
+        ('as changed', lambda params: [{'id': film_id} for film_id in params[0]]),
+    ], batch_size=2)
+    loaded = record_loaded_batches(extractor, monkeypatch)
+    persons = []
+    monkeypatch.setattr(extractor, 'load_persons_by_ids', persons.append)
+    commits = extractor.conn.commits
+
+    extractor.fetch_changes_from_changelog()
+
+    deleted = [params[0] for _, params in extractor.cursor.queries('DELETE FROM content.etl_changelog')]
+    assert deleted == [[1, 2], [3]]
+    assert extractor.conn.commits == commits + 2
+    (_, first), (_, second) = extractor.cursor.queries('as changed')
+    assert first == ([FILMS[0]], [uuid.UUID(int=100)], [])
+    assert second == ([], [], [uuid.UUID(int=200)])
+    assert loaded == [[FILMS[0]]]
+    assert persons == [[uuid.UUID(int=200)]]
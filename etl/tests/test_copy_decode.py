@@ -0,0 +1,21 @@
+import json
+
+from etl_process.extract_data import PostgresExtractor
+
+DOCUMENTS = [
+    {'id': '1', 'title': 'Quote " and backslash \\ inside', 'genres': [{'name': 'Drama'}]},
+    {'id': '2', 'title': 'Перевод строки\nв описании', 'genres': []},
+]
+
+
+def copy_text(documents: list[dict]) -> bytes:
+    """Строки COPY ... TO STDOUT в текстовом формате: обратная косая черта экранируется удвоением."""
+    return b''.join(json.dumps(document).encode().replace(b'\\', b'\\\\') + b'\n' for document in documents)
+
+
+def test_decode_copy_block():
+    assert PostgresExtractor.decode_copy_block(copy_text(DOCUMENTS)) == DOCUMENTS
+
+
+def test_decode_single_row_without_trailing_newline():
+    assert PostgresExtractor.decode_copy_block(copy_text(DOCUMENTS[:1]).rstrip(b'\n')) == DOCUMENTS[:1]
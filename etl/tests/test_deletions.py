@@ -0,0 +1,107 @@
+import uuid
+
+import orjson
+import pytest
+
+from etl_process.bulk import BulkLoadError
+from etl_process.extract_data import (FILM_WORK, GENRE_FILM_WORK, PERSON, PERSON_FILM_WORK, deletion_changes,
+                                      split_tombstones)
+from fakes import FakeElasticsearch, bulk_response
+
+DELETED_FILM, FILM = uuid.UUID(int=1), uuid.UUID(int=2)
+DELETED_PERSON, ACTOR = uuid.UUID(int=11), uuid.UUID(int=12)
+GENRE, REINSERTED_GENRE = uuid.UUID(int=21), uuid.UUID(int=22)
+
+
+def tombstone(id_, table_name, film_work_id=None, person_id=None, genre_id=None, role=None) -> dict:
+    return {'id': id_, 'table_name': table_name, 'film_work_id': film_work_id, 'person_id': person_id,
+            'genre_id': genre_id, 'role': role}
+
+
+TOMBSTONES = [
+    tombstone(1, FILM_WORK, film_work_id=DELETED_FILM),
+    tombstone(2, PERSON_FILM_WORK, film_work_id=DELETED_FILM, person_id=ACTOR, role='actor'),
+    tombstone(3, PERSON_FILM_WORK, film_work_id=FILM, person_id=ACTOR, role='actor'),
+    tombstone(4, GENRE_FILM_WORK, film_work_id=FILM, genre_id=GENRE),
+    tombstone(5, GENRE_FILM_WORK, film_work_id=FILM, genre_id=REINSERTED_GENRE),
+    tombstone(6, PERSON, person_id=DELETED_PERSON),
+]
+
+RESPONSES = [
+    ('SELECT id, table_name', TOMBSTONES),
+    # Связь с жанром удалили и вставили заново: документ фильма её сохраняет.
+    ('FROM content.genre_film_work', [{'film_work_id': FILM, 'genre_id': REINSERTED_GENRE}]),
+]
+
+
+def applied_migrations(extractor) -> list[str]:
+    return [params[0] for _, params in extractor.cursor.queries('INSERT INTO content.etl_migration')]
+
+
+def bulk_ids(operations: list[bytes]) -> list[str]:
+    return [orjson.loads(line)['delete']['_id'] for line in operations]
+
+
+def test_tombstones_migration_is_applied_without_changelog(make_extractor):
+    extractor = make_extractor(change_source='modified')
+
+    assert applied_migrations(extractor) == ['0003_tombstones.sql']
+    assert not extractor.cursor.queries('etl_changelog')
+
+
+def test_changelog_migrations_are_applied_in_changelog_mode(make_extractor):
+    extractor = make_extractor(change_source='changelog')
+
+    assert applied_migrations(extractor) == ['0001_changelog.sql', '0002_notify.sql', '0003_tombstones.sql']
+
+
+def test_applied_migrations_are_skipped(make_extractor):
+    extractor = make_extractor([('SELECT name FROM content.etl_migration', [{'name': '0003_tombstones.sql'}])])
+
+    assert applied_migrations(extractor) == []
+
+
+def test_deletion_changes_skip_links_of_deleted_documents():
+    deleted = {table_name: set(keys) for table_name, keys in split_tombstones(TOMBSTONES).items()}
+
+    movie_links, person_films = deletion_changes(deleted)
+
+    assert list(movie_links) == [str(FILM)]
+    assert movie_links[str(FILM)]['persons'] == [{'id': str(ACTOR), 'role': 'actors'}]
+    assert sorted(movie_links[str(FILM)]['genres']) == sorted([str(GENRE), str(REINSERTED_GENRE)])
+    assert person_films == {str(ACTOR): {str(DELETED_FILM): ['actor'], str(FILM): ['actor']}}
+
+
+def test_sync_deletions(make_extractor, es_loader):
+    extractor = make_extractor(RESPONSES)
+    es_loader.connection = FakeElasticsearch([
+        bulk_response(200, op_type='delete'), bulk_response(404, op_type='delete'),
+    ])
+
+    extractor.sync_deletions()
+
+    movies_delete, persons_delete, movie_links, person_films = es_loader.connection.requests
+    assert bulk_ids(movies_delete) == [str(DELETED_FILM)]
+    assert bulk_ids(persons_delete) == [str(DELETED_PERSON)]
+    assert movie_links['script']['params']['links'] == {
+        str(FILM): {'persons': [{'id': str(ACTOR), 'role': 'actors'}], 'genres': [str(GENRE)]}
+    }
+    assert person_films['script']['params']['links'] == {
+        str(ACTOR): {str(DELETED_FILM): ['actor'], str(FILM): ['actor']}
+    }
+
+    (_, params), = extractor.cursor.queries('DELETE FROM content.etl_tombstone')
+    assert params == ([1, 2, 3, 4, 5, 6],)
+    assert extractor.conn.commits >= 1
+
+
+def test_tombstones_are_kept_when_documents_are_not_deleted(make_extractor, es_loader):
+    extractor = make_extractor(RESPONSES)
+    es_loader.connection = FakeElasticsearch([bulk_response(503, op_type='delete')])
+    commits = extractor.conn.commits
+
+    with pytest.raises(BulkLoadError):
+        extractor.sync_deletions()
+
+    assert not extractor.cursor.queries('DELETE FROM content.etl_tombstone')
+    assert extractor.conn.commits == commits
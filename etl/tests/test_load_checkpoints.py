@@ -0,0 +1,141 @@
+from concurrent.futures import Future
+from functools import partial
+from types import SimpleNamespace
+
+import elastic_transport
+import pytest
+
+from etl_process.bulk import BulkLoadError, ParallelBulkIndexer
+from etl_process.documents import dumps
+from etl_process.pipeline import Checkpoint
+from fakes import FakeElasticsearch, bulk_response
+from state.hash_store import DocumentHashStore
+from state.json_file_storage import JsonFileStorage
+
+
+def encode(rows: list[dict]) -> list[tuple[str, bytes]]:
+    return [(row['id'], dumps(row)) for row in rows]
+
+
+def batches(committed: list) -> list:
+    """Две партии по два документа, за каждой - маркер контрольной точки."""
+    return [
+        [{'id': '1'}, {'id': '2'}], Checkpoint(partial(committed.append, 'first')),
+        [{'id': '3'}, {'id': '4'}], Checkpoint(partial(committed.append, 'second')),
+    ]
+
+
+def test_send_bulk_raises_when_documents_fail(es_loader):
+    es_loader.connection = FakeElasticsearch([bulk_response(201, 400)])
+
+    with pytest.raises(BulkLoadError):
+        es_loader.bulk_index_bodies('movies', encode([{'id': '1'}, {'id': '2'}]))
+
+
+def test_send_bulk_raises_on_transport_error(es_loader):
+    es_loader.connection = FakeElasticsearch([elastic_transport.ConnectionError('connection refused')])
+
+    with pytest.raises(BulkLoadError):
+        es_loader.delete_documents('movies', ['1'])
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_checkpoint_is_not_committed_after_failed_batch(make_extractor, es_loader, pipeline):
+    extractor = make_extractor(pipeline=pipeline)
+    es_loader.connection = FakeElasticsearch([bulk_response(201, 201), bulk_response(201, 429)])
+    committed = []
+
+    with pytest.raises(BulkLoadError):
+        extractor.run_load('movies', batches(committed), encode, None, partial(es_loader.bulk_index_bodies, 'movies'))
+
+    assert committed == ['first']
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_checkpoint_is_committed_after_loaded_batches(make_extractor, es_loader, pipeline):
+    extractor = make_extractor(pipeline=pipeline)
+    es_loader.connection = FakeElasticsearch([bulk_response(201, 201), bulk_response(200, 201)])
+    committed = []
+
+    extractor.run_load('movies', batches(committed), encode, None, partial(es_loader.bulk_index_bodies, 'movies'))
+
+    assert committed == ['first', 'second']
+
+
+def test_checkpoint_is_committed_when_failures_are_dead_lettered(make_extractor, es_loader, tmp_path):
+    extractor = make_extractor()
+    dead_letter_path = tmp_path / 'dead_letter.ndjson'
+    es_loader.connection = FakeElasticsearch([bulk_response(201, 201), bulk_response(201, 400)])
+    es_loader.bulk_indexer = ParallelBulkIndexer(
+        es_loader.connection, workers=1, max_retries=0, dead_letter_path=str(dead_letter_path)
+    )
+    committed = []
+
+    extractor.run_load('movies', batches(committed), encode, None, partial(es_loader.bulk_index_bodies, 'movies'))
+
+    assert committed == ['first', 'second']
+    assert b'"_id":"4"' in dead_letter_path.read_bytes()
+
+
+def test_hashes_are_not_committed_for_failed_batch(es_loader):
+    es_loader.hash_store = DocumentHashStore(JsonFileStorage('hashes.json'))
+    es_loader.connection = FakeElasticsearch([bulk_response(201, 400), bulk_response(201, 201)])
+    bodies = encode([{'id': '1'}, {'id': '2'}])
+
+    with pytest.raises(BulkLoadError):
+        es_loader.bulk_index_bodies('movies', bodies)
+    es_loader.bulk_index_bodies('movies', bodies)
+
+    assert len(es_loader.connection.requests) == 2
+
+
+class RecordingTransform:
+    """Преобразование без процессов: Future готов сразу, порядок отправки записывается в events."""
+    def __init__(self, events: list):
+        self.events = events
+
+    def feed(self, rows: list[dict]) -> Future:
+        self.events.append(('transform', rows[0]['id']))
+        future = Future()
+        future.set_result(encode(rows))
+        return future
+
+    def flush(self) -> None:
+        return None
+
+
+def test_pooled_load_keeps_window_of_transformed_batches(make_extractor, monkeypatch):
+    extractor = make_extractor(transform_workers=2)
+    events = []
+    extractor._transform_pool = SimpleNamespace(transform=lambda name, aggregated: RecordingTransform(events))
+    monkeypatch.setattr(extractor.load_data, 'bulk_index_bodies',
+                        lambda alias, bodies: events.append(('load', bodies[0][0])))
+    chunks = [
+        [{'id': '1'}], Checkpoint(partial(events.append, ('commit', '1'))),
+        [{'id': '2'}], Checkpoint(partial(events.append, ('commit', '2'))),
+        [{'id': '3'}], Checkpoint(partial(events.append, ('commit', '3'))),
+    ]
+
+    extractor.run_pooled_load('movies', chunks, True, 'movies')
+
+    assert events == [
+        ('transform', '1'), ('transform', '2'), ('transform', '3'),
+        ('load', '1'), ('commit', '1'), ('load', '2'), ('commit', '2'), ('load', '3'), ('commit', '3'),
+    ]
+
+
+def test_pooled_load_does_not_commit_after_failed_batch(make_extractor, monkeypatch):
+    extractor = make_extractor(transform_workers=1)
+    extractor._transform_pool = SimpleNamespace(transform=lambda name, aggregated: RecordingTransform([]))
+
+    def bulk_index_bodies(alias, bodies):
+        if bodies[0][0] == '3':
+            raise BulkLoadError(alias)
+
+    monkeypatch.setattr(extractor.load_data, 'bulk_index_bodies', bulk_index_bodies)
+    committed = []
+
+    with pytest.raises(BulkLoadError):
+        extractor.run_pooled_load('movies', batches(committed), True, 'movies')
+
+    assert committed == ['first']
@@ -0,0 +1,52 @@
+import uuid
+from datetime import datetime, timezone
+
+import orjson
+
+from fakes import FakeElasticsearch, bulk_response
+from state.hash_store import DocumentHashStore
+from state.json_file_storage import JsonFileStorage
+
+PERSON_ID, FILM_ID = uuid.UUID(int=1), uuid.UUID(int=2)
+MODIFIED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+RESPONSES = [
+    ('SELECT id, full_name FROM content.person', [{'id': PERSON_ID, 'full_name': 'New Name'}]),
+    ('FROM content.person as p', [{'person_id': PERSON_ID, 'full_name': 'New Name', 'role': 'actor',
+                                   'film_id': FILM_ID}]),
+    ('WHERE modified > %s', [{'id': PERSON_ID, 'modified': MODIFIED}]),
+    ('(modified, id) >', [{'id': PERSON_ID, 'modified': MODIFIED}]),
+]
+
+
+def test_renamed_persons_are_reindexed_in_patch_mode(make_extractor, es_loader):
+    extractor = make_extractor(RESPONSES, related_changes='patch')
+    es_loader.connection = FakeElasticsearch([bulk_response(200)])
+
+    extractor.fetch_persons_if_persons_changed(str(datetime.min))
+
+    (header, body), = es_loader.connection.requests
+    assert orjson.loads(header) == {'index': {'_index': 'persons', '_id': str(PERSON_ID)}}
+    assert orjson.loads(body)['full_name'] == 'New Name'
+
+
+def test_renamed_persons_are_patched_in_movies(make_extractor, es_loader):
+    extractor = make_extractor(RESPONSES, related_changes='patch')
+
+    extractor.fetch_movies_if_persons_changed(str(datetime.min))
+
+    request, = es_loader.connection.requests
+    assert request['index'] == 'movies'
+    assert request['script']['params']['names'] == {str(PERSON_ID): 'New Name'}
+
+
+def test_patched_movies_are_forgotten_by_hash_store(make_extractor, es_loader, monkeypatch, tmp_path):
+    extractor = make_extractor(RESPONSES, related_changes='patch')
+    es_loader.hash_store = DocumentHashStore(JsonFileStorage(str(tmp_path / 'hashes.json')))
+    es_loader.hash_store.commit('movies', {str(FILM_ID): 'old', 'other': 'kept'})
+    monkeypatch.setattr(es_loader, 'matching_ids', lambda alias, query: [str(FILM_ID)])
+
+    extractor.fetch_movies_if_persons_changed(str(datetime.min))
+
+    # Иначе пересобранный позже фильм совпал бы со старым хешем и не был бы загружен.
+    assert es_loader.hash_store.known_hashes('movies', []) == {'other': 'kept'}
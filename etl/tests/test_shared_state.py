@@ -0,0 +1,76 @@
+import time
+
+import pytest
+
+from state.hash_store import DocumentHashStore
+from state.lease import LeaseLostError, ShardLeases, ensure_lease
+from state.sqlite_storage import SqliteStorage
+from state.state import State
+
+
+@pytest.fixture
+def sqlite_path(tmp_path) -> str:
+    return str(tmp_path / 'state.sqlite')
+
+
+def test_compare_and_set(sqlite_path):
+    storage = SqliteStorage(sqlite_path, 'leases')
+
+    assert storage.compare_and_set('lease', None, {'owner': 'a'})
+    assert not storage.compare_and_set('lease', None, {'owner': 'b'})
+    assert not storage.compare_and_set('lease', {'owner': 'b'}, {'owner': 'c'})
+    assert storage.compare_and_set('lease', {'owner': 'a'}, {'owner': 'b'})
+    assert storage.get_value('lease') == {'owner': 'b'}
+
+
+def test_batch_values_are_separated_by_namespace(sqlite_path):
+    storage, other = SqliteStorage(sqlite_path, 'hashes'), SqliteStorage(sqlite_path, 'state')
+    storage.save_values({'movies:1': 'a', 'movies:2': 'b', 'persons:1': 'c'})
+    other.save_values({'movies:1': 'z'})
+
+    storage.delete_values(['movies:1'])
+    storage.delete_prefix('persons:')
+
+    assert storage.get_values(['movies:1', 'movies:2', 'persons:1']) == {'movies:2': 'b'}
+    assert other.get_values(['movies:1']) == {'movies:1': 'z'}
+
+
+def test_shared_hash_store_sees_other_instances(sqlite_path):
+    first = DocumentHashStore(SqliteStorage(sqlite_path, 'hashes'))
+    second = DocumentHashStore(SqliteStorage(sqlite_path, 'hashes'))
+    old, new = [('1', b'{"title":"old"}')], [('1', b'{"title":"new"}')]
+
+    _, pending = first.filter_changed_encoded('movies', old)
+    first.commit('movies', pending)
+    _, pending = second.filter_changed_encoded('movies', new)
+    second.commit('movies', pending)
+
+    # Второй экземпляр загрузил новую версию: первый не пропускает старую как неизменившуюся.
+    changed, _ = first.filter_changed_encoded('movies', old)
+    assert changed == old
+    changed, _ = first.filter_changed_encoded('movies', new)
+    assert changed == []
+
+
+def test_lost_lease_stops_commits(sqlite_path):
+    storage = SqliteStorage(sqlite_path, 'leases')
+    leases = ShardLeases(storage, 'first', ttl=0.3)
+    state = State(SqliteStorage(sqlite_path, 'state'))
+
+    with pytest.raises(LeaseLostError):
+        with leases.hold('movies') as owned:
+            assert owned
+            state.set_state('movies', 'before')
+            # Аренду забрал другой экземпляр, например после паузы этого дольше ttl.
+            storage.save_value(leases.lease_key('movies'), {'owner': 'second', 'expires_at': time.time() + 60})
+            deadline = time.monotonic() + 5
+            while time.monotonic() < deadline:
+                try:
+                    ensure_lease()
+                except LeaseLostError:
+                    break
+                time.sleep(0.05)
+            state.set_state('movies', 'after')
+
+    assert state.get_state('movies') == 'before'
+    assert storage.get_value(leases.lease_key('movies'))['owner'] == 'second'
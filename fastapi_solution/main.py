@@ -1,3 +1,6 @@
+import asyncio
+from typing import Optional
+
 from elasticsearch import AsyncElasticsearch
 from fastapi import FastAPI
 from fastapi.responses import ORJSONResponse
@@ -7,6 +10,9 @@ from redis.asyncio import Redis
 from fastapi_solution.src.api.v1 import films, genres, persons
 from fastapi_solution.src.core import config
 from fastapi_solution.src.db import elastic, redis
+from fastapi_solution.src.services.cache_stats import log_local_cache_stats, report_local_cache_stats
+from fastapi_solution.src.services.invalidation import listen_invalidations
+from fastapi_solution.src.services.registry import get_services
 
 app = FastAPI(
     title=config.PROJECT_NAME,
@@ -18,15 +24,36 @@ app = FastAPI(
 
 add_pagination(app)
 
-    
+invalidations: Optional[asyncio.Task] = None
+cache_stats: Optional[asyncio.Task] = None
+services: list = []
+
+
 @app.on_event('startup')
 async def startup():
+    global invalidations, cache_stats, services
     redis.redis = Redis(host=config.REDIS_HOST, port=config.REDIS_PORT)
     elastic.es = AsyncElasticsearch(hosts=[f'http://{config.ELASTIC_HOST}:{config.ELASTIC_PORT}'])
 
+    services = get_services(redis.redis, elastic.es)
+
+    if config.CACHE_SUBSCRIBE_INVALIDATIONS:
+        invalidations = asyncio.create_task(
+            listen_invalidations(redis.redis, config.CACHE_INVALIDATION_CHANNEL, services)
+        )
+
+    if config.CACHE_LOCAL_SIZE and config.CACHE_STATS_INTERVAL:
+        cache_stats = asyncio.create_task(report_local_cache_stats(services, config.CACHE_STATS_INTERVAL))
+
 
 @app.on_event('shutdown')
 async def shutdown():
+    if invalidations is not None:
+        invalidations.cancel()
+    if cache_stats is not None:
+        cache_stats.cancel()
+    if config.CACHE_LOCAL_SIZE:
+        log_local_cache_stats(services)
     await redis.redis.close()
     await elastic.es.close()
 
@@ -1,9 +1,10 @@
 import logging
+from datetime import date
 from http import HTTPStatus
 from typing import Literal, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi_pagination import Page, paginate
+from fastapi_pagination import Page, Params, paginate
 
 from ...models.models import FilmFullResponse, FilmResponse
 from ...services.film_service import FilmService, get_film_service
@@ -52,34 +53,22 @@ async def films(
         film_service: FilmService = Depends(get_film_service),
         rating: Optional[float] = Query(None),
         genre: Optional[str] = Query(None),
-        creation_date: Optional[str] = Query(None),
-        sort_by: Optional[Literal['imdb_rating', 'creation_date']] = Query(None)
+        creation_date: Optional[date] = Query(None),
+        sort_by: Optional[Literal['imdb_rating', 'creation_date']] = Query(None),
+        params: Params = Depends(),
 ) -> Page[FilmResponse]:
     log.info('Получение фильмов ...')
-    films_list = await film_service.get_all_films()
+    # Фильтры по рейтингу, жанру и дате создания, сортировка по убыванию и пагинация - в Elasticsearch.
+    films_page = await film_service.get_films_page(
+        params.page, params.size, rating=rating, genre=genre, creation_date=creation_date, sort_by=sort_by
+    )
 
-    if not films_list:
+    if not films_page or not films_page.total:
         log.info('Фильмы не найдены.')
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='film not found')
 
-    # Фильтрация по рейтингу.
-    if rating is not None:
-        films_list = [film for film in films_list if film.imdb_rating >= rating]
-
-    # Фильтрация по жанру.
-    if genre is not None:
-        films_list = [film for film in films_list if genre in [genre['name'] for genre in film.genres]]
-
-    # Фильтрация по дате создания.
-    if creation_date is not None:
-        films_list = [film for film in films_list if film.creation_date >= creation_date]
-
-    # Сортировка по рейтингу или дате создания.
-    if sort_by is not None:
-        films_list = sorted(films_list, key=lambda f: f.imdb_rating, reverse=True)
-
-    log.info(f'Получено {len(films_list)} фильмов.')
-    return paginate(films_list)
+    log.info(f'Получено {len(films_page.items)} фильмов из {films_page.total}.')
+    return Page.create(films_page.items, params, total=films_page.total)
 
 
 @router.get(
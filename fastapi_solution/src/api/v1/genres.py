@@ -2,7 +2,7 @@ import logging
 from http import HTTPStatus
 
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi_pagination import Page, paginate
+from fastapi_pagination import Page, Params
 
 from ...models.models import Genre
 from ...services.genre_service import GenreService, get_genre_service
@@ -42,22 +42,16 @@ async def genre_details(genre_id: str, genre_service: GenreService = Depends(get
     response_description='Информация по жанрам'
 )
 async def genres(
-        genre_service: GenreService = Depends(get_genre_service)) -> Page[Genre]:
+        genre_service: GenreService = Depends(get_genre_service),
+        params: Params = Depends(),
+) -> Page[Genre]:
     log.info('Получение жанров ...')
-    genres_list = await genre_service.get_all_genres()
+    genres_page = await genre_service.get_genres_page(params.page, params.size)
 
-    if not genres_list:
+    if not genres_page:
         log.info('Жанры не найдены.')
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='genre not found')
 
-    genres_list = [
-        Genre(
-            id=cls.id,
-            name=cls.name,
-            description=cls.description
-        )
-        for cls in genres_list
-    ]
-
-    log.info(f'Получено {len(genres_list)} жанров.')
-    return paginate(genres_list)
+    genres_list, total = genres_page
+    log.info(f'Получено {len(genres_list)} жанров из {total}.')
+    return Page.create(genres_list, params, total=total)
@@ -3,7 +3,7 @@ from http import HTTPStatus
 from typing import Literal, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi_pagination import Page, paginate
+from fastapi_pagination import Page, Params
 
 from ...models.models import Person
 from ...services.person_service import PersonService, get_person_service
@@ -43,21 +43,16 @@ async def genre_details(
 )
 async def persons(
         person_service: PersonService = Depends(get_person_service),
-        sort_by: Optional[Literal['writer', 'director', 'actor']] = Query(None)
+        sort_by: Optional[Literal['writer', 'director', 'actor']] = Query(None),
+        params: Params = Depends(),
 ) -> Page[Person]:
     log.info('Получение персон ...')
-    persons_list = await person_service.get_all_persons()
+    # sort_by оставляет только персон с выбранной ролью; фильтр и пагинация - в Elasticsearch.
+    persons_page = await person_service.get_persons_page(params.page, params.size, role=sort_by)
 
-    if not persons:
+    if not persons_page or not persons_page.total:
         log.info(f'Персон не найдено.')
         raise HTTPException(status_code=HTTPStatus.NOT_FOUND, detail='Persons not found')
 
-    if sort_by is not None:
-        # получение только тек персон, роли которых совпадают с выбранным
-        persons_list = [
-            person for person in persons_list
-            if any(role == sort_by for film in person.films for role in film['roles'])
-        ]
-
-    log.info(f'Получено {len(persons_list)} персон.')
-    return paginate(persons_list)
+    log.info(f'Получено {len(persons_page.items)} персон из {persons_page.total}.')
+    return Page.create(persons_page.items, params, total=persons_page.total)
@@ -1,7 +1,7 @@
 import os
 from logging import config as logging_config
 
-from .env_config import ElasticsearchSettings, RedisSettings, Settings
+from .env_config import CacheSettings, ElasticsearchSettings, RedisSettings, Settings
 from .logger import LOGGING
 
 logging_config.dictConfig(LOGGING)
@@ -17,4 +17,14 @@ es_settings = ElasticsearchSettings()
 ELASTIC_HOST = es_settings.ELASTIC_HOST
 ELASTIC_PORT = es_settings.ELASTIC_PORT
 
+cache_settings = CacheSettings()
+CACHE_TTL = cache_settings.CACHE_TTL
+CACHE_SUBSCRIBE_INVALIDATIONS = cache_settings.CACHE_SUBSCRIBE_INVALIDATIONS
+CACHE_INVALIDATION_CHANNEL = cache_settings.CACHE_INVALIDATION_CHANNEL
+CACHE_REDIS_LOCK = cache_settings.CACHE_REDIS_LOCK
+CACHE_LOCK_TIMEOUT = cache_settings.CACHE_LOCK_TIMEOUT
+CACHE_LOCAL_SIZE = cache_settings.CACHE_LOCAL_SIZE
+CACHE_LOCAL_TTL = cache_settings.CACHE_LOCAL_TTL
+CACHE_STATS_INTERVAL = cache_settings.CACHE_STATS_INTERVAL
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -15,6 +15,19 @@ class ElasticsearchSettings(BaseSettings):
     ELASTIC_PORT: int
 
 
+class CacheSettings(BaseSettings):
+    model_config = SettingsConfigDict(extra='ignore', env_file='.env')
+
+    CACHE_TTL: int = 60 * 5
+    CACHE_SUBSCRIBE_INVALIDATIONS: bool = False
+    CACHE_INVALIDATION_CHANNEL: str = 'cache:invalidate'
+    CACHE_REDIS_LOCK: bool = False
+    CACHE_LOCK_TIMEOUT: float = 5
+    CACHE_LOCAL_SIZE: int = 1000
+    CACHE_LOCAL_TTL: float = 30
+    CACHE_STATS_INTERVAL: float = 300
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(extra='allow', env_file='.env')
 
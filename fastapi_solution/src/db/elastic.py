@@ -4,6 +4,9 @@ from elasticsearch import AsyncElasticsearch
 
 es: Optional[AsyncElasticsearch] = None
 
+# Дальше from + size Elasticsearch не отдаёт (index.max_result_window).
+MAX_RESULT_WINDOW = 10000
+
 
 async def get_elastic() -> AsyncElasticsearch:
     return es
@@ -37,6 +37,11 @@ class FilmResponse(BaseModel):
     imdb_rating: Optional[float]
 
 
+class FilmsPage(BaseModel):
+    total: int
+    items: list[FilmResponse]
+
+
 class Genre(BaseModel):
     id: str
     name: str
@@ -49,6 +54,11 @@ class Person(BaseModel):
     films: list[dict]
 
 
+class PersonsPage(BaseModel):
+    total: int
+    items: list[Person]
+
+
 class Actor(BaseModel):
     id: str
     full_name: str
@@ -0,0 +1,228 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, Optional, Type, TypeVar
+
+from pydantic import BaseModel
+from redis.asyncio import Redis
+from redis.exceptions import LockError
+
+from ..core import config
+
+# Один срок жизни для всех записей кеша в Redis: документов, страниц и коллекций.
+# С инвалидацией от ETL (CACHE_SUBSCRIBE_INVALIDATIONS) его можно сделать длинным.
+CACHE_EXPIRE_IN_SECONDS = config.CACHE_TTL
+
+# Поколения LocalCache хранятся не меньше чем для стольких ключей, даже если кеш в памяти отключён.
+MIN_GENERATIONS = 1000
+
+Item = TypeVar('Item', bound=BaseModel)
+Value = TypeVar('Value')
+
+
+class ListCache(Generic[Item]):
+    """
+    Коллекция документов в одном Redis-списке с общим сроком жизни.
+
+    Страница читается через LRANGE и LLEN за O(размер страницы), без KEYS и SCAN
+    по всему пространству ключей. Новая версия коллекции собирается во временном
+    ключе и атомарно подменяет старую через RENAME: читатели видят либо прежнюю
+    коллекцию целиком, либо новую.
+    """
+    def __init__(self, redis: Redis, key: str, model: Type[Item], expire: int = CACHE_EXPIRE_IN_SECONDS):
+        self.redis = redis
+        self.key = key
+        self.model = model
+        self.expire = expire
+
+    async def get_page(self, offset: int, size: int) -> Optional[tuple[list[Item], int]]:
+        """Документы страницы и размер коллекции или None, если коллекции нет в кеше."""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrange(self.key, offset, offset + size - 1)
+            pipe.llen(self.key)
+            data, total = await pipe.execute()
+
+        if not total:
+            return None
+        return [self.model.parse_raw(item) for item in data], total
+
+    async def put(self, items: list[Item]) -> None:
+        if not items:
+            return
+
+        new_key = f'{self.key}:{uuid.uuid4().hex}'
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.rpush(new_key, *(item.json() for item in items))
+            pipe.expire(new_key, self.expire)
+            pipe.rename(new_key, self.key)
+            await pipe.execute()
+
+    async def clear(self) -> None:
+        await self.redis.delete(self.key)
+
+
+class PageIndex:
+    """
+    Страницы списков одной сущности под ключами из параметров запроса и Redis-множество
+    их ключей: при изменении документов все страницы удаляются без SCAN и KEYS.
+    """
+    def __init__(self, redis: Redis, key: str, expire: int = CACHE_EXPIRE_IN_SECONDS):
+        self.redis = redis
+        self.key = key
+        self.expire = expire
+
+    async def put(self, page_key: str, data: str) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(page_key, data, self.expire)
+            pipe.sadd(self.key, page_key)
+            pipe.expire(self.key, self.expire)
+            await pipe.execute()
+
+    async def clear(self) -> None:
+        # Множество забирается и удаляется атомарно: страницы, записанные после, попадут в новое.
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.smembers(self.key)
+            pipe.delete(self.key)
+            page_keys, _ = await pipe.execute()
+
+        if page_keys:
+            await self.redis.delete(*page_keys)
+
+
+class LocalCache(Generic[Value]):
+    """
+    Кеш первого уровня в памяти процесса перед Redis: готовые модели без сетевого
+    запроса и повторной валидации pydantic.
+
+    Не больше max_size записей, при переполнении вытесняется давно не читавшаяся
+    (LRU); запись живёт ttl секунд. max_size=0 отключает кеш. hits и misses -
+    счётчики попаданий и промахов.
+
+    delete увеличивает поколение ключа. Запрос запоминает generation до обращения
+    к Redis и Elasticsearch и передаёт его в put: если за это время ключ инвалидировали,
+    устаревшая модель в кеш не попадает. Поколения хранятся для последних
+    max(max_size, MIN_GENERATIONS) инвалидированных ключей, остальные ключи получают
+    поколение последнего вытесненного: после вытеснения запись в худшем случае
+    один раз не кешируется, но устаревшая - никогда.
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict[str, tuple[float, Value]] = OrderedDict()
+        self._clock = 0
+        self._generations: OrderedDict[str, int] = OrderedDict()
+        self._evicted_generation = 0
+
+    def get(self, key: str) -> Optional[Value]:
+        item = self._items.get(key)
+
+        if item is None or item[0] <= time.monotonic():
+            if item is not None:
+                del self._items[key]
+            self.misses += 1
+            return None
+
+        self._items.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def generation(self, key: str) -> int:
+        return self._generations.get(key, self._evicted_generation)
+
+    def put(self, key: str, value: Value, generation: Optional[int] = None) -> None:
+        """Сохранить значение; с generation - только если ключ с тех пор не инвалидировали."""
+        if not self.max_size or (generation is not None and generation != self.generation(key)):
+            return
+
+        self._items[key] = (time.monotonic() + self.ttl, value)
+        self._items.move_to_end(key)
+
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._items.pop(key, None)
+
+        self._clock += 1
+        self._generations[key] = self._clock
+        self._generations.move_to_end(key)
+        while len(self._generations) > max(self.max_size, MIN_GENERATIONS):
+            _, self._evicted_generation = self._generations.popitem(last=False)
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._items),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SingleFlight:
+    """
+    Один запрос к Elasticsearch на ключ при одновременных промахах кеша.
+
+    Конкурентные вызовы do с одним ключом в процессе ждут одну задачу загрузки
+    и получают её результат; отмена одного из ожидающих запросов загрузку не
+    прерывает. С redis (CACHE_REDIS_LOCK) то же работает между воркерами uvicorn:
+    загружает воркер, захвативший блокировку {key}:lock, остальные опрашивают
+    кеш через cached, пока блокировка не освободится, и загружают сами, только
+    если значение так и не появилось.
+    """
+    def __init__(self, redis: Optional[Redis] = None, lock_timeout: float = 5, poll_interval: float = 0.05):
+        self.redis = redis
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    async def do(
+            self,
+            key: str,
+            load: Callable[[], Awaitable[Value]],
+            cached: Optional[Callable[[], Awaitable[Optional[Value]]]] = None,
+    ) -> Value:
+        """Результат load (загрузка и запись в кеш), общий для всех одновременных вызовов с ключом key."""
+        task = self._tasks.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, load, cached))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+
+        return await asyncio.shield(task)
+
+    async def _load(
+            self,
+            key: str,
+            load: Callable[[], Awaitable[Value]],
+            cached: Optional[Callable[[], Awaitable[Optional[Value]]]],
+    ) -> Value:
+        if self.redis is None or cached is None:
+            return await load()
+
+        lock = self.redis.lock(f'{key}:lock', timeout=self.lock_timeout)
+        if await lock.acquire(blocking=False):
+            try:
+                return await load()
+            finally:
+                try:
+                    await lock.release()
+                except LockError:
+                    # Загрузка шла дольше lock_timeout, блокировка уже истекла.
+                    pass
+
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.poll_interval)
+
+            value = await cached()
+            if value:
+                return value
+            if not await lock.locked():
+                break
+
+        return await load()
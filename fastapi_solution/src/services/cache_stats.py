@@ -0,0 +1,32 @@
+import asyncio
+import logging
+from typing import Protocol
+
+from .cache import LocalCache
+
+log = logging.getLogger('main')
+
+
+class LocallyCached(Protocol):
+    index: str
+    local_cache: LocalCache
+
+
+def log_local_cache_stats(services: list[LocallyCached]) -> None:
+    for service in services:
+        stats = service.local_cache.stats()
+        log.info(
+            f'Local cache of {service.index}: {stats["size"]} items, {stats["hits"]} hits, '
+            f'{stats["misses"]} misses, hit ratio {stats["hit_ratio"]:.1%}'
+        )
+
+
+async def report_local_cache_stats(services: list[LocallyCached], interval: float) -> None:
+    """
+    Периодически пишет в лог размер и долю попаданий кеша в памяти процесса (LocalCache)
+    каждого сервиса: по ним подбираются CACHE_LOCAL_SIZE и CACHE_LOCAL_TTL.
+    Счётчики накопительные, с момента старта воркера.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        log_local_cache_stats(services)
@@ -1,18 +1,20 @@
 import logging
-from datetime import datetime as dt
-from functools import lru_cache
+from datetime import date
+from functools import lru_cache, partial
 from typing import Optional
 
 from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends
-from pydantic import ValidationError
 from redis.asyncio import Redis
 
-from ..db.elastic import get_elastic
+from ..core import config
+from ..db.elastic import MAX_RESULT_WINDOW, get_elastic
 from ..db.redis import get_redis
-from ..models.models import FilmRequest
+from ..models.models import FilmRequest, FilmResponse, FilmsPage
+from .cache import CACHE_EXPIRE_IN_SECONDS, LocalCache, PageIndex, SingleFlight
 
-FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5  # 5 минут
+# Поля документа, нужные для списка фильмов: остальное из Elasticsearch не передаётся.
+FILMS_PAGE_FIELDS = list(FilmResponse.__fields__)
 
 
 class FilmService:
@@ -20,29 +22,64 @@ class FilmService:
         self.redis = redis
         self.elastic = elastic
         self.index = 'movies'
+        self.single_flight = SingleFlight(redis if config.CACHE_REDIS_LOCK else None, config.CACHE_LOCK_TIMEOUT)
+        self.local_cache = LocalCache(config.CACHE_LOCAL_SIZE, config.CACHE_LOCAL_TTL)
+        self.pages = PageIndex(redis, 'films:pages')
         self.log = logging.getLogger('main')
 
     async def get_by_id(self, film_id: str) -> Optional[FilmRequest]:
+        film = self.local_cache.get(film_id)
+        if film:
+            return film
+
+        # Инвалидация во время обращения к Redis и Elasticsearch отменяет запись в кеши.
+        generation = self.local_cache.generation(film_id)
         film = await self._film_from_cache(film_id)
 
         if not film:
-            film = await self._get_from_elastic_by_id(film_id)
-            if not film:
-                return None
-            await self._put_film_to_cache(film)
-
+            film = await self.single_flight.do(
+                f'film:{film_id}',
+                partial(self._load_film, film_id, generation),
+                partial(self._film_from_cache, film_id),
+            )
+
+        if film:
+            self.local_cache.put(film_id, film, generation)
         return film
 
-    async def get_all_films(self) -> Optional[list[FilmRequest]]:
-        films = await self._all_films_from_cache()
-
-        if not films:
-            films = await self._get_from_elastic_all_films()
-            if not films:
-                return None
-            await self._put_all_films_to_cache(films)
+    async def _load_film(self, film_id: str, generation: int) -> Optional[FilmRequest]:
+        film = await self._get_from_elastic_by_id(film_id)
+        if film and generation == self.local_cache.generation(film_id):
+            await self._put_film_to_cache(film)
+        return film
 
-        return films
+    async def get_films_page(
+            self,
+            page: int,
+            size: int,
+            rating: Optional[float] = None,
+            genre: Optional[str] = None,
+            creation_date: Optional[date] = None,
+            sort_by: Optional[str] = None,
+    ) -> Optional[FilmsPage]:
+        """
+        Страница списка фильмов: фильтрация, сортировка и пагинация выполняются
+        в Elasticsearch, из индекса читается только одна страница документов.
+        """
+        key = f'films:page:{rating}:{genre}:{creation_date}:{sort_by}:{page}:{size}'
+        films_page = await self._films_page_from_cache(key)
+
+        if not films_page:
+            load = partial(self._load_films_page, key, page, size, rating, genre, creation_date, sort_by)
+            films_page = await self.single_flight.do(key, load, partial(self._films_page_from_cache, key))
+
+        return films_page
+
+    async def _load_films_page(self, key: str, *args) -> Optional[FilmsPage]:
+        films_page = await self._get_from_elastic_films_page(*args)
+        if films_page:
+            await self._put_films_page_to_cache(key, films_page)
+        return films_page
 
     async def get_by_search(self, search_text) -> Optional[list[FilmRequest]]:
         films = await self._get_from_elastic_by_search(search_text)
@@ -59,31 +96,57 @@ class FilmService:
             return None
         return FilmRequest(**doc['_source'])
 
-    async def _get_from_elastic_all_films(self) -> Optional[list[FilmRequest]]:
+    async def _get_from_elastic_films_page(
+            self,
+            page: int,
+            size: int,
+            rating: Optional[float],
+            genre: Optional[str],
+            creation_date: Optional[date],
+            sort_by: Optional[str],
+    ) -> Optional[FilmsPage]:
+        offset = (page - 1) * size
+        # За пределами окна документов не запрашиваем, но общее число совпадений всё равно нужно.
+        if offset + size > MAX_RESULT_WINDOW:
+            offset, size = 0, 0
+
+        # id - последний ключ сортировки: порядок фильмов с равным рейтингом не меняется между страницами.
+        sort = [{'id': 'asc'}]
+        if sort_by is not None:
+            sort.insert(0, {sort_by: {'order': 'desc', 'missing': '_last'}})
+
         try:
-            docs = await self.elastic.search(index=self.index, size=1000, query={"match_all": {}})
-            movies_list = [
-                FilmRequest(
-                    id=dict_['_source']['id'],
-                    title=dict_['_source']['title'],
-                    imdb_rating=dict_['_source']['imdb_rating'] if dict_['_source']['imdb_rating'] is not None else 0,
-                    creation_date=dict_['_source']['creation_date'] if dict_['_source']['creation_date'] is not None
-                    else str(dt.min),
-                    genres=dict_['_source']['genres'],
-                    description=dict_['_source']['description'],
-                    file_path=dict_['_source']['file_path'],
-                    directors_names=dict_['_source']['directors_names'],
-                    actors_names=dict_['_source']['actors_names'],
-                    writers_names=dict_['_source']['writers_names'],
-                    directors=dict_['_source']['directors'],
-                    actors=dict_['_source']['actors'],
-                    writers=dict_['_source']['writers'],
-                )
-                for dict_ in docs['hits']['hits']
-            ]
+            docs = await self.elastic.search(
+                index=self.index,
+                query=self._films_query(rating, genre, creation_date),
+                sort=sort,
+                from_=offset,
+                size=size,
+                source_includes=FILMS_PAGE_FIELDS,
+                track_total_hits=True,
+            )
         except NotFoundError:
             return None
-        return movies_list
+
+        return FilmsPage(
+            total=docs['hits']['total']['value'],
+            items=[FilmResponse(**hit['_source']) for hit in docs['hits']['hits']],
+        )
+
+    @staticmethod
+    def _films_query(rating: Optional[float], genre: Optional[str], creation_date: Optional[date]) -> dict:
+        filters = []
+
+        if rating is not None:
+            filters.append({'range': {'imdb_rating': {'gte': rating}}})
+        if genre is not None:
+            filters.append({'nested': {'path': 'genres', 'query': {'term': {'genres.name.raw': genre}}}})
+        if creation_date is not None:
+            filters.append({'range': {'creation_date': {'gte': creation_date.isoformat()}}})
+
+        if not filters:
+            return {'match_all': {}}
+        return {'bool': {'filter': filters}}
 
     async def _get_from_elastic_by_search(self, search_text) -> Optional[list[FilmRequest]]:
         try:
@@ -110,30 +173,27 @@ class FilmService:
         self.log.info(f'redis: get {film.id} film')
         return film
 
-    async def _all_films_from_cache(self):
-        keys = await self.redis.keys(f"film:*")
-        if not keys:
+    async def _films_page_from_cache(self, key: str) -> Optional[FilmsPage]:
+        data = await self.redis.get(key)
+        if not data:
             return None
 
-        data = await self.redis.mget(keys)
-
-        films_list = []
-        for item in data:
-            if item is not None:
-                try:
-                    film = FilmRequest.parse_raw(item)
-                    films_list.append(film)
-                except ValidationError as e:
-                    self.log.error(f'Ошибка при парсинге фильмов из данных: {item}. Ошибка: {e}')
-        self.log.info(f'redis: get {len(films_list)} films')
-        return films_list
+        films_page = FilmsPage.parse_raw(data)
+        self.log.info(f'redis: get {len(films_page.items)} films of {films_page.total}')
+        return films_page
 
     async def _put_film_to_cache(self, film: FilmRequest):
-        await self.redis.set(f"film:{film.id}", film.json(), FILM_CACHE_EXPIRE_IN_SECONDS)
+        await self.redis.set(f"film:{film.id}", film.json(), CACHE_EXPIRE_IN_SECONDS)
+
+    async def _put_films_page_to_cache(self, key: str, films_page: FilmsPage):
+        await self.pages.put(key, films_page.json())
 
-    async def _put_all_films_to_cache(self, films):
-        data = {f"film:{film.id}": film.json() for film in films}
-        await self.redis.mset(data)
+    async def invalidate(self, films_id: list[str]) -> None:
+        """Удалить изменённые фильмы из кеша в памяти и в Redis вместе со страницами списка фильмов."""
+        for film_id in films_id:
+            self.local_cache.delete(film_id)
+        await self.redis.delete(*(f"film:{film_id}" for film_id in films_id))
+        await self.pages.clear()
 
 
 @lru_cache()
@@ -1,129 +1,94 @@
 import logging
-from functools import lru_cache
+from functools import lru_cache, partial
 from typing import Optional
 
 from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends
-from pydantic import ValidationError
 from redis.asyncio import Redis
 
+from ..core import config
 from ..db.elastic import get_elastic
 from ..db.redis import get_redis
 from ..models.models import Genre
+from .cache import CACHE_EXPIRE_IN_SECONDS, ListCache, LocalCache, SingleFlight
 
-FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5
-
-get_genres_query = {
-    "size": 0,
-    "aggs": {
-        "genres": {
-            "nested": {
-                "path": "genres"
-            },
-            "aggs": {
-                "unique_genres": {
-                    "terms": {
-                        "field": "genres.id",
-                        "size": 10000
-                    },
-                    "aggs": {
-                        "genre_details": {
-                            "top_hits": {
-                                "_source": {
-                                    "includes": ["genres.id", "genres.name", "genres.description"]
-                                },
-                                "size": 1
-                            }
-                        }
-                    }
-                }
-            }
-        }
-    }
-}
+# Жанров единицы и десятки, весь список помещается в один ответ.
+GENRES_LIMIT = 1000
 
 
 class GenreService:
     def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
         self.redis = redis
         self.elastic = elastic
-        self.index = 'movies'
+        # Индекс жанров ведёт ETL: документ на жанр вместе с числом фильмов.
+        self.index = 'genres'
+        self.list_cache = ListCache(redis, 'genres:list', Genre)
+        self.single_flight = SingleFlight(redis if config.CACHE_REDIS_LOCK else None, config.CACHE_LOCK_TIMEOUT)
+        self.local_cache = LocalCache(config.CACHE_LOCAL_SIZE, config.CACHE_LOCAL_TTL)
         self.log = logging.getLogger('main')
 
     async def get_by_id(self, genre_id: str) -> Optional[Genre]:
+        genre = self.local_cache.get(genre_id)
+        if genre:
+            return genre
+
+        # Инвалидация во время обращения к Redis и Elasticsearch отменяет запись в кеши.
+        generation = self.local_cache.generation(genre_id)
         genre = await self._genre_from_cache(genre_id)
 
         if not genre:
-            genre = await self._get_from_elastic_by_id(genre_id)
-            if not genre:
-                return None
-            await self._put_genre_to_cache(genre)
+            genre = await self.single_flight.do(
+                f'genre:{genre_id}',
+                partial(self._load_genre, genre_id, generation),
+                partial(self._genre_from_cache, genre_id),
+            )
+
+        if genre:
+            self.local_cache.put(genre_id, genre, generation)
+        return genre
 
+    async def _load_genre(self, genre_id: str, generation: int) -> Optional[Genre]:
+        genre = await self._get_from_elastic_by_id(genre_id)
+        if genre and generation == self.local_cache.generation(genre_id):
+            await self._put_genre_to_cache(genre)
         return genre
 
-    async def get_all_genres(self) -> Optional[list[Genre]]:
-        genres = await self._all_genres_from_cache()
+    async def get_genres_page(self, page: int, size: int) -> Optional[tuple[list[Genre], int]]:
+        """Страница жанров и их общее число; список жанров кешируется целиком, страница читается из него."""
+        offset = (page - 1) * size
+        genres_page = await self.list_cache.get_page(offset, size)
 
-        if not genres:
-            genres = await self._get_from_elastic_all_genres()
-            if not genres:
-                return None
-            await self._put_all_genres_to_cache(genres)
+        if not genres_page:
+            genres_page = await self.single_flight.do(
+                f'{self.list_cache.key}:{offset}:{size}',
+                partial(self._load_genres_page, offset, size),
+                partial(self.list_cache.get_page, offset, size),
+            )
+
+        return genres_page
 
-        return genres
+    async def _load_genres_page(self, offset: int, size: int) -> Optional[tuple[list[Genre], int]]:
+        genres = await self._get_from_elastic_all_genres()
+        if not genres:
+            return None
+        await self.list_cache.put(genres)
+        return genres[offset:offset + size], len(genres)
 
     async def _get_from_elastic_by_id(self, genre_id: str) -> Optional[Genre]:
         try:
-            get_genre_by_id_query = {
-                "query": {
-                    "nested": {
-                        "path": "genres",
-                        "query": {
-                            "term": {
-                                "genres.id": genre_id
-                            }
-                        }
-                    }
-                }
-            }
-
-            docs = await self.elastic.search(index=self.index, body=get_genre_by_id_query)
-
-            if docs['hits']['total']['value'] > 0:
-                for hit in docs['hits']['hits']:
-                    for genre in hit['_source'].get('genres', []):
-                        if genre['id'] == genre_id:
-                            return Genre(
-                                id=genre['id'],
-                                name=genre['name'],
-                                description=genre.get('description')
-                            )
-
+            doc = await self.elastic.get(index=self.index, id=genre_id)
         except NotFoundError:
             return None
-        return None
+        return Genre(**doc['_source'])
 
     async def _get_from_elastic_all_genres(self) -> Optional[list[Genre]]:
         try:
-            docs = await self.elastic.search(index=self.index, body=get_genres_query)
-
-            genres_list = []
-
-            buckets = docs['aggregations']['genres']['unique_genres']['buckets']
-            for bucket in buckets:
-                if bucket['doc_count'] > 0:
-                    genre_hits = bucket['genre_details']['hits']['hits']
-                    if genre_hits:
-                        genre_data = genre_hits[0]['_source']
-                        genre = Genre(
-                            id=genre_data['id'],
-                            name=genre_data['name'],
-                            description=genre_data['description']
-                        )
-                        genres_list.append(genre)
+            docs = await self.elastic.search(
+                index=self.index, size=GENRES_LIMIT, sort=[{'name.raw': 'asc'}], query={'match_all': {}}
+            )
         except NotFoundError:
             return None
-        return genres_list
+        return [Genre(**hit['_source']) for hit in docs['hits']['hits']]
 
     async def _genre_from_cache(self, genre_id: str) -> Optional[Genre]:
         data = await self.redis.get(f"genre:{genre_id}")
@@ -134,31 +99,15 @@ class GenreService:
         genre = Genre.parse_raw(data)
         return genre
 
-    async def _all_genres_from_cache(self):
-        keys = await self.redis.keys(f"genre:*")
-        if not keys:
-            return None
-
-        data = await self.redis.mget(keys)
-
-        genres = []
-        for item in data:
-            if item is not None:
-                try:
-                    genre = Genre.parse_raw(item)
-                    genres.append(genre)
-                except ValidationError as e:
-                    self.log.error(f'Ошибка при парсинге жанра из данных: {item}. Ошибка: {e}')
-
-        self.log.info(f'redis: get {len(genres)} genres')
-        return genres if genres else None
-
     async def _put_genre_to_cache(self, genre: Genre):
-        await self.redis.set(f"genre:{genre.id}", genre.json(), FILM_CACHE_EXPIRE_IN_SECONDS)
-
-    async def _put_all_genres_to_cache(self, genres: list[Genre]):
-        data = {f"genre:{genre.id}": genre.json() for genre in genres}
-        await self.redis.mset(data)
+        await self.redis.set(f"genre:{genre.id}", genre.json(), CACHE_EXPIRE_IN_SECONDS)
+
+    async def invalidate(self, genres_id: list[str]) -> None:
+        """Удалить изменённые жанры из кеша в памяти и в Redis вместе со списком жанров."""
+        for genre_id in genres_id:
+            self.local_cache.delete(genre_id)
+        await self.redis.delete(*(f"genre:{genre_id}" for genre_id in genres_id))
+        await self.list_cache.clear()
 
 
 @lru_cache()
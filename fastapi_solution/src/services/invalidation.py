@@ -0,0 +1,55 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Protocol
+
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+log = logging.getLogger('main')
+
+# Пауза перед повторной подпиской после обрыва соединения с Redis.
+RESUBSCRIBE_DELAY = 1
+
+
+class Invalidated(Protocol):
+    index: str
+
+    def invalidate(self, ids: list[str]) -> Awaitable[None]:
+        ...
+
+
+async def listen_invalidations(redis: Redis, channel: str, services: list[Invalidated]) -> None:
+    """
+    Подписка воркера на события инвалидации, которые публикует ETL (ETL_PUBLISH_INVALIDATIONS).
+
+    Сообщение {"index": алиас, "ids": [...]} удаляет документы из кеша в памяти
+    и из Redis сервиса с этим индексом вместе с кешированными страницами списков.
+    Pub/sub не хранит сообщения: пропущенные за время обрыва соединения записи
+    истекут по сроку жизни (CACHE_TTL, CACHE_LOCAL_TTL).
+    """
+    services_by_index = {service.index: service for service in services}
+
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(channel)
+                async for message in pubsub.listen():
+                    if message['type'] == 'message':
+                        await _invalidate(services_by_index, message['data'])
+        except RedisError as err:
+            log.warning(f'Cache invalidation subscription failed: {err!r}')
+            await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+
+async def _invalidate(services_by_index: dict[str, Invalidated], data: bytes) -> None:
+    try:
+        event = json.loads(data)
+        service = services_by_index[event['index']]
+        ids = [str(doc_id) for doc_id in event['ids']]
+    except (ValueError, KeyError, TypeError):
+        log.warning(f'Malformed cache invalidation message: {data!r}')
+        return
+
+    if ids:
+        await service.invalidate(ids)
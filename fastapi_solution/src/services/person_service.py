@@ -1,67 +1,101 @@
 import logging
-from functools import lru_cache
+from functools import lru_cache, partial
 from typing import Optional
 
 from elasticsearch import AsyncElasticsearch, NotFoundError
 from fastapi import Depends, HTTPException
 from redis.asyncio import Redis
 
-from ..db.elastic import get_elastic
+from ..core import config
+from ..db.elastic import MAX_RESULT_WINDOW, get_elastic
 from ..db.redis import get_redis
-from ..models.models import Person
-
-FILM_CACHE_EXPIRE_IN_SECONDS = 60 * 5
+from ..models.models import Person, PersonsPage
+from .cache import CACHE_EXPIRE_IN_SECONDS, LocalCache, PageIndex, SingleFlight
 
 
 class PersonService:
     def __init__(self, redis: Redis, elastic: AsyncElasticsearch):
         self.redis = redis
         self.elastic = elastic
-        self.index = 'movies'
+        self.index = 'persons'
+        self.single_flight = SingleFlight(redis if config.CACHE_REDIS_LOCK else None, config.CACHE_LOCK_TIMEOUT)
+        self.local_cache = LocalCache(config.CACHE_LOCAL_SIZE, config.CACHE_LOCAL_TTL)
+        self.pages = PageIndex(redis, 'persons:pages')
         self.log = logging.getLogger('main')
 
     async def get_by_id(self, person_id: str) -> Optional[Person]:
+        person = self.local_cache.get(person_id)
+        if person:
+            return person
+
+        # Инвалидация во время обращения к Redis и Elasticsearch отменяет запись в кеши.
+        generation = self.local_cache.generation(person_id)
         person = await self._person_from_cache(person_id)
 
         if not person:
-            person = await self._get_from_elastic_by_id(person_id)
-            if not person:
-                return None
-            await self._put_person_to_cache(person)
+            person = await self.single_flight.do(
+                f'person:{person_id}',
+                partial(self._load_person, person_id, generation),
+                partial(self._person_from_cache, person_id),
+            )
+
+        if person:
+            self.local_cache.put(person_id, person, generation)
+        return person
 
+    async def _load_person(self, person_id: str, generation: int) -> Optional[Person]:
+        person = await self._get_from_elastic_by_id(person_id)
+        if person and generation == self.local_cache.generation(person_id):
+            await self._put_person_to_cache(person)
         return person
 
-    async def get_all_persons(self) -> Optional[list[Person]]:
-        persons = await self._all_persons_from_cache()
+    async def get_persons_page(self, page: int, size: int, role: Optional[str] = None) -> Optional[PersonsPage]:
+        """Страница персон, при необходимости только с ролью role; фильтр и пагинация - в Elasticsearch."""
+        key = f'persons:page:{role}:{page}:{size}'
+        persons_page = await self._persons_page_from_cache(key)
+
+        if not persons_page:
+            load = partial(self._load_persons_page, key, page, size, role)
+            persons_page = await self.single_flight.do(key, load, partial(self._persons_page_from_cache, key))
 
-        if not persons:
-            persons = await self._get_from_elastic_all_persons()
-            if not persons:
-                return None
-            await self._put_all_persons_to_cache(persons)
+        return persons_page
 
-        return persons
+    async def _load_persons_page(self, key: str, page: int, size: int, role: Optional[str]) -> Optional[PersonsPage]:
+        persons_page = await self._get_from_elastic_persons_page(page, size, role)
+        if persons_page:
+            await self._put_persons_page_to_cache(key, persons_page)
+        return persons_page
 
     async def _get_from_elastic_by_id(self, person_id: str) -> Optional[Person]:
         try:
-            response = await self.elastic.get(index='persons', id=person_id)
+            response = await self.elastic.get(index=self.index, id=person_id)
             return Person(**response["_source"])
         except Exception as e:
             print(f"Ошибка при поиске по ID: {e}")
 
-    async def _get_from_elastic_all_persons(self) -> Optional[list[Person]]:
-        try:
-            response = await self.elastic.search(index="persons", body={
-                "query": {
-                    "match_all": {}
-                }
-            })
-            # Возвращаем список документов
-            return [Person(**hit["_source"]) for hit in response['hits']['hits']]
+    async def _get_from_elastic_persons_page(self, page: int, size: int, role: Optional[str]) -> Optional[PersonsPage]:
+        offset = (page - 1) * size
+        if offset + size > MAX_RESULT_WINDOW:
+            offset, size = 0, 0
 
+        query = {'match_all': {}}
+        if role is not None:
+            query = {'nested': {'path': 'films', 'query': {'match': {'films.roles': role}}}}
+
+        try:
+            response = await self.elastic.search(
+                index=self.index, query=query, sort=[{'id': 'asc'}], from_=offset, size=size, track_total_hits=True
+            )
+        except NotFoundError:
+            return None
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Ошибка при получении всех персонажей: {str(e)}")
 
+        return PersonsPage(
+            total=response['hits']['total']['value'],
+            items=[Person(**hit["_source"]) for hit in response['hits']['hits']],
+        )
+
     async def _person_from_cache(self, person_id: str) -> Optional[Person]:
         data = await self.redis.get(f"person:{person_id}")
         self.log.info(f'redis: {data}')
@@ -71,22 +105,27 @@ class PersonService:
         person = Person.parse_raw(data)
         return person
 
-    async def _all_persons_from_cache(self):
-        keys = await self.redis.keys('person:*')
-        if not keys:
+    async def _persons_page_from_cache(self, key: str) -> Optional[PersonsPage]:
+        data = await self.redis.get(key)
+        if not data:
             return None
-        data = await self.redis.mget(keys)
 
-        persons = [Person.parse_raw(item) for item in data if item is not None]
-        self.log.info(f'redis: get {len(persons)} persons')
-        return persons if persons else None
+        persons_page = PersonsPage.parse_raw(data)
+        self.log.info(f'redis: get {len(persons_page.items)} persons of {persons_page.total}')
+        return persons_page
 
     async def _put_person_to_cache(self, person: Person):
-            await self.redis.set(f"person:{person.id}", person.json(), FILM_CACHE_EXPIRE_IN_SECONDS)
+            await self.redis.set(f"person:{person.id}", person.json(), CACHE_EXPIRE_IN_SECONDS)
+
+    async def _put_persons_page_to_cache(self, key: str, persons_page: PersonsPage):
+        await self.pages.put(key, persons_page.json())
 
-    async def _put_all_persons_to_cache(self, persons: list[Person]):
-        data = {f"person:{person.id}": person.json() for person in persons}
-        await self.redis.mset(data)
+    async def invalidate(self, persons_id: list[str]) -> None:
+        """Удалить изменённых персон из кеша в памяти и в Redis вместе со страницами списка персон."""
+        for person_id in persons_id:
+            self.local_cache.delete(person_id)
+        await self.redis.delete(*(f"person:{person_id}" for person_id in persons_id))
+        await self.pages.clear()
 
 
 @lru_cache()
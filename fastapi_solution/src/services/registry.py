@@ -0,0 +1,21 @@
+from elasticsearch import AsyncElasticsearch
+from redis.asyncio import Redis
+
+from .film_service import FilmService, get_film_service
+from .genre_service import GenreService, get_genre_service
+from .person_service import PersonService, get_person_service
+
+
+def get_services(redis: Redis, elastic: AsyncElasticsearch) -> list[FilmService | GenreService | PersonService]:
+    """
+    Те же экземпляры сервисов, что получают обработчики через Depends.
+
+    get_*_service закешированы lru_cache, а FastAPI вызывает зависимости с именованными
+    аргументами: при вызове с позиционными ключ кеша другой и создаётся новый экземпляр
+    со своим кешем в памяти, который не видит ни один запрос.
+    """
+    return [
+        get_film_service(redis=redis, elastic=elastic),
+        get_genre_service(redis=redis, elastic=elastic),
+        get_person_service(redis=redis, elastic=elastic),
+    ]
@@ -0,0 +1,8 @@
+import os
+
+# Настройки сервиса читаются при импорте src.core.config: тестам внешние сервисы не нужны.
+for name, value in {
+    'PROJECT_NAME': 'movies', 'REDIS_HOST': 'localhost', 'REDIS_PORT': '6379',
+    'ELASTIC_HOST': 'localhost', 'ELASTIC_PORT': '9200',
+}.items():
+    os.environ.setdefault(name, value)
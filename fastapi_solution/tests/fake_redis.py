@@ -0,0 +1,46 @@
+"""Заменитель redis.asyncio.Redis для тестов сервисов без Redis."""
+
+
+class FakePipeline:
+    def __init__(self, redis: 'FakeRedis'):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return None
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args))
+
+    async def execute(self) -> list:
+        return [await getattr(self.redis, name)(*args) for name, args in self.commands]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, expire=None):
+        self.data[key] = value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def sadd(self, key, *members):
+        self.data.setdefault(key, set()).update(members)
+
+    async def smembers(self, key):
+        return set(self.data.get(key, ()))
+
+    async def expire(self, key, seconds):
+        return None
+
+    def pipeline(self, transaction: bool = True) -> FakePipeline:
+        return FakePipeline(self)
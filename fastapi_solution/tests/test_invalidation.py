@@ -0,0 +1,78 @@
+import asyncio
+import json
+import logging
+
+from fastapi_solution.src.services.cache_stats import log_local_cache_stats
+from fastapi_solution.src.services.film_service import get_film_service
+from fastapi_solution.src.services.invalidation import _invalidate
+from fastapi_solution.src.services.registry import get_services
+from fake_redis import FakeRedis
+
+
+def test_handlers_get_invalidated_instances():
+    redis, elastic = FakeRedis(), object()
+
+    services = get_services(redis, elastic)
+
+    # Так зависимость вызывает FastAPI: с именованными аргументами.
+    assert get_film_service(redis=redis, elastic=elastic) is services[0]
+
+
+def test_invalidation_evicts_film_served_to_handlers():
+    redis, elastic = FakeRedis(), object()
+    services = get_services(redis, elastic)
+    film_service = get_film_service(redis=redis, elastic=elastic)
+    film_service.local_cache.put('1', 'film')
+    redis.data['film:1'] = '{}'
+
+    message = json.dumps({'index': 'movies', 'ids': ['1']}).encode()
+    asyncio.run(_invalidate({service.index: service for service in services}, message))
+
+    assert film_service.local_cache.get('1') is None
+    assert 'film:1' not in redis.data
+
+
+class SlowElasticsearch:
+    """Elasticsearch, который отвечает после того, как тест инвалидирует фильм."""
+    def __init__(self):
+        self.requested = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def get(self, index, id):
+        self.requested.set()
+        await self.release.wait()
+        return {'_source': {
+            'id': id, 'title': 'Old title', 'imdb_rating': 8.0, 'creation_date': None, 'genres': [],
+            'description': None, 'file_path': None, 'directors_names': [], 'actors_names': [], 'writers_names': [],
+            'directors': [], 'actors': [], 'writers': [],
+        }}
+
+
+def test_film_invalidated_during_load_is_not_cached():
+    async def main():
+        redis, elastic = FakeRedis(), SlowElasticsearch()
+        service = get_film_service(redis=redis, elastic=elastic)
+
+        request = asyncio.create_task(service.get_by_id('1'))
+        await elastic.requested.wait()
+        await service.invalidate(['1'])
+        elastic.release.set()
+
+        assert (await request).title == 'Old title'
+        return service, redis
+
+    service, redis = asyncio.run(main())
+
+    assert service.local_cache.get('1') is None
+    assert 'film:1' not in redis.data
+
+
+def test_cache_stats_of_handler_instances_are_logged(caplog):
+    redis, elastic = FakeRedis(), object()
+    services = get_services(redis, elastic)
+    get_film_service(redis=redis, elastic=elastic).local_cache.get('1')
+
+    with caplog.at_level(logging.INFO, logger='main'):
+        log_local_cache_stats(services)
+
+    assert 'Local cache of movies: 0 items, 0 hits, 1 misses' in caplog.text
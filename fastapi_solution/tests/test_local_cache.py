@@ -0,0 +1,62 @@
+from fastapi_solution.src.services.cache import MIN_GENERATIONS, LocalCache
+
+
+def test_least_recently_read_item_is_evicted():
+    cache = LocalCache(max_size=2, ttl=60)
+    cache.put('a', 1)
+    cache.put('b', 2)
+
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+
+def test_expired_item_is_a_miss():
+    cache = LocalCache(max_size=2, ttl=0)
+    cache.put('a', 1)
+
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_zero_size_disables_cache():
+    cache = LocalCache(max_size=0, ttl=60)
+    cache.put('a', 1)
+
+    assert cache.get('a') is None
+
+
+def test_stats():
+    cache = LocalCache(max_size=2, ttl=60)
+    cache.put('a', 1)
+    cache.get('a')
+    cache.get('b')
+    cache.delete('a')
+
+    assert cache.stats() == {'size': 0, 'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
+
+
+def test_put_is_skipped_after_invalidation():
+    cache = LocalCache(max_size=2, ttl=60)
+    generation = cache.generation('a')
+
+    cache.delete('a')
+    cache.put('a', 'stale', generation)
+    assert cache.get('a') is None
+
+    cache.put('a', 'fresh', cache.generation('a'))
+    assert cache.get('a') == 'fresh'
+
+
+def test_evicted_generations_do_not_allow_stale_put():
+    cache = LocalCache(max_size=1, ttl=60)
+    generation = cache.generation('a')
+    cache.delete('a')
+
+    for i in range(MIN_GENERATIONS):
+        cache.delete(str(i))
+    cache.put('a', 'stale', generation)
+
+    assert cache.get('a') is None
@@ -0,0 +1,90 @@
+import asyncio
+
+from fastapi_solution.src.services.cache import SingleFlight
+
+
+class FakeLock:
+    """Блокировка {key}:lock, которую держит другой воркер."""
+    def __init__(self, held: bool):
+        self.held = held
+
+    async def acquire(self, blocking: bool = True) -> bool:
+        return not self.held
+
+    async def release(self) -> None:
+        self.held = False
+
+    async def locked(self) -> bool:
+        return self.held
+
+
+class FakeRedis:
+    def __init__(self, held: bool = False):
+        self.held = held
+
+    def lock(self, name: str, timeout: float) -> FakeLock:
+        return FakeLock(self.held)
+
+
+def test_concurrent_misses_share_one_load():
+    calls = []
+
+    async def load() -> str:
+        calls.append('load')
+        await asyncio.sleep(0.01)
+        return 'film'
+
+    async def main() -> list:
+        flight = SingleFlight()
+        return await asyncio.gather(*(flight.do('film:1', load) for _ in range(5)))
+
+    assert asyncio.run(main()) == ['film'] * 5
+    assert calls == ['load']
+
+
+def test_cancelled_waiter_does_not_cancel_load():
+    async def load() -> str:
+        await asyncio.sleep(0.01)
+        return 'film'
+
+    async def main() -> str:
+        flight = SingleFlight()
+        first = asyncio.create_task(flight.do('film:1', load))
+        second = asyncio.create_task(flight.do('film:1', load))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 'film'
+
+
+def test_waits_for_value_loaded_by_other_worker():
+    calls = []
+
+    async def load() -> str:
+        calls.append('load')
+        return 'own'
+
+    async def main() -> str:
+        polls = iter([None, 'cached'])
+
+        async def cached():
+            return next(polls)
+
+        flight = SingleFlight(FakeRedis(held=True), lock_timeout=1, poll_interval=0)
+        return await flight.do('film:1', load, cached)
+
+    assert asyncio.run(main()) == 'cached'
+    assert calls == []
+
+
+def test_lock_owner_loads_value():
+    async def load() -> str:
+        return 'own'
+
+    async def cached():
+        return None
+
+    flight = SingleFlight(FakeRedis(held=False), lock_timeout=1, poll_interval=0)
+
+    assert asyncio.run(flight.do('film:1', load, cached)) == 'own'